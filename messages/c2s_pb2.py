@@ -18,7 +18,7 @@ _sym_db = _symbol_database.Default()
 DESCRIPTOR = _descriptor.FileDescriptor(
   name='c2s.proto',
   package='de.velcommuta.denul.networking.protobuf.c2s',
-  serialized_pb=_b('\n\tc2s.proto\x12+de.velcommuta.denul.networking.protobuf.c2s\"#\n\x05Store\x12\x0b\n\x03key\x18\x01 \x02(\x0c\x12\r\n\x05value\x18\x02 \x02(\x0c\"\xdb\x01\n\nStoreReply\x12V\n\x06opcode\x18\x01 \x02(\x0e\x32\x46.de.velcommuta.denul.networking.protobuf.c2s.StoreReply.StoreReplyCode\x12\x0b\n\x03key\x18\x02 \x02(\x0c\"h\n\x0eStoreReplyCode\x12\x0c\n\x08STORE_OK\x10\x00\x12\x18\n\x14STORE_FAIL_KEY_TAKEN\x10\x01\x12\x16\n\x12STORE_FAIL_KEY_FMT\x10\x02\x12\x16\n\x12STORE_FAIL_UNKNOWN\x10\x03\"\x12\n\x03Get\x12\x0b\n\x03key\x18\x01 \x02(\x0c\"\xdc\x01\n\x08GetReply\x12R\n\x06opcode\x18\x01 \x02(\x0e\x32\x42.de.velcommuta.denul.networking.protobuf.c2s.GetReply.GetReplyCode\x12\x0b\n\x03key\x18\x02 \x02(\x0c\x12\r\n\x05value\x18\x03 \x01(\x0c\"`\n\x0cGetReplyCode\x12\n\n\x06GET_OK\x10\x00\x12\x14\n\x10GET_FAIL_KEY_FMT\x10\x01\x12\x18\n\x14GET_FAIL_UNKNOWN_KEY\x10\x02\x12\x14\n\x10GET_FAIL_UNKNOWN\x10\x03\"#\n\x06\x44\x65lete\x12\x0b\n\x03key\x18\x01 \x02(\x0c\x12\x0c\n\x04\x61uth\x18\x02 \x02(\x0c\"\xfa\x01\n\x0b\x44\x65leteReply\x12X\n\x06opcode\x18\x01 \x02(\x0e\x32H.de.velcommuta.denul.networking.protobuf.c2s.DeleteReply.DeleteReplyCode\x12\x0b\n\x03key\x18\x02 \x02(\x0c\"\x83\x01\n\x0f\x44\x65leteReplyCode\x12\r\n\tDELETE_OK\x10\x00\x12\x14\n\x10\x44\x45LETE_FAIL_AUTH\x10\x01\x12\x19\n\x15\x44\x45LETE_FAIL_NOT_FOUND\x10\x02\x12\x17\n\x13\x44\x45LETE_FAIL_KEY_FMT\x10\x03\x12\x17\n\x13\x44\x45LETE_FAIL_UNKNOWN\x10\x04\"0\n\x0b\x43lientHello\x12\x13\n\x0b\x63lientProto\x18\x01 \x02(\t\x12\x0c\n\x04\x64\x61ta\x18\x02 \x01(\x0c\"\xe2\x01\n\x0bServerHello\x12]\n\x06opcode\x18\x01 \x02(\x0e\x32M.de.velcommuta.denul.networking.protobuf.c2s.ServerHello.ClientHelloReplyCode\x12\x13\n\x0bserverProto\x18\x02 \x02(\t\x12\x0c\n\x04\x64\x61ta\x18\x03 \x02(\x0c\"Q\n\x14\x43lientHelloReplyCode\x12\x13\n\x0f\x43LIENT_HELLO_OK\x10\x00\x12$\n CLIENT_HELLO_PROTO_NOT_SUPPORTED\x10\x01')
+  serialized_pb=_b('\n\tc2s.proto\x12+de.velcommuta.denul.networking.protobuf.c2s\"#\n\x05Store\x12\x0b\n\x03key\x18\x01 \x02(\x0c\x12\r\n\x05value\x18\x02 \x02(\x0c\"\xdb\x01\n\nStoreReply\x12V\n\x06opcode\x18\x01 \x02(\x0e\x32\x46.de.velcommuta.denul.networking.protobuf.c2s.StoreReply.StoreReplyCode\x12\x0b\n\x03key\x18\x02 \x02(\x0c\"h\n\x0eStoreReplyCode\x12\x0c\n\x08STORE_OK\x10\x00\x12\x18\n\x14STORE_FAIL_KEY_TAKEN\x10\x01\x12\x16\n\x12STORE_FAIL_KEY_FMT\x10\x02\x12\x16\n\x12STORE_FAIL_UNKNOWN\x10\x03\"\x12\n\x03Get\x12\x0b\n\x03key\x18\x01 \x02(\x0c\"\xdc\x01\n\x08GetReply\x12R\n\x06opcode\x18\x01 \x02(\x0e\x32\x42.de.velcommuta.denul.networking.protobuf.c2s.GetReply.GetReplyCode\x12\x0b\n\x03key\x18\x02 \x02(\x0c\x12\r\n\x05value\x18\x03 \x01(\x0c\"`\n\x0cGetReplyCode\x12\n\n\x06GET_OK\x10\x00\x12\x14\n\x10GET_FAIL_KEY_FMT\x10\x01\x12\x18\n\x14GET_FAIL_UNKNOWN_KEY\x10\x02\x12\x14\n\x10GET_FAIL_UNKNOWN\x10\x03\"#\n\x06\x44\x65lete\x12\x0b\n\x03key\x18\x01 \x02(\x0c\x12\x0c\n\x04\x61uth\x18\x02 \x02(\x0c\"\xfa\x01\n\x0b\x44\x65leteReply\x12X\n\x06opcode\x18\x01 \x02(\x0e\x32H.de.velcommuta.denul.networking.protobuf.c2s.DeleteReply.DeleteReplyCode\x12\x0b\n\x03key\x18\x02 \x02(\x0c\"\x83\x01\n\x0f\x44\x65leteReplyCode\x12\r\n\tDELETE_OK\x10\x00\x12\x14\n\x10\x44\x45LETE_FAIL_AUTH\x10\x01\x12\x19\n\x15\x44\x45LETE_FAIL_NOT_FOUND\x10\x02\x12\x17\n\x13\x44\x45LETE_FAIL_KEY_FMT\x10\x03\x12\x17\n\x13\x44\x45LETE_FAIL_UNKNOWN\x10\x04\"0\n\x0b\x43lientHello\x12\x13\n\x0b\x63lientProto\x18\x01 \x02(\t\x12\x0c\n\x04\x64\x61ta\x18\x02 \x01(\x0c\"\xe2\x01\n\x0bServerHello\x12]\n\x06opcode\x18\x01 \x02(\x0e\x32M.de.velcommuta.denul.networking.protobuf.c2s.ServerHello.ClientHelloReplyCode\x12\x13\n\x0bserverProto\x18\x02 \x02(\t\x12\x0c\n\x04\x64\x61ta\x18\x03 \x02(\x0c\"Q\n\x14\x43lientHelloReplyCode\x12\x13\n\x0f\x43LIENT_HELLO_OK\x10\x00\x12$\n CLIENT_HELLO_PROTO_NOT_SUPPORTED\x10\x01\"O\n\nMultiStore\x12\x41\n\x05store\x18\x01 \x03(\x0b\x32\x32.de.velcommuta.denul.networking.protobuf.c2s.Store\"Y\n\x0fMultiStoreReply\x12\x46\n\x05reply\x18\x01 \x03(\x0b\x32\x37.de.velcommuta.denul.networking.protobuf.c2s.StoreReply\"I\n\x08MultiGet\x12=\n\x03get\x18\x01 \x03(\x0b\x32\x30.de.velcommuta.denul.networking.protobuf.c2s.Get\"U\n\rMultiGetReply\x12\x44\n\x05reply\x18\x01 \x03(\x0b\x32\x35.de.velcommuta.denul.networking.protobuf.c2s.GetReply\"R\n\x0bMultiDelete\x12\x43\n\x06\x64\x65lete\x18\x01 \x03(\x0b\x32\x33.de.velcommuta.denul.networking.protobuf.c2s.Delete\"[\n\x10MultiDeleteReply\x12G\n\x05reply\x18\x01 \x03(\x0b\x32\x38.de.velcommuta.denul.networking.protobuf.c2s.DeleteReply')
 )
 _sym_db.RegisterFileDescriptor(DESCRIPTOR)
 
@@ -447,6 +447,186 @@ _SERVERHELLO = _descriptor.Descriptor(
   serialized_end=1127,
 )
 
+
+_MULTISTORE = _descriptor.Descriptor(
+  name='MultiStore',
+  full_name='de.velcommuta.denul.networking.protobuf.c2s.MultiStore',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='store', full_name='de.velcommuta.denul.networking.protobuf.c2s.MultiStore.store', index=0,
+      number=1, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=1129,
+  serialized_end=1208,
+)
+
+
+_MULTISTOREREPLY = _descriptor.Descriptor(
+  name='MultiStoreReply',
+  full_name='de.velcommuta.denul.networking.protobuf.c2s.MultiStoreReply',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='reply', full_name='de.velcommuta.denul.networking.protobuf.c2s.MultiStoreReply.reply', index=0,
+      number=1, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=1210,
+  serialized_end=1299,
+)
+
+
+_MULTIGET = _descriptor.Descriptor(
+  name='MultiGet',
+  full_name='de.velcommuta.denul.networking.protobuf.c2s.MultiGet',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='get', full_name='de.velcommuta.denul.networking.protobuf.c2s.MultiGet.get', index=0,
+      number=1, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=1301,
+  serialized_end=1374,
+)
+
+
+_MULTIGETREPLY = _descriptor.Descriptor(
+  name='MultiGetReply',
+  full_name='de.velcommuta.denul.networking.protobuf.c2s.MultiGetReply',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='reply', full_name='de.velcommuta.denul.networking.protobuf.c2s.MultiGetReply.reply', index=0,
+      number=1, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=1376,
+  serialized_end=1461,
+)
+
+
+_MULTIDELETE = _descriptor.Descriptor(
+  name='MultiDelete',
+  full_name='de.velcommuta.denul.networking.protobuf.c2s.MultiDelete',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='delete', full_name='de.velcommuta.denul.networking.protobuf.c2s.MultiDelete.delete', index=0,
+      number=1, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=1463,
+  serialized_end=1545,
+)
+
+
+_MULTIDELETEREPLY = _descriptor.Descriptor(
+  name='MultiDeleteReply',
+  full_name='de.velcommuta.denul.networking.protobuf.c2s.MultiDeleteReply',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='reply', full_name='de.velcommuta.denul.networking.protobuf.c2s.MultiDeleteReply.reply', index=0,
+      number=1, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=1547,
+  serialized_end=1638,
+)
+
 _STOREREPLY.fields_by_name['opcode'].enum_type = _STOREREPLY_STOREREPLYCODE
 _STOREREPLY_STOREREPLYCODE.containing_type = _STOREREPLY
 _GETREPLY.fields_by_name['opcode'].enum_type = _GETREPLY_GETREPLYCODE
@@ -455,6 +635,12 @@ _DELETEREPLY.fields_by_name['opcode'].enum_type = _DELETEREPLY_DELETEREPLYCODE
 _DELETEREPLY_DELETEREPLYCODE.containing_type = _DELETEREPLY
 _SERVERHELLO.fields_by_name['opcode'].enum_type = _SERVERHELLO_CLIENTHELLOREPLYCODE
 _SERVERHELLO_CLIENTHELLOREPLYCODE.containing_type = _SERVERHELLO
+_MULTISTORE.fields_by_name['store'].message_type = _STORE
+_MULTISTOREREPLY.fields_by_name['reply'].message_type = _STOREREPLY
+_MULTIGET.fields_by_name['get'].message_type = _GET
+_MULTIGETREPLY.fields_by_name['reply'].message_type = _GETREPLY
+_MULTIDELETE.fields_by_name['delete'].message_type = _DELETE
+_MULTIDELETEREPLY.fields_by_name['reply'].message_type = _DELETEREPLY
 DESCRIPTOR.message_types_by_name['Store'] = _STORE
 DESCRIPTOR.message_types_by_name['StoreReply'] = _STOREREPLY
 DESCRIPTOR.message_types_by_name['Get'] = _GET
@@ -463,6 +649,12 @@ DESCRIPTOR.message_types_by_name['Delete'] = _DELETE
 DESCRIPTOR.message_types_by_name['DeleteReply'] = _DELETEREPLY
 DESCRIPTOR.message_types_by_name['ClientHello'] = _CLIENTHELLO
 DESCRIPTOR.message_types_by_name['ServerHello'] = _SERVERHELLO
+DESCRIPTOR.message_types_by_name['MultiStore'] = _MULTISTORE
+DESCRIPTOR.message_types_by_name['MultiStoreReply'] = _MULTISTOREREPLY
+DESCRIPTOR.message_types_by_name['MultiGet'] = _MULTIGET
+DESCRIPTOR.message_types_by_name['MultiGetReply'] = _MULTIGETREPLY
+DESCRIPTOR.message_types_by_name['MultiDelete'] = _MULTIDELETE
+DESCRIPTOR.message_types_by_name['MultiDeleteReply'] = _MULTIDELETEREPLY
 
 Store = _reflection.GeneratedProtocolMessageType('Store', (_message.Message,), dict(
   DESCRIPTOR = _STORE,
@@ -520,5 +712,47 @@ ServerHello = _reflection.GeneratedProtocolMessageType('ServerHello', (_message.
   ))
 _sym_db.RegisterMessage(ServerHello)
 
+MultiStore = _reflection.GeneratedProtocolMessageType('MultiStore', (_message.Message,), dict(
+  DESCRIPTOR = _MULTISTORE,
+  __module__ = 'c2s_pb2'
+  # @@protoc_insertion_point(class_scope:de.velcommuta.denul.networking.protobuf.c2s.MultiStore)
+  ))
+_sym_db.RegisterMessage(MultiStore)
+
+MultiStoreReply = _reflection.GeneratedProtocolMessageType('MultiStoreReply', (_message.Message,), dict(
+  DESCRIPTOR = _MULTISTOREREPLY,
+  __module__ = 'c2s_pb2'
+  # @@protoc_insertion_point(class_scope:de.velcommuta.denul.networking.protobuf.c2s.MultiStoreReply)
+  ))
+_sym_db.RegisterMessage(MultiStoreReply)
+
+MultiGet = _reflection.GeneratedProtocolMessageType('MultiGet', (_message.Message,), dict(
+  DESCRIPTOR = _MULTIGET,
+  __module__ = 'c2s_pb2'
+  # @@protoc_insertion_point(class_scope:de.velcommuta.denul.networking.protobuf.c2s.MultiGet)
+  ))
+_sym_db.RegisterMessage(MultiGet)
+
+MultiGetReply = _reflection.GeneratedProtocolMessageType('MultiGetReply', (_message.Message,), dict(
+  DESCRIPTOR = _MULTIGETREPLY,
+  __module__ = 'c2s_pb2'
+  # @@protoc_insertion_point(class_scope:de.velcommuta.denul.networking.protobuf.c2s.MultiGetReply)
+  ))
+_sym_db.RegisterMessage(MultiGetReply)
+
+MultiDelete = _reflection.GeneratedProtocolMessageType('MultiDelete', (_message.Message,), dict(
+  DESCRIPTOR = _MULTIDELETE,
+  __module__ = 'c2s_pb2'
+  # @@protoc_insertion_point(class_scope:de.velcommuta.denul.networking.protobuf.c2s.MultiDelete)
+  ))
+_sym_db.RegisterMessage(MultiDelete)
+
+MultiDeleteReply = _reflection.GeneratedProtocolMessageType('MultiDeleteReply', (_message.Message,), dict(
+  DESCRIPTOR = _MULTIDELETEREPLY,
+  __module__ = 'c2s_pb2'
+  # @@protoc_insertion_point(class_scope:de.velcommuta.denul.networking.protobuf.c2s.MultiDeleteReply)
+  ))
+_sym_db.RegisterMessage(MultiDeleteReply)
+
 
 # @@protoc_insertion_point(module_scope)
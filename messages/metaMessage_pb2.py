@@ -20,7 +20,7 @@ import studyMessage_pb2
 DESCRIPTOR = _descriptor.FileDescriptor(
   name='metaMessage.proto',
   package='de.velcommuta.denul.networking.protobuf.meta',
-  serialized_pb=_b('\n\x11metaMessage.proto\x12,de.velcommuta.denul.networking.protobuf.meta\x1a\tc2s.proto\x1a\x12studyMessage.proto\"\x92\t\n\x07Wrapper\x12O\n\x0b\x43lientHello\x18\x01 \x01(\x0b\x32\x38.de.velcommuta.denul.networking.protobuf.c2s.ClientHelloH\x00\x12O\n\x0bServerHello\x18\x02 \x01(\x0b\x32\x38.de.velcommuta.denul.networking.protobuf.c2s.ServerHelloH\x00\x12\x43\n\x05Store\x18\x03 \x01(\x0b\x32\x32.de.velcommuta.denul.networking.protobuf.c2s.StoreH\x00\x12M\n\nStoreReply\x18\x04 \x01(\x0b\x32\x37.de.velcommuta.denul.networking.protobuf.c2s.StoreReplyH\x00\x12?\n\x03Get\x18\x05 \x01(\x0b\x32\x30.de.velcommuta.denul.networking.protobuf.c2s.GetH\x00\x12I\n\x08GetReply\x18\x06 \x01(\x0b\x32\x35.de.velcommuta.denul.networking.protobuf.c2s.GetReplyH\x00\x12\x45\n\x06\x44\x65lete\x18\x07 \x01(\x0b\x32\x33.de.velcommuta.denul.networking.protobuf.c2s.DeleteH\x00\x12O\n\x0b\x44\x65leteReply\x18\x08 \x01(\x0b\x32\x38.de.velcommuta.denul.networking.protobuf.c2s.DeleteReplyH\x00\x12S\n\x0cStudyWrapper\x18\t \x01(\x0b\x32;.de.velcommuta.denul.networking.protobuf.study.StudyWrapperH\x00\x12[\n\x10StudyCreateReply\x18\n \x01(\x0b\x32?.de.velcommuta.denul.networking.protobuf.study.StudyCreateReplyH\x00\x12\x61\n\x13StudyJoinQueryReply\x18\r \x01(\x0b\x32\x42.de.velcommuta.denul.networking.protobuf.study.StudyJoinQueryReplyH\x00\x12[\n\x10StudyDeleteReply\x18\x0e \x01(\x0b\x32?.de.velcommuta.denul.networking.protobuf.study.StudyDeleteReplyH\x00\x12W\n\x0eStudyListQuery\x18\x0f \x01(\x0b\x32=.de.velcommuta.denul.networking.protobuf.study.StudyListQueryH\x00\x12W\n\x0eStudyListReply\x18\x10 \x01(\x0b\x32=.de.velcommuta.denul.networking.protobuf.study.StudyListReplyH\x00\x42\t\n\x07message')
+  serialized_pb=_b('\n\x11metaMessage.proto\x12,de.velcommuta.denul.networking.protobuf.meta\x1a\tc2s.proto\x1a\x12studyMessage.proto\"\x86\r\n\x07Wrapper\x12O\n\x0b\x43lientHello\x18\x01 \x01(\x0b\x32\x38.de.velcommuta.denul.networking.protobuf.c2s.ClientHelloH\x00\x12O\n\x0bServerHello\x18\x02 \x01(\x0b\x32\x38.de.velcommuta.denul.networking.protobuf.c2s.ServerHelloH\x00\x12\x43\n\x05Store\x18\x03 \x01(\x0b\x32\x32.de.velcommuta.denul.networking.protobuf.c2s.StoreH\x00\x12M\n\nStoreReply\x18\x04 \x01(\x0b\x32\x37.de.velcommuta.denul.networking.protobuf.c2s.StoreReplyH\x00\x12?\n\x03Get\x18\x05 \x01(\x0b\x32\x30.de.velcommuta.denul.networking.protobuf.c2s.GetH\x00\x12I\n\x08GetReply\x18\x06 \x01(\x0b\x32\x35.de.velcommuta.denul.networking.protobuf.c2s.GetReplyH\x00\x12\x45\n\x06\x44\x65lete\x18\x07 \x01(\x0b\x32\x33.de.velcommuta.denul.networking.protobuf.c2s.DeleteH\x00\x12O\n\x0b\x44\x65leteReply\x18\x08 \x01(\x0b\x32\x38.de.velcommuta.denul.networking.protobuf.c2s.DeleteReplyH\x00\x12S\n\x0cStudyWrapper\x18\t \x01(\x0b\x32;.de.velcommuta.denul.networking.protobuf.study.StudyWrapperH\x00\x12[\n\x10StudyCreateReply\x18\n \x01(\x0b\x32?.de.velcommuta.denul.networking.protobuf.study.StudyCreateReplyH\x00\x12\x61\n\x13StudyJoinQueryReply\x18\r \x01(\x0b\x32\x42.de.velcommuta.denul.networking.protobuf.study.StudyJoinQueryReplyH\x00\x12[\n\x10StudyDeleteReply\x18\x0e \x01(\x0b\x32?.de.velcommuta.denul.networking.protobuf.study.StudyDeleteReplyH\x00\x12W\n\x0eStudyListQuery\x18\x0f \x01(\x0b\x32=.de.velcommuta.denul.networking.protobuf.study.StudyListQueryH\x00\x12W\n\x0eStudyListReply\x18\x10 \x01(\x0b\x32=.de.velcommuta.denul.networking.protobuf.study.StudyListReplyH\x00\x12M\n\nMultiStore\x18\x11 \x01(\x0b\x32\x37.de.velcommuta.denul.networking.protobuf.c2s.MultiStoreH\x00\x12W\n\x0fMultiStoreReply\x18\x12 \x01(\x0b\x32<.de.velcommuta.denul.networking.protobuf.c2s.MultiStoreReplyH\x00\x12I\n\x08MultiGet\x18\x13 \x01(\x0b\x32\x35.de.velcommuta.denul.networking.protobuf.c2s.MultiGetH\x00\x12S\n\rMultiGetReply\x18\x14 \x01(\x0b\x32:.de.velcommuta.denul.networking.protobuf.c2s.MultiGetReplyH\x00\x12O\n\x0bMultiDelete\x18\x15 \x01(\x0b\x32\x38.de.velcommuta.denul.networking.protobuf.c2s.MultiDeleteH\x00\x12Y\n\x10MultiDeleteReply\x18\x16 \x01(\x0b\x32=.de.velcommuta.denul.networking.protobuf.c2s.MultiDeleteReplyH\x00\x42\t\n\x07message')
   ,
   dependencies=[c2s_pb2.DESCRIPTOR,studyMessage_pb2.DESCRIPTOR,])
 _sym_db.RegisterFileDescriptor(DESCRIPTOR)
@@ -133,6 +133,48 @@ _WRAPPER = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
+    _descriptor.FieldDescriptor(
+      name='MultiStore', full_name='de.velcommuta.denul.networking.protobuf.meta.Wrapper.MultiStore', index=14,
+      number=17, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='MultiStoreReply', full_name='de.velcommuta.denul.networking.protobuf.meta.Wrapper.MultiStoreReply', index=15,
+      number=18, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='MultiGet', full_name='de.velcommuta.denul.networking.protobuf.meta.Wrapper.MultiGet', index=16,
+      number=19, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='MultiGetReply', full_name='de.velcommuta.denul.networking.protobuf.meta.Wrapper.MultiGetReply', index=17,
+      number=20, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='MultiDelete', full_name='de.velcommuta.denul.networking.protobuf.meta.Wrapper.MultiDelete', index=18,
+      number=21, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='MultiDeleteReply', full_name='de.velcommuta.denul.networking.protobuf.meta.Wrapper.MultiDeleteReply', index=19,
+      number=22, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
   ],
   extensions=[
   ],
@@ -148,7 +190,7 @@ _WRAPPER = _descriptor.Descriptor(
       index=0, containing_type=None, fields=[]),
   ],
   serialized_start=99,
-  serialized_end=1269,
+  serialized_end=1769,
 )
 
 _WRAPPER.fields_by_name['ClientHello'].message_type = c2s_pb2._CLIENTHELLO
@@ -165,6 +207,12 @@ _WRAPPER.fields_by_name['StudyJoinQueryReply'].message_type = studyMessage_pb2._
 _WRAPPER.fields_by_name['StudyDeleteReply'].message_type = studyMessage_pb2._STUDYDELETEREPLY
 _WRAPPER.fields_by_name['StudyListQuery'].message_type = studyMessage_pb2._STUDYLISTQUERY
 _WRAPPER.fields_by_name['StudyListReply'].message_type = studyMessage_pb2._STUDYLISTREPLY
+_WRAPPER.fields_by_name['MultiStore'].message_type = c2s_pb2._MULTISTORE
+_WRAPPER.fields_by_name['MultiStoreReply'].message_type = c2s_pb2._MULTISTOREREPLY
+_WRAPPER.fields_by_name['MultiGet'].message_type = c2s_pb2._MULTIGET
+_WRAPPER.fields_by_name['MultiGetReply'].message_type = c2s_pb2._MULTIGETREPLY
+_WRAPPER.fields_by_name['MultiDelete'].message_type = c2s_pb2._MULTIDELETE
+_WRAPPER.fields_by_name['MultiDeleteReply'].message_type = c2s_pb2._MULTIDELETEREPLY
 _WRAPPER.oneofs_by_name['message'].fields.append(
   _WRAPPER.fields_by_name['ClientHello'])
 _WRAPPER.fields_by_name['ClientHello'].containing_oneof = _WRAPPER.oneofs_by_name['message']
@@ -207,6 +255,24 @@ _WRAPPER.fields_by_name['StudyListQuery'].containing_oneof = _WRAPPER.oneofs_by_
 _WRAPPER.oneofs_by_name['message'].fields.append(
   _WRAPPER.fields_by_name['StudyListReply'])
 _WRAPPER.fields_by_name['StudyListReply'].containing_oneof = _WRAPPER.oneofs_by_name['message']
+_WRAPPER.oneofs_by_name['message'].fields.append(
+  _WRAPPER.fields_by_name['MultiStore'])
+_WRAPPER.fields_by_name['MultiStore'].containing_oneof = _WRAPPER.oneofs_by_name['message']
+_WRAPPER.oneofs_by_name['message'].fields.append(
+  _WRAPPER.fields_by_name['MultiStoreReply'])
+_WRAPPER.fields_by_name['MultiStoreReply'].containing_oneof = _WRAPPER.oneofs_by_name['message']
+_WRAPPER.oneofs_by_name['message'].fields.append(
+  _WRAPPER.fields_by_name['MultiGet'])
+_WRAPPER.fields_by_name['MultiGet'].containing_oneof = _WRAPPER.oneofs_by_name['message']
+_WRAPPER.oneofs_by_name['message'].fields.append(
+  _WRAPPER.fields_by_name['MultiGetReply'])
+_WRAPPER.fields_by_name['MultiGetReply'].containing_oneof = _WRAPPER.oneofs_by_name['message']
+_WRAPPER.oneofs_by_name['message'].fields.append(
+  _WRAPPER.fields_by_name['MultiDelete'])
+_WRAPPER.fields_by_name['MultiDelete'].containing_oneof = _WRAPPER.oneofs_by_name['message']
+_WRAPPER.oneofs_by_name['message'].fields.append(
+  _WRAPPER.fields_by_name['MultiDeleteReply'])
+_WRAPPER.fields_by_name['MultiDeleteReply'].containing_oneof = _WRAPPER.oneofs_by_name['message']
 DESCRIPTOR.message_types_by_name['Wrapper'] = _WRAPPER
 
 Wrapper = _reflection.GeneratedProtocolMessageType('Wrapper', (_message.Message,), dict(
@@ -18,7 +18,7 @@ _sym_db = _symbol_database.Default()
 DESCRIPTOR = _descriptor.FileDescriptor(
   name='studyMessage.proto',
   package='de.velcommuta.denul.networking.protobuf.study',
-  serialized_pb=_b('\n\x12studyMessage.proto\x12-de.velcommuta.denul.networking.protobuf.study\"\xeb\x01\n\x0cStudyWrapper\x12U\n\x04type\x18\x01 \x02(\x0e\x32G.de.velcommuta.denul.networking.protobuf.study.StudyWrapper.MessageType\x12\x0f\n\x07message\x18\x02 \x02(\x0c\x12\x11\n\tsignature\x18\x03 \x02(\x0c\"`\n\x0bMessageType\x12\x0f\n\x0bMSG_UNKNOWN\x10\x00\x12\x13\n\x0fMSG_STUDYCREATE\x10\x01\x12\x16\n\x12MSG_STUDYJOINQUERY\x10\x02\x12\x13\n\x0fMSG_STUDYDELETE\x10\x03\"\xbe\x0b\n\x0bStudyCreate\x12\x12\n\nstudy_name\x18\x01 \x02(\t\x12\x13\n\x0binstitution\x18\x02 \x02(\t\x12\x0f\n\x07webpage\x18\x03 \x02(\t\x12\x13\n\x0b\x64\x65scription\x18\x04 \x02(\t\x12\x0f\n\x07purpose\x18\x05 \x02(\t\x12\x12\n\nprocedures\x18\x06 \x02(\t\x12\r\n\x05risks\x18\x07 \x02(\t\x12\x10\n\x08\x62\x65nefits\x18\x08 \x02(\t\x12\x0f\n\x07payment\x18\t \x02(\t\x12\x11\n\tconflicts\x18\n \x02(\t\x12\x17\n\x0f\x63onfidentiality\x18\x0b \x02(\t\x12\"\n\x1aparticipationAndWithdrawal\x18\x0c \x02(\t\x12\x0e\n\x06rights\x18\r \x02(\t\x12^\n\rinvestigators\x18\x0e \x03(\x0b\x32G.de.velcommuta.denul.networking.protobuf.study.StudyCreate.Investigator\x12[\n\x0b\x64\x61taRequest\x18\x0f \x03(\x0b\x32\x46.de.velcommuta.denul.networking.protobuf.study.StudyCreate.DataRequest\x12\x11\n\tpublicKey\x18\x10 \x02(\x0c\x12\\\n\rpublicKeyAlgo\x18\x11 \x02(\x0e\x32\x45.de.velcommuta.denul.networking.protobuf.study.StudyCreate.PubkeyAlgo\x12m\n\x14verificationStrategy\x18\x12 \x02(\x0e\x32O.de.velcommuta.denul.networking.protobuf.study.StudyCreate.VerificationStrategy\x12\x18\n\x10verificationData\x18\x13 \x01(\t\x12\x0f\n\x07kexData\x18\x14 \x02(\x0c\x12X\n\x0ckexAlgorithm\x18\x15 \x02(\x0e\x32\x42.de.velcommuta.denul.networking.protobuf.study.StudyCreate.KexAlgo\x12\x17\n\x0fqueueIdentifier\x18\x16 \x02(\x0c\x1aR\n\x0cInvestigator\x12\x0c\n\x04name\x18\x01 \x02(\t\x12\x13\n\x0binstitution\x18\x02 \x02(\t\x12\r\n\x05group\x18\x03 \x02(\t\x12\x10\n\x08position\x18\x04 \x02(\t\x1a\xd8\x01\n\x0b\x44\x61taRequest\x12U\n\x08\x64\x61tatype\x18\x01 \x02(\x0e\x32\x43.de.velcommuta.denul.networking.protobuf.study.StudyCreate.DataType\x12_\n\x0bgranularity\x18\x02 \x02(\x0e\x32J.de.velcommuta.denul.networking.protobuf.study.StudyCreate.DataGranularity\x12\x11\n\tfrequency\x18\x03 \x02(\x05\"E\n\x08\x44\x61taType\x12\x10\n\x0c\x44\x41TA_UNKNOWN\x10\x00\x12\x12\n\x0e\x44\x41TA_GPS_TRACK\x10\x01\x12\x13\n\x0f\x44\x41TA_STEP_COUNT\x10\x02\"G\n\x0f\x44\x61taGranularity\x12\r\n\tGRAN_FINE\x10\x00\x12\x0f\n\x0bGRAN_COARSE\x10\x01\x12\x14\n\x10GRAN_VERY_COARSE\x10\x02\"3\n\x07KexAlgo\x12\x0f\n\x0bKEX_UNKNOWN\x10\x00\x12\x17\n\x13KEX_ECDH_CURVE25519\x10\x01\"(\n\nPubkeyAlgo\x12\x0e\n\nPK_UNKNOWN\x10\x00\x12\n\n\x06PK_RSA\x10\x01\"P\n\x14VerificationStrategy\x12\x0e\n\nVF_UNKNOWN\x10\x00\x12\x0e\n\nVF_DNS_TXT\x10\x01\x12\x0b\n\x07VF_FILE\x10\x02\x12\x0b\n\x07VF_META\x10\x03\"\xb8\x02\n\x10StudyCreateReply\x12\x17\n\x0fqueueIdentifier\x18\x01 \x02(\x0c\x12\\\n\x06status\x18\x02 \x02(\x0e\x32L.de.velcommuta.denul.networking.protobuf.study.StudyCreateReply.CreateStatus\"\xac\x01\n\x0c\x43reateStatus\x12\x12\n\x0e\x43REATE_UNKNOWN\x10\x00\x12\r\n\tCREATE_OK\x10\x01\x12\x19\n\x15\x43REATE_FAIL_SIGNATURE\x10\x02\x12\x1e\n\x1a\x43REATE_FAIL_BAD_IDENTIFIER\x10\x03\x12 \n\x1c\x43REATE_FAIL_IDENTIFIER_TAKEN\x10\x04\x12\x1c\n\x18\x43REATE_FAIL_VERIFICATION\x10\x05\"\x10\n\x0eStudyListQuery\"`\n\x0eStudyListReply\x12N\n\tstudylist\x18\x01 \x03(\x0b\x32;.de.velcommuta.denul.networking.protobuf.study.StudyWrapper\"\xc2\x01\n\tStudyJoin\x12\x17\n\x0fqueueIdentifier\x18\x01 \x02(\x0c\x12\x0f\n\x07kexData\x18\x02 \x02(\x0c\x12V\n\x0ckexAlgorithm\x18\x03 \x02(\x0e\x32@.de.velcommuta.denul.networking.protobuf.study.StudyJoin.KexAlgo\"3\n\x07KexAlgo\x12\x0f\n\x0bKEX_UNKNOWN\x10\x00\x12\x17\n\x13KEX_ECDH_CURVE25519\x10\x01\")\n\x0eStudyJoinQuery\x12\x17\n\x0fqueueIdentifier\x18\x01 \x02(\x0c\"\xee\x01\n\x13StudyJoinQueryReply\x12^\n\x06status\x18\x01 \x02(\x0e\x32N.de.velcommuta.denul.networking.protobuf.study.StudyJoinQueryReply.QueryStatus\x12\x0f\n\x07message\x18\x02 \x03(\x0c\"f\n\x0bQueryStatus\x12\x12\n\x0eSTATUS_UNKNOWN\x10\x00\x12\r\n\tSTATUS_OK\x10\x01\x12\x19\n\x15STATUS_FAIL_NOT_FOUND\x10\x02\x12\x19\n\x15STATUS_FAIL_SIGNATURE\x10\x03\"&\n\x0bStudyDelete\x12\x17\n\x0fqueueIdentifier\x18\x01 \x02(\x0c\"\xd7\x01\n\x10StudyDeleteReply\x12\\\n\x06status\x18\x01 \x02(\x0e\x32L.de.velcommuta.denul.networking.protobuf.study.StudyDeleteReply.DeleteStatus\"e\n\x0c\x44\x65leteStatus\x12\x12\n\x0e\x44\x45LETE_UNKNOWN\x10\x00\x12\r\n\tDELETE_OK\x10\x01\x12\x19\n\x15\x44\x45LETE_FAIL_BAD_IDENT\x10\x02\x12\x17\n\x13\x44\x45LETE_FAIL_BAD_SIG\x10\x03')
+  serialized_pb=_b('\n\x12studyMessage.proto\x12-de.velcommuta.denul.networking.protobuf.study\"\xeb\x01\n\x0cStudyWrapper\x12U\n\x04type\x18\x01 \x02(\x0e\x32G.de.velcommuta.denul.networking.protobuf.study.StudyWrapper.MessageType\x12\x0f\n\x07message\x18\x02 \x02(\x0c\x12\x11\n\tsignature\x18\x03 \x02(\x0c\"`\n\x0bMessageType\x12\x0f\n\x0bMSG_UNKNOWN\x10\x00\x12\x13\n\x0fMSG_STUDYCREATE\x10\x01\x12\x16\n\x12MSG_STUDYJOINQUERY\x10\x02\x12\x13\n\x0fMSG_STUDYDELETE\x10\x03\"\xbe\x0b\n\x0bStudyCreate\x12\x12\n\nstudy_name\x18\x01 \x02(\t\x12\x13\n\x0binstitution\x18\x02 \x02(\t\x12\x0f\n\x07webpage\x18\x03 \x02(\t\x12\x13\n\x0b\x64\x65scription\x18\x04 \x02(\t\x12\x0f\n\x07purpose\x18\x05 \x02(\t\x12\x12\n\nprocedures\x18\x06 \x02(\t\x12\r\n\x05risks\x18\x07 \x02(\t\x12\x10\n\x08\x62\x65nefits\x18\x08 \x02(\t\x12\x0f\n\x07payment\x18\t \x02(\t\x12\x11\n\tconflicts\x18\n \x02(\t\x12\x17\n\x0f\x63onfidentiality\x18\x0b \x02(\t\x12\"\n\x1aparticipationAndWithdrawal\x18\x0c \x02(\t\x12\x0e\n\x06rights\x18\r \x02(\t\x12^\n\rinvestigators\x18\x0e \x03(\x0b\x32G.de.velcommuta.denul.networking.protobuf.study.StudyCreate.Investigator\x12[\n\x0b\x64\x61taRequest\x18\x0f \x03(\x0b\x32\x46.de.velcommuta.denul.networking.protobuf.study.StudyCreate.DataRequest\x12\x11\n\tpublicKey\x18\x10 \x02(\x0c\x12\\\n\rpublicKeyAlgo\x18\x11 \x02(\x0e\x32\x45.de.velcommuta.denul.networking.protobuf.study.StudyCreate.PubkeyAlgo\x12m\n\x14verificationStrategy\x18\x12 \x02(\x0e\x32O.de.velcommuta.denul.networking.protobuf.study.StudyCreate.VerificationStrategy\x12\x18\n\x10verificationData\x18\x13 \x01(\t\x12\x0f\n\x07kexData\x18\x14 \x02(\x0c\x12X\n\x0ckexAlgorithm\x18\x15 \x02(\x0e\x32\x42.de.velcommuta.denul.networking.protobuf.study.StudyCreate.KexAlgo\x12\x17\n\x0fqueueIdentifier\x18\x16 \x02(\x0c\x1aR\n\x0cInvestigator\x12\x0c\n\x04name\x18\x01 \x02(\t\x12\x13\n\x0binstitution\x18\x02 \x02(\t\x12\r\n\x05group\x18\x03 \x02(\t\x12\x10\n\x08position\x18\x04 \x02(\t\x1a\xd8\x01\n\x0b\x44\x61taRequest\x12U\n\x08\x64\x61tatype\x18\x01 \x02(\x0e\x32\x43.de.velcommuta.denul.networking.protobuf.study.StudyCreate.DataType\x12_\n\x0bgranularity\x18\x02 \x02(\x0e\x32J.de.velcommuta.denul.networking.protobuf.study.StudyCreate.DataGranularity\x12\x11\n\tfrequency\x18\x03 \x02(\x05\"E\n\x08\x44\x61taType\x12\x10\n\x0c\x44\x41TA_UNKNOWN\x10\x00\x12\x12\n\x0e\x44\x41TA_GPS_TRACK\x10\x01\x12\x13\n\x0f\x44\x41TA_STEP_COUNT\x10\x02\"G\n\x0f\x44\x61taGranularity\x12\r\n\tGRAN_FINE\x10\x00\x12\x0f\n\x0bGRAN_COARSE\x10\x01\x12\x14\n\x10GRAN_VERY_COARSE\x10\x02\"3\n\x07KexAlgo\x12\x0f\n\x0bKEX_UNKNOWN\x10\x00\x12\x17\n\x13KEX_ECDH_CURVE25519\x10\x01\"(\n\nPubkeyAlgo\x12\x0e\n\nPK_UNKNOWN\x10\x00\x12\n\n\x06PK_RSA\x10\x01\"P\n\x14VerificationStrategy\x12\x0e\n\nVF_UNKNOWN\x10\x00\x12\x0e\n\nVF_DNS_TXT\x10\x01\x12\x0b\n\x07VF_FILE\x10\x02\x12\x0b\n\x07VF_META\x10\x03\"\xb8\x02\n\x10StudyCreateReply\x12\x17\n\x0fqueueIdentifier\x18\x01 \x02(\x0c\x12\\\n\x06status\x18\x02 \x02(\x0e\x32L.de.velcommuta.denul.networking.protobuf.study.StudyCreateReply.CreateStatus\"\xac\x01\n\x0c\x43reateStatus\x12\x12\n\x0e\x43REATE_UNKNOWN\x10\x00\x12\r\n\tCREATE_OK\x10\x01\x12\x19\n\x15\x43REATE_FAIL_SIGNATURE\x10\x02\x12\x1e\n\x1a\x43REATE_FAIL_BAD_IDENTIFIER\x10\x03\x12 \n\x1c\x43REATE_FAIL_IDENTIFIER_TAKEN\x10\x04\x12\x1c\n\x18\x43REATE_FAIL_VERIFICATION\x10\x05\"\xea\x01\n\x0eStudyListQuery\x12\x10\n\x08pageSize\x18\x01 \x01(\r\x12\x0e\n\x06\x63ursor\x18\x02 \x01(\x04\x12U\n\x08\x64\x61tatype\x18\x03 \x01(\x0e\x32\x43.de.velcommuta.denul.networking.protobuf.study.StudyCreate.DataType\x12_\n\x0bgranularity\x18\x04 \x01(\x0e\x32J.de.velcommuta.denul.networking.protobuf.study.StudyCreate.DataGranularity\"~\n\x0eStudyListReply\x12N\n\tstudylist\x18\x01 \x03(\x0b\x32;.de.velcommuta.denul.networking.protobuf.study.StudyWrapper\x12\x0e\n\x06\x63ursor\x18\x02 \x01(\x04\x12\x0c\n\x04more\x18\x03 \x01(\x08\"\xc2\x01\n\tStudyJoin\x12\x17\n\x0fqueueIdentifier\x18\x01 \x02(\x0c\x12\x0f\n\x07kexData\x18\x02 \x02(\x0c\x12V\n\x0ckexAlgorithm\x18\x03 \x02(\x0e\x32@.de.velcommuta.denul.networking.protobuf.study.StudyJoin.KexAlgo\"3\n\x07KexAlgo\x12\x0f\n\x0bKEX_UNKNOWN\x10\x00\x12\x17\n\x13KEX_ECDH_CURVE25519\x10\x01\"K\n\x0eStudyJoinQuery\x12\x17\n\x0fqueueIdentifier\x18\x01 \x02(\x0c\x12\x10\n\x08pageSize\x18\x02 \x01(\r\x12\x0e\n\x06\x63ursor\x18\x03 \x01(\x04\"\x8c\x02\n\x13StudyJoinQueryReply\x12^\n\x06status\x18\x01 \x02(\x0e\x32N.de.velcommuta.denul.networking.protobuf.study.StudyJoinQueryReply.QueryStatus\x12\x0f\n\x07message\x18\x02 \x03(\x0c\x12\x0e\n\x06\x63ursor\x18\x03 \x01(\x04\x12\x0c\n\x04more\x18\x04 \x01(\x08\"f\n\x0bQueryStatus\x12\x12\n\x0eSTATUS_UNKNOWN\x10\x00\x12\r\n\tSTATUS_OK\x10\x01\x12\x19\n\x15STATUS_FAIL_NOT_FOUND\x10\x02\x12\x19\n\x15STATUS_FAIL_SIGNATURE\x10\x03\"&\n\x0bStudyDelete\x12\x17\n\x0fqueueIdentifier\x18\x01 \x02(\x0c\"\xd7\x01\n\x10StudyDeleteReply\x12\\\n\x06status\x18\x01 \x02(\x0e\x32L.de.velcommuta.denul.networking.protobuf.study.StudyDeleteReply.DeleteStatus\"e\n\x0c\x44\x65leteStatus\x12\x12\n\x0e\x44\x45LETE_UNKNOWN\x10\x00\x12\r\n\tDELETE_OK\x10\x01\x12\x19\n\x15\x44\x45LETE_FAIL_BAD_IDENT\x10\x02\x12\x17\n\x13\x44\x45LETE_FAIL_BAD_SIG\x10\x03')
 )
 _sym_db.RegisterFileDescriptor(DESCRIPTOR)
 
@@ -265,8 +265,8 @@ _STUDYJOINQUERYREPLY_QUERYSTATUS = _descriptor.EnumDescriptor(
   ],
   containing_type=None,
   options=None,
-  serialized_start=2588,
-  serialized_end=2690,
+  serialized_start=2901,
+  serialized_end=3003,
 )
 _sym_db.RegisterEnumDescriptor(_STUDYJOINQUERYREPLY_QUERYSTATUS)
 
@@ -295,8 +295,8 @@ _STUDYDELETEREPLY_DELETESTATUS = _descriptor.EnumDescriptor(
   ],
   containing_type=None,
   options=None,
-  serialized_start=2847,
-  serialized_end=2948,
+  serialized_start=3160,
+  serialized_end=3261,
 )
 _sym_db.RegisterEnumDescriptor(_STUDYDELETEREPLY_DELETESTATUS)
 
@@ -666,6 +666,34 @@ _STUDYLISTQUERY = _descriptor.Descriptor(
   file=DESCRIPTOR,
   containing_type=None,
   fields=[
+    _descriptor.FieldDescriptor(
+      name='pageSize', full_name='de.velcommuta.denul.networking.protobuf.study.StudyListQuery.pageSize', index=0,
+      number=1, type=13, cpp_type=3, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='cursor', full_name='de.velcommuta.denul.networking.protobuf.study.StudyListQuery.cursor', index=1,
+      number=2, type=4, cpp_type=4, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='datatype', full_name='de.velcommuta.denul.networking.protobuf.study.StudyListQuery.datatype', index=2,
+      number=3, type=14, cpp_type=8, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='granularity', full_name='de.velcommuta.denul.networking.protobuf.study.StudyListQuery.granularity', index=3,
+      number=4, type=14, cpp_type=8, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
   ],
   extensions=[
   ],
@@ -677,8 +705,8 @@ _STUDYLISTQUERY = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=2095,
-  serialized_end=2111,
+  serialized_start=2096,
+  serialized_end=2330,
 )
 
 
@@ -696,6 +724,20 @@ _STUDYLISTREPLY = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
+    _descriptor.FieldDescriptor(
+      name='cursor', full_name='de.velcommuta.denul.networking.protobuf.study.StudyListReply.cursor', index=1,
+      number=2, type=4, cpp_type=4, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='more', full_name='de.velcommuta.denul.networking.protobuf.study.StudyListReply.more', index=2,
+      number=3, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
   ],
   extensions=[
   ],
@@ -707,8 +749,8 @@ _STUDYLISTREPLY = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=2113,
-  serialized_end=2209,
+  serialized_start=2332,
+  serialized_end=2458,
 )
 
 
@@ -752,8 +794,8 @@ _STUDYJOIN = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=2212,
-  serialized_end=2406,
+  serialized_start=2461,
+  serialized_end=2655,
 )
 
 
@@ -771,6 +813,20 @@ _STUDYJOINQUERY = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
+    _descriptor.FieldDescriptor(
+      name='pageSize', full_name='de.velcommuta.denul.networking.protobuf.study.StudyJoinQuery.pageSize', index=1,
+      number=2, type=13, cpp_type=3, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='cursor', full_name='de.velcommuta.denul.networking.protobuf.study.StudyJoinQuery.cursor', index=2,
+      number=3, type=4, cpp_type=4, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
   ],
   extensions=[
   ],
@@ -782,8 +838,8 @@ _STUDYJOINQUERY = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=2408,
-  serialized_end=2449,
+  serialized_start=2657,
+  serialized_end=2732,
 )
 
 
@@ -808,6 +864,20 @@ _STUDYJOINQUERYREPLY = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
+    _descriptor.FieldDescriptor(
+      name='cursor', full_name='de.velcommuta.denul.networking.protobuf.study.StudyJoinQueryReply.cursor', index=2,
+      number=3, type=4, cpp_type=4, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='more', full_name='de.velcommuta.denul.networking.protobuf.study.StudyJoinQueryReply.more', index=3,
+      number=4, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
   ],
   extensions=[
   ],
@@ -820,8 +890,8 @@ _STUDYJOINQUERYREPLY = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=2452,
-  serialized_end=2690,
+  serialized_start=2735,
+  serialized_end=3003,
 )
 
 
@@ -850,8 +920,8 @@ _STUDYDELETE = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=2692,
-  serialized_end=2730,
+  serialized_start=3005,
+  serialized_end=3043,
 )
 
 
@@ -881,8 +951,8 @@ _STUDYDELETEREPLY = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=2733,
-  serialized_end=2948,
+  serialized_start=3046,
+  serialized_end=3261,
 )
 
 _STUDYWRAPPER.fields_by_name['type'].enum_type = _STUDYWRAPPER_MESSAGETYPE
@@ -903,6 +973,8 @@ _STUDYCREATE_PUBKEYALGO.containing_type = _STUDYCREATE
 _STUDYCREATE_VERIFICATIONSTRATEGY.containing_type = _STUDYCREATE
 _STUDYCREATEREPLY.fields_by_name['status'].enum_type = _STUDYCREATEREPLY_CREATESTATUS
 _STUDYCREATEREPLY_CREATESTATUS.containing_type = _STUDYCREATEREPLY
+_STUDYLISTQUERY.fields_by_name['datatype'].enum_type = _STUDYCREATE_DATATYPE
+_STUDYLISTQUERY.fields_by_name['granularity'].enum_type = _STUDYCREATE_DATAGRANULARITY
 _STUDYLISTREPLY.fields_by_name['studylist'].message_type = _STUDYWRAPPER
 _STUDYJOIN.fields_by_name['kexAlgorithm'].enum_type = _STUDYJOIN_KEXALGO
 _STUDYJOIN_KEXALGO.containing_type = _STUDYJOIN
@@ -0,0 +1,107 @@
+# -*- encoding: utf-8 -*-
+"""Admission control and rate limiting for client connections.
+
+AdmissionControl keeps the number of open connections bounded, both in total
+and per source address, so abandoned or abusive clients cannot exhaust file
+descriptors and TLS buffers. TokenBucket limits the rate at which a single
+connection may issue requests.
+"""
+import time
+
+
+class TokenBucket():
+    """A token bucket allowing rate requests per second, with bursts"""
+
+    def __init__(self, rate, burst):
+        """Initialize the bucket.
+
+        Keyword arguments:
+        rate  -- Number of tokens added per second
+        burst -- Maximum number of tokens in the bucket. The bucket starts
+                 out full.
+        """
+        if rate <= 0:
+            raise ValueError("rate must be >0")
+        if burst < 1:
+            raise ValueError("burst must be >=1")
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.stamp = time.time()
+
+    def _refill(self, now):
+        elapsed = max(now - self.stamp, 0)
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.stamp = now
+
+    def consume(self, now=None):
+        """Take a token from the bucket.
+
+        Returns True if a token was available, False if the rate is exceeded.
+        """
+        self._refill(time.time() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def charge(self, count, now=None):
+        """Take count tokens from the bucket, even if it does not hold as
+        many. The missing tokens are paid off by the next refills, before
+        consume() succeeds again."""
+        self._refill(time.time() if now is None else now)
+        self.tokens -= count
+
+    def delay(self, now=None):
+        """Return the number of seconds until a token will be available"""
+        self._refill(time.time() if now is None else now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionControl():
+    """Limit the number of connections, in total and per source address"""
+
+    def __init__(self, max_connections=0, max_per_source=0):
+        """Initialize the admission control.
+
+        Keyword arguments:
+        max_connections -- Maximum number of open connections, 0 for no limit
+                           (default: 0)
+        max_per_source  -- Maximum number of open connections from a single
+                           source address, 0 for no limit (default: 0)
+        """
+        self.max_connections = max_connections
+        self.max_per_source = max_per_source
+        self.total = 0
+        # Maps source addresses to their number of open connections
+        self.sources = {}
+        # Number of refused connections
+        self.refused = 0
+
+    def admit(self, source):
+        """Check if a new connection from source may be opened.
+
+        If True is returned, the connection is counted until release() is
+        called for it.
+        """
+        count = self.sources.get(source, 0)
+        if (self.max_connections and self.total >= self.max_connections) or \
+                (self.max_per_source and count >= self.max_per_source):
+            self.refused += 1
+            return False
+        self.total += 1
+        self.sources[source] = count + 1
+        return True
+
+    def release(self, source):
+        """Stop counting a connection that has been closed"""
+        count = self.sources.get(source, 0)
+        if count == 0:
+            return
+        self.total -= 1
+        if count == 1:
+            del self.sources[source]
+        else:
+            self.sources[source] = count - 1
@@ -0,0 +1,194 @@
+# -*- encoding: utf-8 -*-
+"""Multi-process operation of the server.
+
+A Supervisor forks a number of worker processes. Each worker runs its own
+event loop on its own listening socket, bound to the shared port with
+SO_REUSEPORT, so the kernel distributes incoming connections between them.
+
+The workers open their own connections to the shared SQLite database, whose
+file locking guarantees that only one of them writes at any time. Every
+worker also keeps its own copy of the VICBF. To keep these copies coherent,
+workers publish every change they make to the supervisor, which applies it
+to its own copy (so respawned workers start out up to date) and relays it to
+all other workers.
+
+Events travel over a socketpair per worker, using the same length-prefixed
+framing and non-blocking Connection objects as client traffic. Both ends
+always read and apply all events they receive, so the links do not pause
+for backpressure: Two ends waiting for each other to drain their queues
+would never receive an event again.
+"""
+import errno
+import os
+import select
+import signal
+import socket
+import sys
+import time
+
+from connection import Connection
+
+# Event types
+EVENT_INSERT = 'I'  # A key has been inserted into the VICBF
+EVENT_REMOVE = 'R'  # A key has been removed from the VICBF
+EVENT_STUDY_CREATE = 'C'  # A study has been created
+EVENT_STUDY_DELETE = 'S'  # A study has been deleted
+
+
+def encodeEvent(op, payload):
+    """Encode an event into a length-prefixed frame"""
+    return Connection.frame(op + payload)
+
+
+def decodeEvent(frame):
+    """Decode the payload of an event frame into an (op, payload) tuple"""
+    return frame[:1], frame[1:]
+
+
+def eventLink(sock, addr):
+    """Wrap one end of an event socketpair in a Connection that never pauses
+    reading"""
+    return Connection(sock, addr, high_water=None)
+
+
+def createReusePortSocket(host, port, backlog=10):
+    """Create a listening socket that may share its port with other processes"""
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("SO_REUSEPORT is not supported on this platform")
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+class Supervisor():
+    """Fork and supervise worker processes, relaying events between them"""
+    # Workers that die within MIN_UPTIME seconds are not restarted
+    MIN_UPTIME = 1.0
+
+    def __init__(self, workers, worker_main, on_event=None):
+        """Initialize the supervisor.
+
+        Keyword arguments:
+        workers     -- Number of worker processes to run
+        worker_main -- Function to run in each worker. It receives the
+                       Connection to the supervisor as its only argument.
+        on_event    -- Function called with (op, payload) for every event
+                       before it is relayed (default: None)
+        """
+        if workers < 1:
+            raise ValueError("workers must be >=1")
+        self.count = workers
+        self.worker_main = worker_main
+        self.on_event = on_event
+        # Maps the PID of every worker to its event Connection
+        self.workers = {}
+        # Maps the PID of every worker to the time it was started at
+        self.started = {}
+
+    def _spawn(self):
+        """Fork a new worker process"""
+        parent, child = socket.socketpair()
+        # Do not let the worker inherit unwritten output
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid == 0:
+            # We are the worker. Drop all references to the event channels of
+            # the other workers and run the worker code.
+            parent.close()
+            for link in self.workers.values():
+                link.sock.close()
+            # Make sure the supervisor can stop us, even if the supervisor
+            # itself was started with SIGINT ignored
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            status = 0
+            try:
+                self.worker_main(eventLink(child, ("worker", os.getpid())))
+            except KeyboardInterrupt:
+                pass
+            except Exception, e:
+                print "Worker %i failed: %s" % (os.getpid(), e)
+                status = 1
+            # Never return into the code of the supervisor
+            sys.stdout.flush()
+            os._exit(status)
+        child.close()
+        self.workers[pid] = eventLink(parent, ("worker", pid))
+        self.started[pid] = time.time()
+        print "Worker %i started" % pid
+
+    def _reap(self, pid):
+        """Wait for a worker to exit and close its event channel"""
+        try:
+            os.waitpid(pid, 0)
+        except OSError:
+            pass
+        self.workers.pop(pid).close()
+        self.started.pop(pid)
+        print "Worker %i exited" % pid
+
+    def _relay(self, sender, frame):
+        """Apply an event and forward it to all workers except its sender"""
+        if self.on_event is not None:
+            self.on_event(*decodeEvent(frame))
+        for pid, link in self.workers.items():
+            if pid != sender:
+                link.send(Connection.frame(frame))
+
+    def run(self):
+        """Start the workers and relay events until interrupted"""
+        for i in range(self.count):
+            self._spawn()
+        try:
+            while self.workers:
+                links = dict((link, pid) for pid, link
+                             in self.workers.items())
+                readers = [l for l in links if l.wants_read()]
+                writers = [l for l in links if l.wants_write()]
+                try:
+                    readable, writable, _ = select.select(readers, writers,
+                                                          [])
+                except select.error, e:
+                    if e.args[0] == errno.EINTR:
+                        continue
+                    raise
+                for link in writable:
+                    try:
+                        link.flush()
+                    except Exception:
+                        # Reaped once the read side notices the closed socket
+                        link.outbuf.clear()
+                        link.outbytes = 0
+                for link in readable:
+                    pid = links[link]
+                    try:
+                        link.fill()
+                    except Exception:
+                        # The worker has died. Replace it, unless it died
+                        # right after starting, which indicates a problem
+                        # that a new worker would run into as well.
+                        uptime = time.time() - self.started[pid]
+                        self._reap(pid)
+                        if uptime > self.MIN_UPTIME:
+                            self._spawn()
+                        continue
+                    frame = link.next_frame()
+                    while frame is not None:
+                        self._relay(pid, frame)
+                        frame = link.next_frame()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Stop all workers and wait for them to exit"""
+        for pid in self.workers.keys():
+            try:
+                os.kill(pid, signal.SIGINT)
+            except OSError:
+                pass
+        for pid in self.workers.keys():
+            self._reap(pid)
@@ -0,0 +1,302 @@
+# -*- encoding: utf-8 -*-
+"""Non-blocking client connections with buffered, length-prefixed framing.
+
+Every client socket is wrapped in a Connection object, which keeps an inbound
+buffer of received bytes and an outbound queue of replies that have not yet
+been written to the socket. Replies are only flushed when select() reports the
+socket as writable, so a slow client can never stall the main loop.
+
+To keep a single slow consumer from making the server buffer an unbounded
+amount of replies, every connection has a high and a low watermark: Once more
+than high_water bytes are queued, the connection stops handing out new
+requests until the queue has drained below low_water again. Likewise, a
+connection is not read while more than high_water bytes of requests are
+buffered, unless they are part of a single message. Messages may be at most
+max_message bytes long; a client announcing a longer one is dropped.
+Connections whose owner hands out every received message right away, like
+the event links between server processes, can disable the watermarks.
+
+Connections may also carry a TokenBucket limiting the rate of requests. A
+connection that exceeds its rate is throttled: Its requests stay buffered
+(and, once the buffer is not read any more, in the kernel) until the bucket
+has been refilled. Requests doing the work of several, e.g. batches, can be
+charged additional tokens.
+"""
+import errno
+import socket
+import ssl
+import struct
+import time
+from collections import deque
+
+# Error codes indicating that a non-blocking operation could not complete yet
+_WOULDBLOCK_ERRNO = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+_WOULDBLOCK_SSL = (ssl.SSL_ERROR_WANT_READ, ssl.SSL_ERROR_WANT_WRITE)
+
+
+def _would_block(e):
+    """Check if a socket exception only indicates that the call would block"""
+    if isinstance(e, ssl.SSLError):
+        return e.args[0] in _WOULDBLOCK_SSL
+    return e.args[0] in _WOULDBLOCK_ERRNO
+
+
+class Connection():
+    """A single non-blocking client connection"""
+    # Number of bytes to read from the socket in one go
+    RECV_BUFFER = 4096
+    # Maximum number of bytes read by a single fill() call, so that a client
+    # sending a lot of data cannot monopolize the main loop
+    FILL_LIMIT = 65536
+    # Default maximum length of a message
+    MAX_MESSAGE_SIZE = 4194304
+    # Maximum number of bytes passed to a single send() call. Writes on a TLS
+    # socket have to be retried with identical arguments if they would block,
+    # so keeping them to the size of one TLS record keeps retries cheap.
+    SEND_CHUNK = 16384
+
+    def __init__(self, sock, addr, high_water=1048576, low_water=262144,
+                 bucket=None, handshake=False, max_message=MAX_MESSAGE_SIZE):
+        """Initialize the connection.
+
+        Keyword arguments:
+        sock       -- The (already connected) client socket
+        addr       -- Address of the client, as returned by accept()
+        high_water -- Queued bytes at which reading is paused, None to never
+                      pause. Received bytes are then read FILL_LIMIT at a
+                      time. (default: 1 MB)
+        low_water  -- Queued bytes at which reading is resumed
+                      (default: 256 KB)
+        bucket     -- TokenBucket limiting the rate of requests (default: no
+                      limit)
+        handshake  -- True if sock is a TLS socket created with
+                      do_handshake_on_connect=False. The handshake is then
+                      performed without blocking by fill() and flush().
+                      (default: False)
+        max_message -- Maximum length of a received message in bytes. Longer
+                       messages raise a RuntimeError. (default: 4 MiB)
+        """
+        if high_water is not None and low_water > high_water:
+            raise ValueError("low_water must not exceed high_water")
+        self.sock = sock
+        self.addr = addr
+        self.high_water = high_water
+        self.low_water = low_water
+        self.max_message = max_message
+        # Received bytes, of which those before inoffset have already been
+        # handed out
+        self.inbuf = bytearray()
+        self.inoffset = 0
+        # Queue of outgoing buffers, and the write offset into the first one
+        self.outbuf = deque()
+        self.outoffset = 0
+        # Total number of bytes waiting to be written
+        self.outbytes = 0
+        # Indicates that the connection is paused due to backpressure
+        self.paused = False
+        # Indicates that a request is still being processed asynchronously.
+        # Replies are sent in order, so no further requests are handed out.
+        self.busy = False
+        # Rate limit for requests, and whether it has been exceeded
+        self.bucket = bucket
+        self.throttled = False
+        # Indicates that the TLS handshake has not completed yet, and whether
+        # it is waiting for the socket to become writable
+        self.handshaking = handshake
+        self.handshake_wants_write = False
+        # Time of the last successful read or write, for idle timeouts
+        self.last_active = time.time()
+        self.sock.setblocking(0)
+
+    @staticmethod
+    def frame(payload):
+        """Prefix a payload with its 4-byte length indicator"""
+        return struct.pack('>i', len(payload)) + payload
+
+    def fileno(self):
+        """Return the file descriptor of the socket, allowing select() calls"""
+        return self.sock.fileno()
+
+    def wants_read(self):
+        """Check if the connection should be polled for incoming data"""
+        if self.handshaking:
+            return not self.handshake_wants_write
+        return not (self.paused or self.busy or self.throttled or
+                    self._buffered() >= self._read_limit())
+
+    def pending(self):
+        """Check if the TLS layer holds received data that select() does not
+        report, because it has already been read from the socket"""
+        pending = getattr(self.sock, "pending", None)
+        return pending is not None and not self.handshaking and \
+            pending() > 0
+
+    def _buffered(self):
+        # Number of received bytes that have not been handed out yet
+        return len(self.inbuf) - self.inoffset
+
+    def _frame_length(self):
+        # Return the length of the next message, or None if its length
+        # indicator has not been received yet
+        if self._buffered() < 4:
+            return None
+        length = struct.unpack_from('>i', self.inbuf, self.inoffset)[0]
+        if length < 0:
+            raise RuntimeError('invalid message length')
+        if length > self.max_message:
+            raise RuntimeError('message too long: %i bytes' % length)
+        return length
+
+    def _read_limit(self):
+        # Number of buffered bytes at which reading stops. A single message
+        # longer than high_water is still received completely.
+        high_water = self.high_water
+        if high_water is None:
+            high_water = self.FILL_LIMIT
+        length = self._frame_length()
+        if length is None:
+            return high_water
+        return max(high_water, length + 4)
+
+    def wants_write(self):
+        """Check if the connection has data waiting to be written"""
+        if self.handshaking:
+            return self.handshake_wants_write
+        return self.outbytes > 0
+
+    def idle(self, now=None):
+        """Return the number of seconds since the last read or write"""
+        return (time.time() if now is None else now) - self.last_active
+
+    def throttle_delay(self, now=None):
+        """Return the number of seconds until a throttled connection may
+        issue its next request"""
+        if not self.throttled:
+            return 0.0
+        return self.bucket.delay(now)
+
+    def charge(self, count):
+        """Charge count additional tokens for the current request, which
+        delays the next requests if the rate is exceeded"""
+        if self.bucket is not None and count > 0:
+            self.bucket.charge(count)
+
+    def handshake(self):
+        """Continue the TLS handshake without blocking.
+
+        Returns True once the handshake has completed.
+        """
+        if not self.handshaking:
+            return True
+        try:
+            self.sock.do_handshake()
+        except ssl.SSLError, e:
+            if e.args[0] == ssl.SSL_ERROR_WANT_READ:
+                self.handshake_wants_write = False
+                return False
+            if e.args[0] == ssl.SSL_ERROR_WANT_WRITE:
+                self.handshake_wants_write = True
+                return False
+            raise
+        self.handshaking = False
+        self.handshake_wants_write = False
+        self.last_active = time.time()
+        return True
+
+    def fill(self):
+        """Read the data that is currently available from the socket, up to
+        FILL_LIMIT bytes, and as long as the buffer is below its limit.
+
+        Raises a RuntimeError if the other side has closed the connection, or
+        announced a message longer than max_message.
+        """
+        if not self.handshake():
+            return
+        received = 0
+        while received < self.FILL_LIMIT and \
+                self._buffered() < self._read_limit():
+            try:
+                data = self.sock.recv(self.RECV_BUFFER)
+            except (socket.error, ssl.SSLError), e:
+                if _would_block(e):
+                    return
+                raise
+            if data == b'':
+                raise RuntimeError('unexpected connection close')
+            self.inbuf += data
+            received += len(data)
+            self.last_active = time.time()
+
+    def next_frame(self):
+        """Return the payload of the next complete message.
+
+        Returns None if no complete message has been received yet, if the
+        connection is paused because too many replies are queued, if it is
+        busy processing an earlier request, or if it has exceeded its rate
+        limit. In the latter case, throttled is set.
+        """
+        if self.paused or self.busy or self.throttled:
+            return None
+        # Messages are prefixed with a 4-byte length indicator
+        length = self._frame_length()
+        if length is None or self._buffered() < length + 4:
+            return None
+        if self.bucket is not None and not self.bucket.consume():
+            self.throttled = True
+            return None
+        start = self.inoffset + 4
+        frame = str(self.inbuf[start:start + length])
+        self.inoffset = start + length
+        # Drop the handed out bytes once they make up most of the buffer, so
+        # that every byte is moved a bounded number of times
+        if self.inoffset * 2 >= len(self.inbuf):
+            del self.inbuf[:self.inoffset]
+            self.inoffset = 0
+        return frame
+
+    def send(self, data):
+        """Queue data to be written once the socket becomes writable"""
+        if not data:
+            return
+        self.outbuf.append(data)
+        self.outbytes += len(data)
+        if self.high_water is not None and self.outbytes >= self.high_water:
+            self.paused = True
+
+    def flush(self):
+        """Write as much of the queued data as the socket accepts right now.
+
+        Returns True if the queue has been drained completely.
+        """
+        if not self.handshake():
+            return False
+        while self.outbuf:
+            view = memoryview(self.outbuf[0])
+            chunk = view[self.outoffset:self.outoffset + self.SEND_CHUNK]
+            try:
+                sent = self.sock.send(chunk)
+            except (socket.error, ssl.SSLError), e:
+                if _would_block(e):
+                    break
+                raise
+            self.outoffset += sent
+            self.outbytes -= sent
+            self.last_active = time.time()
+            if self.outoffset >= len(view):
+                self.outbuf.popleft()
+                self.outoffset = 0
+        if self.paused and self.outbytes <= self.low_water:
+            self.paused = False
+        return self.outbytes == 0
+
+    def close(self):
+        """Close the underlying socket and drop all queued data"""
+        self.outbuf.clear()
+        self.outbytes = 0
+        # Shut the socket down explicitly, so the client is notified even if
+        # some lingering reference (e.g. in a traceback) keeps it alive
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except (socket.error, ssl.SSLError):
+            pass
+        self.sock.close()
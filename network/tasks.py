@@ -0,0 +1,192 @@
+# -*- encoding: utf-8 -*-
+"""Minimal asynchronous task support for the select() loop.
+
+Handlers that need to wait for work done elsewhere (e.g. in a process pool)
+are written as generators: They yield a Future and are resumed with its
+result once it is available, while the main loop keeps serving other
+connections. As Python 2 generators cannot return a value, they finish by
+raising Return(value).
+
+    @coroutine
+    def handler(msg):
+        valid = yield pool.verify(msg)
+        raise Return(valid)
+
+Futures are always resolved on the thread running the main loop. Work that
+completes on other threads hands its result to the loop through a
+Dispatcher, which wakes up select() via a self-pipe.
+"""
+import errno
+import fcntl
+import os
+import threading
+from collections import deque
+
+
+class Return(Exception):
+    """Raised by a coroutine to finish with a result"""
+
+    def __init__(self, value=None):
+        Exception.__init__(self)
+        self.value = value
+
+
+class Future():
+    """The result of an operation that may not have completed yet"""
+
+    def __init__(self):
+        self._done = False
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        """Check if the result or an exception has been set"""
+        return self._done
+
+    def result(self):
+        """Return the result, or raise the exception of the operation"""
+        if not self._done:
+            raise RuntimeError("Future is not done yet")
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def add_done_callback(self, fn):
+        """Call fn with the future once it is done"""
+        if self._done:
+            fn(self)
+        else:
+            self._callbacks.append(fn)
+
+    def set_result(self, result):
+        """Mark the future as done and set its result"""
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exception):
+        """Mark the future as done and set an exception"""
+        self._exception = exception
+        self._finish()
+
+    def _finish(self):
+        if self._done:
+            raise RuntimeError("Future is already done")
+        self._done = True
+        callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+
+def resolved(value):
+    """Return a Future that already holds the given result"""
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class Task(Future):
+    """Drive a generator, resuming it whenever a yielded Future is done"""
+
+    def __init__(self, gen):
+        Future.__init__(self)
+        self._gen = gen
+        self._step(None, None)
+
+    def _step(self, value, exception):
+        # Resume the generator until it yields a Future that is not done
+        # yet. Futures that are already done are handled in this loop rather
+        # than through their callbacks, so the stack does not grow with
+        # every one of them.
+        while True:
+            try:
+                if exception is not None:
+                    future = self._gen.throw(exception)
+                else:
+                    future = self._gen.send(value)
+            except Return, r:
+                self.set_result(r.value)
+                return
+            except StopIteration:
+                self.set_result(None)
+                return
+            except Exception, e:
+                self.set_exception(e)
+                return
+            if not future.done():
+                future.add_done_callback(self._wakeup)
+                return
+            try:
+                value, exception = future.result(), None
+            except Exception, e:
+                value, exception = None, e
+
+    def _wakeup(self, future):
+        try:
+            value = future.result()
+        except Exception, e:
+            self._step(None, e)
+        else:
+            self._step(value, None)
+
+
+def coroutine(fn):
+    """Decorator turning a generator function into one returning a Task"""
+    def wrapper(*args, **kwargs):
+        return Task(fn(*args, **kwargs))
+    wrapper.__name__ = fn.__name__
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
+
+
+class Dispatcher():
+    """Run callbacks scheduled from other threads on the main loop.
+
+    The Dispatcher is selectable: It becomes readable whenever callbacks are
+    waiting, at which point the main loop should call run().
+    """
+
+    def __init__(self):
+        self._callbacks = deque()
+        self._lock = threading.Lock()
+        self._rfd, self._wfd = os.pipe()
+        for fd in (self._rfd, self._wfd):
+            _setNonblocking(fd)
+
+    def fileno(self):
+        """Return the read end of the wakeup pipe, allowing select() calls"""
+        return self._rfd
+
+    def call_soon_threadsafe(self, fn, *args):
+        """Schedule fn(*args) to be run by the main loop"""
+        with self._lock:
+            self._callbacks.append((fn, args))
+        try:
+            os.write(self._wfd, b'x')
+        except OSError, e:
+            # A full pipe already guarantees a wakeup
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def run(self):
+        """Run all callbacks that have been scheduled so far"""
+        try:
+            while os.read(self._rfd, 4096):
+                pass
+        except OSError, e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+        with self._lock:
+            callbacks, self._callbacks = self._callbacks, deque()
+        for fn, args in callbacks:
+            fn(*args)
+
+    def close(self):
+        """Close the wakeup pipe"""
+        os.close(self._rfd)
+        os.close(self._wfd)
+
+
+def _setNonblocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
@@ -0,0 +1,375 @@
+"""Test cases for the networking helpers.
+
+These test cases are run with "nosetests".
+"""
+import select
+import socket
+import struct
+import threading
+
+from admission import AdmissionControl, TokenBucket
+from cluster import Supervisor, encodeEvent, decodeEvent, eventLink, \
+    EVENT_INSERT, EVENT_REMOVE
+from connection import Connection
+from tasks import Dispatcher, Future, Return, coroutine, resolved
+
+"""Helper functions"""
+
+
+def getConnection(high_water=1024, low_water=256):
+    server, client = socket.socketpair()
+    return Connection(server, ("local", 0), high_water, low_water), client
+
+
+def frame(payload):
+    return struct.pack(">i", len(payload)) + payload
+
+"""Framing tests"""
+
+
+def test_next_frame_complete():
+    conn, client = getConnection()
+    client.sendall(frame("hello") + frame("world"))
+    conn.fill()
+    assert conn.next_frame() == "hello"
+    assert conn.next_frame() == "world"
+    assert conn.next_frame() is None
+
+
+def test_next_frame_partial():
+    conn, client = getConnection()
+    data = frame("hello")
+    client.sendall(data[:6])
+    conn.fill()
+    assert conn.next_frame() is None
+    client.sendall(data[6:])
+    conn.fill()
+    assert conn.next_frame() == "hello"
+
+
+def test_next_frame_too_long():
+    conn, client = getConnection()
+    conn.max_message = 16
+    client.sendall(frame("a" * 16) + struct.pack(">i", 17) + "b" * 17)
+    conn.fill()
+    assert conn.next_frame() == "a" * 16
+    try:
+        conn.next_frame()
+        assert False, "Overlong message was accepted"
+    except RuntimeError:
+        pass
+
+
+def test_fill_stops_at_high_water():
+    conn, client = getConnection(high_water=1024, low_water=256)
+    client.sendall(frame("a" * 600) * 4)
+    conn.fill()
+    # Reading stops once high_water bytes are buffered
+    assert 1024 <= conn._buffered() < 2 * 1024 + Connection.RECV_BUFFER
+    assert not conn.wants_read()
+    assert conn.next_frame() == "a" * 600
+    frames = []
+    while len(frames) < 3:
+        conn.fill()
+        frame_ = conn.next_frame()
+        while frame_ is not None:
+            frames.append(frame_)
+            frame_ = conn.next_frame()
+    assert frames == ["a" * 600] * 3
+    assert conn._buffered() == 0
+
+
+def test_fill_receives_message_above_high_water():
+    conn, client = getConnection(high_water=1024, low_water=256)
+    client.sendall(frame("a" * 5000))
+    payload = None
+    while payload is None:
+        assert conn.wants_read()
+        conn.fill()
+        payload = conn.next_frame()
+    assert payload == "a" * 5000
+
+
+def test_fill_reads_bounded_amount():
+    conn, client = getConnection(high_water=1 << 20, low_water=256)
+    client.setblocking(0)
+    try:
+        client.sendall(frame("a" * 200000))
+    except socket.error:
+        pass
+    conn.fill()
+    assert conn._buffered() <= Connection.FILL_LIMIT
+
+
+def test_fill_closed():
+    conn, client = getConnection()
+    client.close()
+    try:
+        conn.fill()
+    except RuntimeError:
+        assert True
+        return
+    assert False
+
+"""Write queue tests"""
+
+
+def test_flush():
+    conn, client = getConnection()
+    conn.send(frame("reply"))
+    assert conn.wants_write()
+    assert conn.flush()
+    assert not conn.wants_write()
+    assert client.recv(100) == frame("reply")
+
+
+def test_backpressure_pauses_reading():
+    conn, client = getConnection(high_water=1024, low_water=256)
+    client.sendall(frame("request"))
+    conn.fill()
+    conn.send("x" * 2048)
+    assert conn.paused
+    assert not conn.wants_read()
+    # Paused connections do not hand out requests
+    assert conn.next_frame() is None
+    assert conn.flush()
+    assert not conn.paused
+    assert conn.next_frame() == "request"
+
+
+def test_backpressure_hysteresis():
+    conn, client = getConnection(high_water=1024, low_water=256)
+    conn.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    # Queue a lot more than the socket buffers can take
+    conn.send("x" * 1024 * 1024)
+    conn.flush()
+    # The client did not read anything, so the connection stays paused
+    assert conn.wants_write()
+    assert conn.paused
+
+
+def test_invalid_watermarks():
+    server, client = socket.socketpair()
+    try:
+        Connection(server, ("local", 0), high_water=10, low_water=100)
+    except ValueError:
+        assert True
+        return
+    assert False
+
+
+def test_throttled_connection_keeps_requests():
+    conn, client = getConnection()
+    conn.bucket = TokenBucket(1, 1)
+    client.sendall(frame("first") + frame("second"))
+    conn.fill()
+    assert conn.next_frame() == "first"
+    assert conn.next_frame() is None
+    assert conn.throttled
+    assert not conn.wants_read()
+    assert conn.throttle_delay() > 0
+    # Once the bucket has been refilled, the request is handed out
+    conn.bucket.tokens = 1
+    conn.throttled = False
+    assert conn.next_frame() == "second"
+
+
+def test_charged_connection_is_throttled():
+    conn, client = getConnection()
+    conn.bucket = TokenBucket(1, 10)
+    client.sendall(frame("batch") + frame("next"))
+    conn.fill()
+    assert conn.next_frame() == "batch"
+    # The batch costs as many tokens as the bucket holds
+    conn.charge(9)
+    assert conn.next_frame() is None
+    assert conn.throttled
+
+
+def test_idle():
+    conn, client = getConnection()
+    conn.last_active -= 10
+    assert conn.idle() >= 10
+    client.sendall(frame("request"))
+    conn.fill()
+    assert conn.idle() < 10
+
+"""Admission control tests"""
+
+
+def test_token_bucket_burst_and_refill():
+    bucket = TokenBucket(2, 3)
+    now = bucket.stamp
+    assert bucket.consume(now)
+    assert bucket.consume(now)
+    assert bucket.consume(now)
+    assert not bucket.consume(now)
+    assert bucket.delay(now) == 0.5
+    assert bucket.consume(now + 0.5)
+    # The bucket never holds more than burst tokens
+    assert bucket.delay(now + 100) == 0
+    assert bucket.tokens == 3
+
+
+def test_token_bucket_charge():
+    bucket = TokenBucket(2, 3)
+    now = bucket.stamp
+    # Charges beyond the tokens in the bucket are paid off by refills
+    bucket.charge(5, now)
+    assert not bucket.consume(now)
+    assert bucket.delay(now) == 1.5
+    assert bucket.consume(now + 1.5)
+
+
+def test_admission_limits_per_source():
+    admission = AdmissionControl(max_connections=3, max_per_source=2)
+    assert admission.admit("10.0.0.1")
+    assert admission.admit("10.0.0.1")
+    assert not admission.admit("10.0.0.1")
+    assert admission.admit("10.0.0.2")
+    # The total limit applies to all sources
+    assert not admission.admit("10.0.0.3")
+    assert admission.refused == 2
+    admission.release("10.0.0.1")
+    assert admission.admit("10.0.0.3")
+    assert admission.total == 3
+
+
+def test_admission_unlimited():
+    admission = AdmissionControl()
+    for i in range(1000):
+        assert admission.admit("10.0.0.1")
+    for i in range(1000):
+        admission.release("10.0.0.1")
+    assert admission.total == 0
+    assert admission.sources == {}
+
+"""Cluster event tests"""
+
+
+def test_event_roundtrip():
+    conn, client = getConnection()
+    client.sendall(encodeEvent(EVENT_INSERT, "k" * 32))
+    client.sendall(encodeEvent(EVENT_REMOVE, "k" * 32))
+    conn.fill()
+    assert decodeEvent(conn.next_frame()) == (EVENT_INSERT, "k" * 32)
+    assert decodeEvent(conn.next_frame()) == (EVENT_REMOVE, "k" * 32)
+    assert conn.next_frame() is None
+
+
+def test_event_links_do_not_pause():
+    ends = [eventLink(sock, ("local", 0)) for sock in socket.socketpair()]
+    count = 40000
+    for end in ends:
+        for i in range(count):
+            end.send(encodeEvent(EVENT_INSERT, "k" * 32))
+    # More than high_water bytes are queued in both directions, but both
+    # ends keep receiving the events of the other one
+    received = [0, 0]
+    for attempt in range(10000):
+        if received == [count, count]:
+            break
+        for index, end in enumerate(ends):
+            end.flush()
+            end.fill()
+            while end.next_frame() is not None:
+                received[index] += 1
+    assert received == [count, count]
+    assert not any(end.paused for end in ends)
+
+
+def test_supervisor_relays_to_other_workers():
+    events = []
+    sup = Supervisor(2, None, on_event=lambda op, key: events.append(op))
+    links = {}
+    for pid in (1, 2):
+        parent, child = socket.socketpair()
+        sup.workers[pid] = eventLink(parent, ("worker", pid))
+        links[pid] = child
+    sup._relay(1, EVENT_INSERT + "k" * 32)
+    for link in sup.workers.values():
+        link.flush()
+    assert events == [EVENT_INSERT]
+    received = eventLink(links[2], ("supervisor", 0))
+    received.fill()
+    assert decodeEvent(received.next_frame()) == (EVENT_INSERT, "k" * 32)
+    links[1].setblocking(0)
+    try:
+        links[1].recv(100)
+    except socket.error:
+        # The sender does not receive its own event
+        assert True
+        return
+    assert False
+
+"""Task tests"""
+
+
+def test_task_resumes_with_result():
+    pending = Future()
+
+    @coroutine
+    def handler():
+        value = yield pending
+        raise Return(value + 1)
+    task = handler()
+    assert not task.done()
+    pending.set_result(41)
+    assert task.result() == 42
+
+
+def test_task_propagates_exception():
+    pending = Future()
+
+    @coroutine
+    def handler():
+        yield pending
+    task = handler()
+    pending.set_exception(ValueError("bad key"))
+    try:
+        task.result()
+    except ValueError:
+        assert True
+        return
+    assert False
+
+
+def test_task_without_waiting():
+    @coroutine
+    def handler():
+        yield resolved(1)
+        raise Return("done")
+    assert handler().result() == "done"
+
+
+def test_task_many_resolved_futures():
+    @coroutine
+    def handler():
+        total = 0
+        for i in xrange(10000):
+            total += yield resolved(1)
+        try:
+            yield failed
+        except ValueError:
+            total += 1
+        raise Return(total)
+    failed = Future()
+    failed.set_exception(ValueError("bad key"))
+    # Futures that are already done must not deepen the stack
+    assert handler().result() == 10001
+
+
+def test_dispatcher_runs_callbacks_from_threads():
+    dispatcher = Dispatcher()
+    future = Future()
+    thread = threading.Thread(target=dispatcher.call_soon_threadsafe,
+                              args=(future.set_result, "result"))
+    thread.start()
+    thread.join()
+    readable, _, _ = select.select([dispatcher], [], [], 1)
+    assert readable == [dispatcher]
+    assert not future.done()
+    dispatcher.run()
+    assert future.result() == "result"
+    dispatcher.close()
@@ -8,27 +8,47 @@
 # The NFCGate server code code was in turn inspired by
 # http://www.binarytides.com/code-chat-application-server-client-sockets-python
 
+import argparse
+import errno
+import os
 import select
+import signal
 import socket
 import ssl
 import struct
 import sys
+import time
 import zlib
 
-from messages.c2s_pb2 import ServerHello, StoreReply, DeleteReply, GetReply
+from messages.c2s_pb2 import ServerHello, StoreReply, DeleteReply, GetReply, MultiStoreReply, MultiGetReply, MultiDeleteReply
 from messages.metaMessage_pb2 import Wrapper
 from messages.studyMessage_pb2 import StudyCreate, StudyCreateReply, StudyDelete, StudyDeleteReply, StudyWrapper, StudyJoinQuery, StudyJoinQueryReply, StudyListQuery, StudyListReply
+from network.admission import AdmissionControl, TokenBucket
+from network.cluster import Supervisor, createReusePortSocket, encodeEvent, decodeEvent, EVENT_INSERT, EVENT_REMOVE, EVENT_STUDY_CREATE, EVENT_STUDY_DELETE
+from network.connection import Connection
+from storage.executor import StorageExecutor
+from storage.groupcommit import GroupCommitter
+from storage.logkv import LogBackend
+from storage.memory import MemoryBackend
+from storage.pool import ConnectionPool
+from storage.sharded import ShardedBackend
+from storage.keyindex import KeyIndex
 from storage.sqlite import SqliteBackend
+from storage.valuecache import ValueCache
 from vicbf.vicbf import VICBF
 from hashlib import sha256
-from Crypto.PublicKey import RSA
-from Crypto.Hash import SHA256
-from Crypto.Signature import PKCS1_v1_5
+from network.tasks import Dispatcher, Future, Return, coroutine
+from verification.keycache import KeyCache
+from verification.pkcs1 import SignatureVerifier
 
 
 class Cache():
     def __init__(self):
         self.vicbfcache = None
+        self.hellocache = None
+        self.studylistcache = None
+        # Incremented whenever the study list changes
+        self.studylistversion = 0
 
     def getVicbfCache(self):
         if self.vicbfcache is not None:
@@ -40,23 +60,201 @@ class Cache():
             self.vicbfcache = zlib.compress(serialized, 6)
             return self.vicbfcache
 
+    def getServerHelloCache(self):
+        if self.hellocache is not None:
+            debug("Cache hit")
+            return self.hellocache
+        else:
+            debug("Cache miss")
+            self.hellocache = frameServerHello(self.getVicbfCache())
+            return self.hellocache
+
     def invalidateVicbf(self):
         debug("Cache invalidated")
         self.vicbfcache = None
+        self.hellocache = None
+
+    def getStudyListCache(self):
+        # Returns None on a cache miss, the list has to be read and put into
+        # the cache then
+        if self.studylistcache is not None:
+            debug("Cache hit")
+        else:
+            debug("Cache miss")
+        return self.studylistcache
+
+    def putStudyListCache(self, studies, version):
+        # Frame the studies read at the given version of the list. They are
+        # only cached if the list has not changed while they were read.
+        framed = frameStudyList(str(message) for dbid, message in studies)
+        if version == self.studylistversion:
+            self.studylistcache = framed
+        return framed
+
+    def invalidateStudyList(self):
+        debug("Cache invalidated")
+        self.studylistcache = None
+        self.studylistversion += 1
 
 
 HOST = "0.0.0.0"
 PORT = 5566
 
+# Number of worker processes. Can be overridden with --workers.
+WORKERS = 1
+
 DEBUG = True
 
 DatabaseBackend = None
+# Storage backend of the key-value pairs: "sqlite" keeps them in the SQLite
+# database with the studies, "log" in the segment files of a LogBackend in
+# LOG_DIRECTORY, "memory" only in memory, with the studies (for benchmarks),
+# "sharded" in DB_SHARDS SQLite databases next to the one of the studies.
+# Can be set with --backend and --shards.
+BACKEND = "sqlite"
+LOG_DIRECTORY = "denul.kv"
+DB_SHARDS = 4
+# Future of the running round of storage maintenance
+Maintenance = None
+# Seconds after their insertion at which key-value pairs expire, 0 to keep
+# them until they are deleted. Expired pairs are deleted by the periodic
+# sweep, at most EXPIRE_BATCH_SIZE per transaction. Can be set with
+# --key-ttl-days.
+KEY_TTL = 0
+EXPIRE_BATCH_SIZE = 1000
+# Future of the running expiry sweep, and the number of pairs it has deleted
+Expiry = None
+ExpiredKeys = 0
+# Runs the calls to the database backend on a storage thread, so that slow
+# queries and commits do not stall the main loop. Handlers call the backend
+# through it, e.g. "value = yield Storage.query_kv(key)".
+STORAGE_THREAD = True
+Storage = None
+# Number of read-only connections to the database, and of reader threads
+# checking them out. Gets and study list queries are spread over them,
+# concurrently with the writes on the storage thread. DB_READERS = 0 makes all
+# calls on the storage thread. Can be overridden with --db-readers and
+# --read-threads.
+DB_READERS = 2
+READ_THREADS = 4
+ReadPool = None
+
+# SQLite settings. With write-ahead logging, readers and the writer do not
+# block each other, and commits only append to the log. DB_SYNCHRONOUS can be
+# overridden with --synchronous; "normal" is faster, but commits may be lost
+# on power failure (not on crashes of the server).
+DB_JOURNAL_MODE = "wal"
+DB_SYNCHRONOUS = "full"
+DB_CACHE_SIZE = -16384  # 16 MiB
+DB_MMAP_SIZE = 256 * 1024 * 1024
+
+# Writes are committed in groups of up to GROUP_COMMIT_SIZE writes, at most
+# GROUP_COMMIT_DELAY seconds after the first of them. Replies are only sent
+# once the write has been committed. GROUP_COMMIT_DELAY can be overridden with
+# --group-commit-ms, 0 commits every write on its own.
+GROUP_COMMIT_SIZE = 256
+GROUP_COMMIT_DELAY = 0.005
+Committer = None
+
+# Maximum number of queued join messages returned in one StudyJoinQueryReply.
+# Clients fetch further messages by passing the cursor of the reply in their
+# next query. Queries without a page size get this many messages, queries
+# with a larger one are capped to it. Can be overridden with
+# --join-page-size.
+JOIN_PAGE_SIZE = 100
+
+# Largest cursor passed to the database. Cursors are uint64 in the protocol,
+# SQLite integers are signed 64-bit; larger cursors are past every row anyway.
+MAX_CURSOR = 2 ** 63 - 1
+
+# Maximum number of studies returned in one StudyListReply, if the client
+# asks for pages. Can be overridden with --study-page-size.
+STUDY_LIST_PAGE_SIZE = 50
 
 VicbfBackend = None
 VicbfCache = Cache()
 
+# Maximum number of items processed per MultiStore, MultiGet or MultiDelete
+# request. Further items are answered with a *_FAIL_UNKNOWN code.
+MAX_BATCH_SIZE = 500
+
+# Exact in-memory set of the stored keys. If enabled with --key-index, it
+# decides whether keys exist for Store, Get and Delete requests. Otherwise,
+# the VICBF rules out most keys that do not exist, and the database decides.
+KEY_INDEX = False
+Keys = None
+
+# Number of well-formed Get requests, and of those answered without a database
+# lookup because the key does not exist
+GetStatistics = {"requests": 0, "filtered": 0}
+
+# Total size in bytes of the stored values to cache for Get requests, 0 to
+# disable the cache. Can be overridden with --value-cache-mb.
+VALUE_CACHE_SIZE = 64 * 1024 * 1024
+Values = None
+
+# Field numbers used to build StudyListReply and ServerHello messages
+# without protobuf
+STUDYLIST_FIELD = StudyListReply.DESCRIPTOR.fields_by_name["studylist"].number
+WRAPPER_STUDYLISTREPLY_FIELD = \
+    Wrapper.DESCRIPTOR.fields_by_name["StudyListReply"].number
+SERVERHELLO_DATA_FIELD = ServerHello.DESCRIPTOR.fields_by_name["data"].number
+WRAPPER_SERVERHELLO_FIELD = \
+    Wrapper.DESCRIPTOR.fields_by_name["ServerHello"].number
+
 THRESH_UP = None
 
+# Connections with more than HIGH_WATER bytes of queued replies are not read
+# from until the queue has been drained to LOW_WATER bytes or less
+HIGH_WATER = 1024 * 1024
+LOW_WATER = 256 * 1024
+# Clients announcing a longer message are dropped. Buffered requests beyond
+# HIGH_WATER bytes are left in the kernel, unless they form a single message.
+MAX_MESSAGE_SIZE = 4 * 1024 * 1024
+
+CONNECTION_LIST = []  # list of client connections
+
+# Connections without any traffic for IDLE_TIMEOUT seconds are closed, 0 to
+# keep them open forever. This includes connections that never complete their
+# TLS handshake. Can be overridden with --idle-timeout.
+IDLE_TIMEOUT = 300
+# Interval in seconds at which connections are checked for idle timeouts,
+# and the storage backend is asked to do some maintenance
+IDLE_SWEEP_INTERVAL = 1.0
+
+# Maximum number of client connections (per worker), and per source address.
+# Further connections are closed right after accepting them, before spending
+# any time on a TLS handshake. select() cannot handle descriptors above 1024,
+# so the total should stay well below that. Can be overridden with
+# --max-connections and --max-per-source, 0 disables the limit.
+MAX_CONNECTIONS = 900
+MAX_CONNECTIONS_PER_SOURCE = 64
+Admission = None
+
+# Requests per second a single connection may issue on average, and the
+# number of requests it may issue in a burst. Connections exceeding the rate
+# are not read from until they are allowed another request. Can be overridden
+# with --request-rate, 0 disables the limit.
+REQUEST_RATE = 50
+REQUEST_BURST = 100
+
+# Event channel to the supervisor. Only set in multi-worker mode.
+ClusterLink = None
+
+# Number of processes verifying study signatures in the background. If 0,
+# signatures are verified on the main loop. Can be overridden with
+# --verify-processes.
+VERIFY_PROCESSES = 2
+
+# Number of parsed study public keys to cache
+KEY_CACHE_SIZE = 1024
+StudyKeys = KeyCache(KEY_CACHE_SIZE)
+
+# Runs callbacks of background work on the main loop
+TaskDispatcher = None
+# Verifies study signatures in the background
+Verifier = None
+
 
 ### Logging helper functions
 def debug(strng):
@@ -70,43 +268,288 @@ def debug(strng):
         print sys._getframe(1).f_code.co_name + ":", strng
 
 
+def logStatistics(signum=None, frame=None):
+    """Print cache statistics. Installed as handler for SIGUSR1."""
+    print "Study key cache: %(size)i keys, %(hits)i hits, %(misses)i misses" \
+        % StudyKeys.stats()
+    if Committer is not None:
+        print "Group commit: %(writes)i writes in %(commits)i commits" \
+            % Committer.stats()
+    if DatabaseBackend is not None and DatabaseBackend.stats():
+        print "Storage backend: " + ", ".join(
+            "%s %s" % item for item in sorted(DatabaseBackend.stats().items()))
+    if Storage is not None:
+        print "Storage: %(calls)i calls, %(pending)i pending, %(wait).2f ms " \
+            "waiting and %(busy).2f ms running on average" % Storage.stats()
+    if ReadPool is not None:
+        print "Read pool: %(size)i connections, %(checkouts)i checkouts, " \
+            "%(waits)i waited, %(wait).2f ms waiting on average" \
+            % ReadPool.stats()
+    if Admission is not None:
+        print "Connections: %i open, %i refused" % (Admission.total,
+                                                   Admission.refused)
+    print "Get: %(filtered)i of %(requests)i requests answered without the " \
+        "database" % GetStatistics
+    if KEY_TTL > 0:
+        print "Expiry: %i keys expired" % ExpiredKeys
+    if Keys is not None:
+        print "Key index: %(size)i keys, %(slots)i slots, %(bytes)i bytes" \
+            % Keys.stats()
+    if Values is not None:
+        stats = Values.stats()
+        stats["ratio"] *= 100
+        print "Value cache: %(size)i values, %(bytes)i bytes, %(hits)i hits, " \
+            "%(misses)i misses (%(ratio).1f%% hits), %(evictions)i " \
+            "evictions" % stats
+
+
 ### Network helper functions
-def SocketReadN(sock, n):
-    buf = b''
-    while n > 0:
-        data = sock.recv(n)
-        if data == b'':
-            raise RuntimeError('unexpected connection close')
-        buf += data
-        n -= len(data)
-    return buf
-
-
-def RecvOneMsg(sock):
-    # Messages are prefixed with a 4-byte length indicator
-    lengthbuf = SocketReadN(sock, 4)
-    length = struct.unpack('>i', lengthbuf)[0]
+def ParseMessage(frame):
+    # Parse the payload of a length-prefixed message into a Wrapper
     wrapper = Wrapper()
     try:
-        wrapper.ParseFromString(SocketReadN(sock, length))
+        wrapper.ParseFromString(frame)
     except Exception, e:
-        debug("ERROR: Message parsing failed: " + e)
+        debug("ERROR: Message parsing failed: " + repr(e))
         wrapper = None
     return wrapper
 
 
-def sendMessage(msg, sock):
+def encodeVarint(value):
+    # Encode a non-negative integer as a protobuf varint
+    rv = ""
+    while value > 0x7f:
+        rv += chr(0x80 | (value & 0x7f))
+        value >>= 7
+    return rv + chr(value)
+
+
+def encodeFieldHeader(number, length):
+    # Encode the tag and length of a length-delimited protobuf field
+    return encodeVarint(number << 3 | 2) + encodeVarint(length)
+
+
+def encodeLengthDelimited(number, data):
+    # Encode bytes as a length-delimited protobuf field
+    return encodeFieldHeader(number, len(data)) + data
+
+
+def frameStudyList(messages):
+    # Build the framed Wrapper of a StudyListReply from serialized
+    # StudyWrapper messages. The messages are spliced in as they are, which
+    # yields the same bytes as parsing them into a StudyListReply and
+    # serializing it.
+    reply = "".join(encodeLengthDelimited(STUDYLIST_FIELD, message)
+                    for message in messages)
+    wrapper = encodeLengthDelimited(WRAPPER_STUDYLISTREPLY_FIELD, reply)
+    return struct.pack(">i", len(wrapper)) + wrapper
+
+
+def frameServerHello(data):
+    # Build the framed Wrapper of a successful ServerHello carrying the given
+    # VICBF serialization. The serialization is the last field of the
+    # ServerHello, so it is appended as it is and only copied once, into the
+    # finished frame.
+    hello = ServerHello()
+    hello.opcode = ServerHello.CLIENT_HELLO_OK
+    hello.serverProto = "1.0"
+    head = hello.SerializePartialToString()
+    head += encodeFieldHeader(SERVERHELLO_DATA_FIELD, len(data))
+    wrapper = encodeFieldHeader(WRAPPER_SERVERHELLO_FIELD,
+                                len(head) + len(data))
+    length = len(wrapper) + len(head) + len(data)
+    return "".join((struct.pack(">i", length), wrapper, head, data))
+
+
+def sendMessage(msg, conn):
     if msg is None:
         return
+    if isinstance(msg, str):
+        # Already serialized and framed
+        conn.send(msg)
+        debug("Message queued")
+        return
     ms = msg.SerializeToString()
     # mb = [elem.encode('hex') for elem in ms]
-    # Messages are sent as byte strings prefixed with their own length
-    sock.sendall(struct.pack(">i", len(ms)) + ms)
-    debug("Message sent")
+    # Messages are sent as byte strings prefixed with their own length. They
+    # are only queued here and written out once the socket becomes writable.
+    conn.send(struct.pack(">i", len(ms)) + ms)
+    debug("Message queued")
+
+
+def ProcessConnection(conn):
+    # Handle all complete messages the connection has buffered. Stops early if
+    # the connection gets paused because too many replies are queued, or if a
+    # handler has to wait for a result that is computed in the background.
+    frame = conn.next_frame()
+    while frame is not None:
+        wrapperMsg = ParseMessage(frame)
+        if wrapperMsg:
+            reply = HandleMessage(wrapperMsg, conn)
+            if isinstance(reply, Future) and not reply.done():
+                # Continue with this connection once the reply is ready
+                conn.busy = True
+                reply.add_done_callback(
+                    lambda future: ResumeConnection(conn, future))
+                return
+            elif isinstance(reply, Future):
+                reply = reply.result()
+            sendMessage(reply, conn)
+        frame = conn.next_frame()
+
+
+def ResumeConnection(conn, future):
+    # Send the reply of an asynchronous handler and continue processing the
+    # requests the connection has buffered in the meantime
+    if conn not in CONNECTION_LIST:
+        # The client has disconnected in the meantime
+        return
+    conn.busy = False
+    try:
+        sendMessage(future.result(), conn)
+        ProcessConnection(conn)
+        conn.flush()
+    except Exception, e:
+        DropConnection(conn, e)
+
+
+def DropConnection(conn, reason):
+    print "Client (%s, %s) is offline: %s" % (conn.addr[0], conn.addr[1],
+                                               reason)
+    try:
+        conn.close()
+    except Exception:
+        pass
+    CONNECTION_LIST.remove(conn)
+    Admission.release(conn.addr[0])
+
+
+def AcceptConnection(server_socket):
+    # Accept a new client, unless we are already serving too many
+    sockfd, addr = server_socket.accept()
+    if not Admission.admit(addr[0]):
+        # Close right away, so the client sees the refusal instead of waiting
+        # in the listen backlog
+        print "Client (%s, %s) refused: too many connections" % addr
+        sockfd.close()
+        return
+    # Wrap the socket in a SSL/TLS socket. The handshake is performed by the
+    # main loop, so a client that stalls it cannot block the server.
+    try:
+        socktls = ssl.wrap_socket(sockfd, server_side=True,
+                                  certfile="server.crt",
+                                  keyfile="server.key",
+                                  do_handshake_on_connect=False)
+    except Exception, e:
+        print "Client (%s, %s) failed handshake: %s" % (addr[0], addr[1], e)
+        sockfd.close()
+        Admission.release(addr[0])
+        return
+    # I'd love to make this a more secure instance of an SSL socket, but
+    # sadly, this would require python 2.7.9+, which is not yet available in
+    # the ubuntu repos I am using.
+    # Right now, the socket still allows SSLv3 and RC4 connections, which is
+    # horrible, but the alternative would be to only allow TLSv1 (and not
+    # v1.1 / v1.2), which would be bad form as well.
+    # Once a newer version of python is widely available, I may change the
+    # code to use an ssl.Context object with the correct settings for a
+    # secure socket.
+    bucket = None
+    if REQUEST_RATE > 0:
+        bucket = TokenBucket(REQUEST_RATE, REQUEST_BURST)
+    CONNECTION_LIST.append(Connection(socktls, addr, HIGH_WATER, LOW_WATER,
+                                      bucket, handshake=True,
+                                      max_message=MAX_MESSAGE_SIZE))
+    print "Client (%s, %s) connected" % addr
+
+
+def ResumeThrottledConnections(now):
+    # Continue processing connections whose rate limit allows another request
+    for conn in [c for c in CONNECTION_LIST if c.throttled]:
+        if conn.throttle_delay(now) > 0:
+            continue
+        conn.throttled = False
+        try:
+            ProcessConnection(conn)
+            conn.flush()
+        except Exception, e:
+            DropConnection(conn, e)
+
+
+def DropIdleConnections(now):
+    # Close connections that have been silent for too long. Connections
+    # waiting for background work are not idle, the wait is on our side.
+    for conn in [c for c in CONNECTION_LIST
+                 if not c.busy and c.idle(now) > IDLE_TIMEOUT]:
+        DropConnection(conn, "idle timeout")
+
+
+def RunMaintenance():
+    # Let the storage backend do some housekeeping on the storage thread, and
+    # delete expired pairs, unless the previous rounds are still running
+    global Maintenance, Expiry
+    if KEY_TTL > 0 and (Expiry is None or Expiry.done()):
+        Expiry = ExpireKeys()
+        Expiry.add_done_callback(MaintenanceDone)
+    if Maintenance is None or Maintenance.done():
+        Maintenance = Storage.maintenance()
+        Maintenance.add_done_callback(MaintenanceDone)
+
+
+@coroutine
+def ExpireKeys():
+    # Delete the pairs inserted more than KEY_TTL seconds ago, one batch per
+    # transaction, until none are left. Other calls to the storage thread are
+    # made in between.
+    global ExpiredKeys
+    while True:
+        keys = yield Storage.expire_kv(time.time() - KEY_TTL,
+                                       EXPIRE_BATCH_SIZE)
+        if not keys:
+            break
+        yield Committer.commit()
+        for key in keys:
+            Values.invalidate(key)
+            if Keys is not None:
+                Keys.discard(key)
+            try:
+                VicbfBackend.remove(key)
+            except ValueError:
+                debug("WARN: Expired key was not in VICBF")
+            publishClusterEvent(EVENT_REMOVE, key)
+        # Serialize the VICBF again once per batch, not per key
+        invalidateVicbfSerializationCache()
+        ExpiredKeys += len(keys)
+        if len(keys) < EXPIRE_BATCH_SIZE:
+            break
+
+
+def MaintenanceDone(future):
+    try:
+        future.result()
+    except Exception, e:
+        print "Storage maintenance failed: %r" % e
+
+
+def pollTimeout(now, next_sweep):
+    # Return how long select() may block before throttled connections have to
+    # be resumed, pending writes have to be committed or the next sweep is
+    # due.
+    timeout = None
+    delays = [c.throttle_delay(now) for c in CONNECTION_LIST if c.throttled]
+    commit = Committer.timeout(now)
+    if commit is not None:
+        delays.append(commit)
+    if delays:
+        timeout = min(delays)
+    remaining = max(next_sweep - now, 0)
+    if timeout is None or remaining < timeout:
+        timeout = remaining
+    return timeout
 
 
 ### Debugging helper functions
-def prettyPrintProtobuf(msg, sock):
+def prettyPrintProtobuf(msg, conn):
     pass  # TODO Reimplement
 
 
@@ -115,31 +558,108 @@ def getVicbfSerialization():
     return VicbfCache.getVicbfCache()
 
 
+def getServerHelloSerialization():
+    return VicbfCache.getServerHelloCache()
+
+
 def invalidateVicbfSerializationCache():
     VicbfCache.invalidateVicbf()
 
 
+### Helper function for the study list
+@coroutine
+def getStudyListSerialization():
+    framed = VicbfCache.getStudyListCache()
+    if framed is None:
+        version = VicbfCache.studylistversion
+        studies = yield Storage.list_studies()
+        framed = VicbfCache.putStudyListCache(studies, version)
+    raise Return(framed)
+
+
+def invalidateStudyListSerializationCache():
+    VicbfCache.invalidateStudyList()
+
+
+### Helper functions for multi-worker mode
+def publishClusterEvent(op, key):
+    # Inform the other workers about a change to the VICBF or the studies
+    if ClusterLink is not None:
+        ClusterLink.send(encodeEvent(op, key))
+
+
+def applyClusterEvent(op, key):
+    # Apply a change made by another worker
+    if op == EVENT_INSERT:
+        VicbfBackend.insert(key)
+        invalidateVicbfSerializationCache()
+        Values.invalidate(key)
+        if Keys is not None:
+            Keys.add(key)
+    elif op == EVENT_REMOVE:
+        Values.invalidate(key)
+        if Keys is not None:
+            Keys.discard(key)
+        try:
+            VicbfBackend.remove(key)
+        except ValueError:
+            debug("WARN: Removed key was not in VICBF")
+        invalidateVicbfSerializationCache()
+    elif op == EVENT_STUDY_CREATE:
+        # A key of an earlier study with this identifier may still be cached
+        StudyKeys.invalidate(key)
+        invalidateStudyListSerializationCache()
+    elif op == EVENT_STUDY_DELETE:
+        StudyKeys.invalidate(key)
+        invalidateStudyListSerializationCache()
+    else:
+        debug("WARN: Unknown cluster event " + repr(op))
+
+
+def ProcessClusterEvents():
+    # Apply all events the supervisor has relayed to us
+    ClusterLink.fill()
+    frame = ClusterLink.next_frame()
+    while frame is not None:
+        applyClusterEvent(*decodeEvent(frame))
+        frame = ClusterLink.next_frame()
+
+
+### Helper function for study keys
+@coroutine
+def getStudyVerifier(ident):
+    # Return a verifier for the public key of a study, or None if there is no
+    # such study. Parsed keys are cached, so researchers polling their study
+    # touch neither the database nor the key parser. Keys are parsed in the
+    # verification pool, and only cached if the study has not been deleted or
+    # created in the meantime.
+    verifier = StudyKeys.get(ident)
+    if verifier is None:
+        version = StudyKeys.version
+        pkey_bin = yield Storage.query_study_pkey(ident)
+        if pkey_bin is None:
+            raise Return(None)
+        verifier = yield Verifier.load(pkey_bin)
+        StudyKeys.put(ident, verifier, version)
+    raise Return(verifier)
+
+
 ### Format checker helper functions
 def keyFormatValid(key):
     return len(key) == 32
 
 
-def queueFormatValid(queue):
-    return len(queue) == 16
-
+def keyMayExist(key):
+    # Return False if the key is definitely not stored. With the key index,
+    # True means that it is stored.
+    if Keys is not None:
+        return key in Keys
+    return key in VicbfBackend
 
-### Crypto helper functions
-def pubkeyFromBytes(pkcs):
-    return RSA.importKey(pkcs)
 
+def queueFormatValid(queue):
+    return len(queue) == 16
 
-def verifyPKCS15_SHA256(pub, data, sig):
-    # Create hash object
-    h = SHA256.new(data)
-    # Create verifier
-    verifier = PKCS1_v1_5.new(pub)
-    # Return verification result
-    return verifier.verify(h, sig)
 
 ##### Message Creation Functions
 # Example function:
@@ -154,23 +674,21 @@ def verifyPKCS15_SHA256(pub, data, sig):
 
 ##### Handlers
 # Handler for ClientHello messages
-def HandleClientHelloMessage(msg, sock):
-    rv = ServerHello()
-    rv.serverProto = "1.0"
+def HandleClientHelloMessage(msg, conn):
     if msg.clientProto == "1.0":
         # We are talking protocol version 1.0
         debug("Valid clientProto received")
-        # Set Opcode to indicate compatibility
-        rv.opcode = ServerHello.CLIENT_HELLO_OK
-        # Add serialized Bloom Filter
-        rv.data = getVicbfSerialization()
-    else:
-        # We don't know the protocol version the other party is speaking
-        debug("WARN: Invalid clientProto received")
-        # Set opcode to indicate incompatibility
-        rv.opcode = ServerHello.CLIENT_HELLO_PROTO_NOT_SUPPORTED
-        # Set required data field to placeholder
-        rv.data = b'0'
+        # The reply only depends on the Bloom Filter, so it is kept framed
+        # and ready to send
+        return getServerHelloSerialization()
+    # We don't know the protocol version the other party is speaking
+    debug("WARN: Invalid clientProto received")
+    rv = ServerHello()
+    rv.serverProto = "1.0"
+    # Set opcode to indicate incompatibility
+    rv.opcode = ServerHello.CLIENT_HELLO_PROTO_NOT_SUPPORTED
+    # Set required data field to placeholder
+    rv.data = b'0'
     # Pack reply into Wrapper message
     wrapper = Wrapper()
     wrapper.ServerHello.MergeFrom(rv)
@@ -179,20 +697,30 @@ def HandleClientHelloMessage(msg, sock):
 
 
 # Handler for Store messages
-def HandleStoreMessage(msg, sock):
+@coroutine
+def HandleStoreMessage(msg, conn):
     rv = StoreReply()
     rv.key = msg.key
     if keyFormatValid(msg.key):
         # The key is valid
         try:
+            if Keys is not None and msg.key in Keys:
+                # The key is taken, no need to ask the database
+                raise KeyError(msg.key)
             # Insert into database
-            DatabaseBackend.insert_kv(msg.key, msg.value)
+            yield Storage.insert_kv(msg.key, msg.value)
+            # Wait for the insert to be committed
+            yield Committer.commit()
             debug("Inserted into DB")
+            if Keys is not None:
+                Keys.add(msg.key)
             # Insert into VICBF
             VicbfBackend.insert(msg.key)
             debug("Inserted into VICBF")
             # Invalidate VICBF cache
             invalidateVicbfSerializationCache()
+            # Inform the other workers, if any
+            publishClusterEvent(EVENT_INSERT, msg.key)
             # Set opcode to indicate success
             rv.opcode = StoreReply.STORE_OK
             debug("Done")
@@ -209,8 +737,10 @@ def HandleStoreMessage(msg, sock):
         # Key is not a regular message, but an encrypted StudyJoin
         try:
             # Insert into queue
-            if DatabaseBackend.insert_studyjoin(msg.key, msg.value):
-                # Insert into queue worked
+            inserted = yield Storage.insert_studyjoin(msg.key, msg.value)
+            if inserted:
+                # Insert into queue worked, wait for it to be committed
+                yield Committer.commit()
                 rv.opcode = StoreReply.STORE_OK
             else:
                 rv.opcode = StoreReply.STORE_FAIL_KEY_FMT
@@ -229,10 +759,11 @@ def HandleStoreMessage(msg, sock):
     # Merge StoreReply into it
     wrapper.StoreReply.MergeFrom(rv)
     # Return the reply
-    return wrapper
+    raise Return(wrapper)
 
 
-def HandleDeleteMessage(msg, sock):
+@coroutine
+def HandleDeleteMessage(msg, conn):
     # Prepare DeleteReply message
     rv = DeleteReply()
     # Set the key
@@ -241,22 +772,37 @@ def HandleDeleteMessage(msg, sock):
     if keyFormatValid(msg.key):
         debug("Key format valid")
         # Check if the key is on the server
-        if msg.key in VicbfBackend:
-            debug("Key in VICBF")
+        if keyMayExist(msg.key):
+            debug("Key may exist")
             # Check if the auth hashes to the key
             if sha256(msg.auth).digest() == msg.key:
                 debug("Authenticator good")
                 # Delete the KV pair
-                DatabaseBackend.delete_kv(msg.key)
-                debug("Deleted from DB backend")
-                # Delete the key from the VICBF
-                VicbfBackend.remove(msg.key)
-                debug("Deleted from VICBF")
-                # Invalidate VICBF cache
-                invalidateVicbfSerializationCache()
-                # Set opcode to success
-                rv.opcode = DeleteReply.DELETE_OK
-                debug("Deleted kv pair")
+                deleted = yield Storage.delete_kv(msg.key)
+                if deleted:
+                    # Wait for the deletion to be committed
+                    yield Committer.commit()
+                    debug("Deleted from DB backend")
+                    if Keys is not None:
+                        Keys.discard(msg.key)
+                    # Reads of the database only see the deletion once it is
+                    # committed, so the value may be cached until then
+                    Values.invalidate(msg.key)
+                    # Delete the key from the VICBF
+                    VicbfBackend.remove(msg.key)
+                    debug("Deleted from VICBF")
+                    # Invalidate VICBF cache
+                    invalidateVicbfSerializationCache()
+                    # Inform the other workers, if any
+                    publishClusterEvent(EVENT_REMOVE, msg.key)
+                    # Set opcode to success
+                    rv.opcode = DeleteReply.DELETE_OK
+                    debug("Deleted kv pair")
+                else:
+                    # The VICBF reported a false positive. Removing the key
+                    # from it would corrupt the counters of other keys.
+                    debug("WARN: Key not found in DB backend")
+                    rv.opcode = DeleteReply.DELETE_FAIL_NOT_FOUND
             else:
                 debug("WARN: Bad authenticator")
                 # Authentication string does not hash to key
@@ -274,23 +820,41 @@ def HandleDeleteMessage(msg, sock):
     # Merge DeleteReply into it
     wrapper.DeleteReply.MergeFrom(rv)
     # Return reply
-    return wrapper
+    raise Return(wrapper)
 
 
-def HandleGetMessage(msg, sock):
+@coroutine
+def HandleGetMessage(msg, conn):
     # Prepare GetReply message
     rv = GetReply()
     # Set the key
     rv.key = msg.key
     # Check if the key is valid
     if keyFormatValid(msg.key):
-        # Retrieve value from database, if available
-        value = DatabaseBackend.query_kv(msg.key)
+        GetStatistics["requests"] += 1
+        # Keys the VICBF or key index do not contain are definitely not in
+        # the database, so requests for unknown keys are answered from
+        # memory. In multi-worker mode, a key stored by another worker is
+        # only found here once its insert event has arrived.
+        if keyMayExist(msg.key):
+            # Retrieve value from cache or database, if available
+            value = Values.get(msg.key)
+            if value is None:
+                # Do not cache the value if the key is deleted while it is
+                # read
+                version = Values.version
+                value = yield Storage.query_kv(msg.key)
+                if value is not None:
+                    value = str(value)
+                    Values.put(msg.key, value, version)
+        else:
+            GetStatistics["filtered"] += 1
+            value = None
         # Check if we actually got a value
         if value is not None:
             debug("Got value")
             # We got a value! Save it to the GetReply message
-            rv.value = str(value)
+            rv.value = value
             # Set the opcode to indicate success
             rv.opcode = GetReply.GET_OK
         else:
@@ -307,26 +871,208 @@ def HandleGetMessage(msg, sock):
     # Merge GetReply into it
     wrapper.GetReply.MergeFrom(rv)
     # Return reply
-    return wrapper
+    raise Return(wrapper)
+
+
+# Handlers for batches of Store, Get and Delete messages. The replies
+# contain one reply per item, in the same order. All writes of a batch are
+# made in one transaction, and the VICBF serialization is only invalidated
+# once per batch.
+def chargeBatch(conn, items):
+    # Every processed item costs a token of the rate limit. The first one has
+    # been paid when the request was read.
+    conn.charge(min(items, MAX_BATCH_SIZE) - 1)
+
+
+@coroutine
+def HandleMultiStoreMessage(msg, conn):
+    chargeBatch(conn, len(msg.store))
+    reply = MultiStoreReply()
+    for item in msg.store:
+        reply.reply.add().key = item.key
+    # Replies and items of the key-value pairs to insert
+    pairs = []
+    # Replies and items of the StudyJoins to insert
+    studyjoins = []
+    # Replies of the StudyJoins that have been inserted
+    joins = []
+    # Replies of the key-value pairs that have been inserted
+    inserted = []
+    try:
+        for index, (rv, item) in enumerate(zip(reply.reply, msg.store)):
+            if index >= MAX_BATCH_SIZE:
+                rv.opcode = StoreReply.STORE_FAIL_UNKNOWN
+            elif keyFormatValid(item.key):
+                if Keys is not None and item.key in Keys:
+                    rv.opcode = StoreReply.STORE_FAIL_KEY_TAKEN
+                else:
+                    pairs.append((rv, item))
+            elif queueFormatValid(item.key):
+                studyjoins.append((rv, item))
+            else:
+                rv.opcode = StoreReply.STORE_FAIL_KEY_FMT
+        if studyjoins:
+            results = yield Storage.insert_studyjoin_many(
+                [(item.key, item.value) for rv, item in studyjoins])
+            for (rv, item), ok in zip(studyjoins, results):
+                if ok:
+                    # Reset below if the insert is not committed
+                    rv.opcode = StoreReply.STORE_OK
+                    joins.append(rv)
+                else:
+                    rv.opcode = StoreReply.STORE_FAIL_KEY_FMT
+        if pairs:
+            results = yield Storage.insert_kv_many(
+                [(item.key, item.value) for rv, item in pairs])
+            for (rv, item), ok in zip(pairs, results):
+                if ok:
+                    inserted.append(rv)
+                else:
+                    rv.opcode = StoreReply.STORE_FAIL_KEY_TAKEN
+    except Exception, e:
+        # An unexpected exception was thrown - this indicates a bug. The
+        # items processed before are still committed below.
+        debug("ERROR: Unexpected exception: " + repr(e))
+        for rv in reply.reply:
+            if not rv.HasField("opcode"):
+                rv.opcode = StoreReply.STORE_FAIL_UNKNOWN
+    try:
+        if inserted or joins:
+            # Wait for all inserts to be committed
+            yield Committer.commit()
+    except Exception, e:
+        debug("ERROR: Unexpected exception: " + repr(e))
+        for rv in inserted + joins:
+            rv.opcode = StoreReply.STORE_FAIL_UNKNOWN
+    else:
+        for rv in inserted:
+            VicbfBackend.insert(rv.key)
+            if Keys is not None:
+                Keys.add(rv.key)
+            publishClusterEvent(EVENT_INSERT, rv.key)
+            rv.opcode = StoreReply.STORE_OK
+        if inserted:
+            invalidateVicbfSerializationCache()
+    wrapper = Wrapper()
+    wrapper.MultiStoreReply.MergeFrom(reply)
+    raise Return(wrapper)
+
+
+@coroutine
+def HandleMultiGetMessage(msg, conn):
+    chargeBatch(conn, len(msg.get))
+    reply = MultiGetReply()
+    # Replies of the keys that have to be read from the database
+    lookups = []
+    for index, item in enumerate(msg.get):
+        rv = reply.reply.add()
+        rv.key = item.key
+        if index >= MAX_BATCH_SIZE:
+            rv.opcode = GetReply.GET_FAIL_UNKNOWN
+        elif not keyFormatValid(item.key):
+            rv.opcode = GetReply.GET_FAIL_KEY_FMT
+        else:
+            GetStatistics["requests"] += 1
+            if not keyMayExist(item.key):
+                GetStatistics["filtered"] += 1
+                rv.opcode = GetReply.GET_FAIL_UNKNOWN_KEY
+            else:
+                value = Values.get(item.key)
+                if value is None:
+                    lookups.append(rv)
+                else:
+                    rv.value = value
+                    rv.opcode = GetReply.GET_OK
+    if lookups:
+        # Read all remaining values with as few queries as possible
+        version = Values.version
+        values = yield Storage.query_kv_many([rv.key for rv in lookups])
+        for rv in lookups:
+            value = values.get(rv.key)
+            if value is None:
+                rv.opcode = GetReply.GET_FAIL_UNKNOWN_KEY
+            else:
+                rv.value = str(value)
+                rv.opcode = GetReply.GET_OK
+                Values.put(rv.key, rv.value, version)
+    wrapper = Wrapper()
+    wrapper.MultiGetReply.MergeFrom(reply)
+    raise Return(wrapper)
+
+
+@coroutine
+def HandleMultiDeleteMessage(msg, conn):
+    chargeBatch(conn, len(msg.delete))
+    reply = MultiDeleteReply()
+    # Replies of the keys to delete
+    pending = []
+    for index, item in enumerate(msg.delete):
+        rv = reply.reply.add()
+        rv.key = item.key
+        if index >= MAX_BATCH_SIZE:
+            rv.opcode = DeleteReply.DELETE_FAIL_UNKNOWN
+        elif not keyFormatValid(item.key):
+            rv.opcode = DeleteReply.DELETE_FAIL_KEY_FMT
+        elif not keyMayExist(item.key):
+            rv.opcode = DeleteReply.DELETE_FAIL_NOT_FOUND
+        elif sha256(item.auth).digest() != item.key:
+            rv.opcode = DeleteReply.DELETE_FAIL_AUTH
+        else:
+            pending.append(rv)
+    deleted = []
+    try:
+        if pending:
+            results = yield Storage.delete_kv_many(
+                [rv.key for rv in pending])
+            for rv, ok in zip(pending, results):
+                if ok:
+                    deleted.append(rv)
+                else:
+                    # Only a false positive of the VICBF. Removing the key
+                    # from it would corrupt the counters of other keys.
+                    rv.opcode = DeleteReply.DELETE_FAIL_NOT_FOUND
+        if deleted:
+            # Wait for all deletions to be committed
+            yield Committer.commit()
+    except Exception, e:
+        # An unexpected exception was thrown - this indicates a bug
+        debug("ERROR: Unexpected exception: " + repr(e))
+        for rv in pending:
+            if not rv.HasField("opcode"):
+                rv.opcode = DeleteReply.DELETE_FAIL_UNKNOWN
+    else:
+        for rv in deleted:
+            Values.invalidate(rv.key)
+            VicbfBackend.remove(rv.key)
+            if Keys is not None:
+                Keys.discard(rv.key)
+            publishClusterEvent(EVENT_REMOVE, rv.key)
+            rv.opcode = DeleteReply.DELETE_OK
+        if deleted:
+            invalidateVicbfSerializationCache()
+    wrapper = Wrapper()
+    wrapper.MultiDeleteReply.MergeFrom(reply)
+    raise Return(wrapper)
 
 
-def HandleStudyWrapperMessage(msg, sock):
+def HandleStudyWrapperMessage(msg, conn):
     mtype = msg.type
     if mtype == StudyWrapper.MSG_STUDYCREATE:
         debug("Got StudyCreate message")
-        return HandleStudyCreateMessage(msg, sock)
+        return HandleStudyCreateMessage(msg, conn)
     elif mtype == StudyWrapper.MSG_STUDYJOINQUERY:
         debug("Got StudyJoinQuery message")
-        return HandleStudyJoinQuery(msg, sock)
+        return HandleStudyJoinQuery(msg, conn)
     elif mtype == StudyWrapper.MSG_STUDYDELETE:
         debug("Got StudyDelete message")
-        return HandleStudyDeleteMessage(msg, sock)
+        return HandleStudyDeleteMessage(msg, conn)
     else:
         debug("Unknown message type received")
         return None
 
 
-def HandleStudyCreateMessage(msg, sock):
+@coroutine
+def HandleStudyCreateMessage(msg, conn):
     # Parse StudyCreate
     screate = StudyCreate()
     screate.ParseFromString(msg.message)
@@ -334,147 +1080,529 @@ def HandleStudyCreateMessage(msg, sock):
     sreply = StudyCreateReply()
     sreply.queueIdentifier = screate.queueIdentifier
     wrapper = Wrapper()
-    # Read out public key and verify signature
-    pub = pubkeyFromBytes(screate.publicKey)
-    if not verifyPKCS15_SHA256(pub, msg.message, msg.signature):
+    # Read out public key and verify signature. The verification runs in the
+    # background, other connections are served in the meantime.
+    valid = yield Verifier.verify(screate.publicKey, msg.message,
+                                  msg.signature)
+    if not valid:
         debug("ERROR: Invalid signature on message")
         sreply.status = StudyCreateReply.CREATE_FAIL_SIGNATURE
         wrapper.StudyCreateReply.MergeFrom(sreply)
-        return wrapper
+        raise Return(wrapper)
     if not queueFormatValid(screate.queueIdentifier):
         debug("ERROR: Invalid queue identifier")
         sreply.status = StudyCreateReply.CREATE_FAIL_BAD_IDENTIFIER
         wrapper.StudyCreateReply.MergeFrom(sreply)
-        return wrapper
-    # Insert into database
-    if DatabaseBackend.insert_study(screate.queueIdentifier, screate.publicKey,
-                                    msg):
+        raise Return(wrapper)
+    # Insert into database. A key of an earlier study with this identifier
+    # may still be cached, or be read while the study is inserted.
+    datarequests = [(dr.datatype, dr.granularity)
+                    for dr in screate.dataRequest]
+    StudyKeys.invalidate(screate.queueIdentifier)
+    inserted = yield Storage.insert_study(screate.queueIdentifier,
+                                          screate.publicKey, msg,
+                                          datarequests)
+    if inserted:
+        yield Committer.commit()
+        # Readers of the pool only see the study once it has been committed
+        StudyKeys.invalidate(screate.queueIdentifier)
+        invalidateStudyListSerializationCache()
+        publishClusterEvent(EVENT_STUDY_CREATE, screate.queueIdentifier)
         # Prepare reply
         sreply.status = StudyCreateReply.CREATE_OK
     else:
         sreply.status = StudyCreateReply.CREATE_FAIL_IDENTIFIER_TAKEN
     wrapper.StudyCreateReply.MergeFrom(sreply)
-    return wrapper
-
-
-def HandleStudyListRequest(msg, sock):
-    # The message itself is not interesting, as it does not contain any
-    # information - it's just an empty request
+    raise Return(wrapper)
+
+
+@coroutine
+def HandleStudyListRequest(msg, conn):
+    # Studies can be filtered by the data they request. Clients setting a
+    # page size or cursor get one page of studies per query, older clients
+    # send an empty request and get all studies at once.
+    if not msg.ListFields():
+        # The complete list is kept framed and ready to send
+        framed = yield getStudyListSerialization()
+        raise Return(framed)
     reply = StudyListReply()
-    for msg in DatabaseBackend.list_studies():
+    datatype = msg.datatype if msg.HasField("datatype") else None
+    granularity = msg.granularity if msg.HasField("granularity") else None
+    if msg.HasField("pageSize") or msg.HasField("cursor"):
+        limit = STUDY_LIST_PAGE_SIZE
+        if msg.HasField("pageSize"):
+            # An empty page with more set would never advance the cursor
+            limit = max(min(msg.pageSize, limit), 1)
+        # Read one additional study to find out if there are more
+        studies = yield Storage.list_studies(datatype, granularity,
+                                             after=min(msg.cursor, MAX_CURSOR),
+                                             limit=limit + 1)
+        reply.more = len(studies) > limit
+        studies = studies[:limit]
+        reply.cursor = studies[-1][0] if studies else msg.cursor
+    else:
+        studies = yield Storage.list_studies(datatype, granularity)
+    for dbid, message in studies:
         wrapper = reply.studylist.add()
-        wrapper.ParseFromString(msg[0])
+        wrapper.ParseFromString(message)
     replywrapper = Wrapper()
     replywrapper.StudyListReply.MergeFrom(reply)
-    return replywrapper
-
-
-def HandleStudyJoinQuery(msg, sock):
+    raise Return(replywrapper)
+
+
+@coroutine
+def ReadStudyJoinPage(request, reply):
+    # Fill the reply with the next page of join messages. The cursor of the
+    # query acknowledges all messages up to and including it, which are
+    # removed from the queue. The cursor of the reply is the position of its
+    # last message, and has to be passed in the next query.
+    limit = JOIN_PAGE_SIZE
+    if request.HasField("pageSize"):
+        limit = min(request.pageSize, limit)
+    # Read one additional message to find out if there are more
+    page = yield Storage.read_study_queue(request.queueIdentifier,
+                                          ack=min(request.cursor, MAX_CURSOR),
+                                          limit=limit + 1)
+    reply.cursor = request.cursor
+    if page is None:
+        # The study has been deleted in the meantime
+        raise Return()
+    reply.more = len(page) > limit
+    for position, data in page[:limit]:
+        reply.message.append(str(data))
+        reply.cursor = position
+
+
+@coroutine
+def HandleStudyJoinQuery(msg, conn):
     # We received a StudyJoinQuery message
     # Prepare a StudyJoinQueryReply
     reply = StudyJoinQueryReply()
     # Parse StudyJoinQuery message from msg
     request = StudyJoinQuery()
     request.ParseFromString(msg.message)
-    # Retrieve public key from database
-    pkey_bin = DatabaseBackend.query_study_pkey(request.queueIdentifier)
-    if pkey_bin is not None:
-        # Found a public key
-        pkey = pubkeyFromBytes(pkey_bin)
-        if not verifyPKCS15_SHA256(pkey, msg.message, msg.signature):
+    # Retrieve public key from cache or database
+    verifier = yield getStudyVerifier(request.queueIdentifier)
+    if verifier is not None:
+        # Found a public key, verify the signature in the background
+        valid = yield Verifier.verify(verifier, msg.message, msg.signature)
+        if not valid:
             reply.status = StudyJoinQueryReply.STATUS_FAIL_SIGNATURE
         else:
             reply.status = StudyJoinQueryReply.STATUS_OK
-            blocks = DatabaseBackend.query_study(request.queueIdentifier)
-            for element in blocks:
-                reply.message.append(str(element[0]))
+            if request.HasField("pageSize") or request.HasField("cursor"):
+                yield ReadStudyJoinPage(request, reply)
+            else:
+                # Legacy clients get the oldest messages, which are removed
+                # right away. Remaining messages are returned by the next
+                # query.
+                blocks, reply.more = yield Storage.query_study_more(
+                    request.queueIdentifier, limit=JOIN_PAGE_SIZE)
+                for element in blocks:
+                    reply.message.append(str(element[0]))
+            # Only hand out the messages once their removal is committed
+            yield Committer.commit()
     else:
         # No public key found => No such study
         reply.status = StudyJoinQueryReply.STATUS_FAIL_NOT_FOUND
     # Prepare and return reply wrapper
     wrapper = Wrapper()
     wrapper.StudyJoinQueryReply.MergeFrom(reply)
-    return wrapper
+    raise Return(wrapper)
 
 
-def HandleStudyDeleteMessage(msg, sock):
+@coroutine
+def HandleStudyDeleteMessage(msg, conn):
     # We received a StudyDelete message
     # Prepare a StudyDeleteReply
     reply = StudyDeleteReply()
     # Parse StudyDelete
     request = StudyDelete()
     request.ParseFromString(msg.message)
-    # Retrieve public key from database
-    pkey_bin = DatabaseBackend.query_study_pkey(request.queueIdentifier)
-    if pkey_bin is not None:
-        # Found a public key
-        pkey = pubkeyFromBytes(pkey_bin)
-        if not verifyPKCS15_SHA256(pkey, msg.message, msg.signature):
+    # Retrieve public key from cache or database
+    verifier = yield getStudyVerifier(request.queueIdentifier)
+    if verifier is not None:
+        # Found a public key, verify the signature in the background
+        valid = yield Verifier.verify(verifier, msg.message, msg.signature)
+        if not valid:
             reply.status = StudyDeleteReply.DELETE_FAIL_BAD_SIG
         else:
-            # Verification worked, delete Study
-            DatabaseBackend.delete_study(request.queueIdentifier)
+            # Verification worked, delete Study. Keys read from now on are
+            # not cached, as they may be read before the deletion.
+            StudyKeys.invalidate(request.queueIdentifier)
+            yield Storage.delete_study(request.queueIdentifier)
+            yield Committer.commit()
+            # Forget the key and listing of the study, here and in the other
+            # workers
+            StudyKeys.invalidate(request.queueIdentifier)
+            invalidateStudyListSerializationCache()
+            publishClusterEvent(EVENT_STUDY_DELETE, request.queueIdentifier)
             reply.status = StudyDeleteReply.DELETE_OK
     else:
         reply.status = StudyDeleteReply.DELETE_FAIL_BAD_IDENT
     # Prepare, fill and return wrapper
     wrapper = Wrapper()
     wrapper.StudyDeleteReply.MergeFrom(reply)
-    return wrapper
+    raise Return(wrapper)
 
 
 # Handler for all incoming messages
-def HandleMessage(message, sock):
+def HandleMessage(message, conn):
     mtype = message.WhichOneof('message')
     if mtype == "ClientHello":
         debug("Received ClientHello")
-        return HandleClientHelloMessage(message.ClientHello, sock)
+        return HandleClientHelloMessage(message.ClientHello, conn)
     elif mtype == "Store":
         debug("Received Store")
-        return HandleStoreMessage(message.Store, sock)
+        return HandleStoreMessage(message.Store, conn)
     elif mtype == "Delete":
         debug("Received Delete")
-        return HandleDeleteMessage(message.Delete, sock)
+        return HandleDeleteMessage(message.Delete, conn)
     elif mtype == "Get":
         debug("Received Get")
-        return HandleGetMessage(message.Get, sock)
+        return HandleGetMessage(message.Get, conn)
+    elif mtype == "MultiStore":
+        debug("Received MultiStore")
+        return HandleMultiStoreMessage(message.MultiStore, conn)
+    elif mtype == "MultiDelete":
+        debug("Received MultiDelete")
+        return HandleMultiDeleteMessage(message.MultiDelete, conn)
+    elif mtype == "MultiGet":
+        debug("Received MultiGet")
+        return HandleMultiGetMessage(message.MultiGet, conn)
     elif mtype == "StudyWrapper":
         debug("Received StudyWrapper")
-        return HandleStudyWrapperMessage(message.StudyWrapper, sock)
+        return HandleStudyWrapperMessage(message.StudyWrapper, conn)
     elif mtype == "StudyListQuery":
         debug("Received StudyListQuery")
-        return HandleStudyListRequest(message.StudyListQuery, sock)
+        return HandleStudyListRequest(message.StudyListQuery, conn)
     # and so on
 
 
-##### Main code
-if __name__ == "__main__":
+##### Main loop
+def serve(server_socket):
+    """Accept connections and handle requests until interrupted"""
+    running = True
+    next_sweep = time.time() + IDLE_SWEEP_INTERVAL
+    try:
+        while running:
+            # Poll the server socket and all connections that are not paused
+            # for reading, and all connections with queued replies for writing
+            readers = [server_socket] + \
+                [c for c in CONNECTION_LIST if c.wants_read()]
+            writers = [c for c in CONNECTION_LIST if c.wants_write()]
+            # Poll for completed background work
+            readers.append(TaskDispatcher)
+            # Poll the event channel to the supervisor, if we are a worker
+            if ClusterLink is not None:
+                readers.append(ClusterLink)
+                if ClusterLink.wants_write():
+                    writers.append(ClusterLink)
+            # fill() reads a bounded amount of data, so TLS connections may
+            # hold decrypted data select() does not know about
+            pending = [c for c in readers
+                       if isinstance(c, Connection) and c.pending()]
+            try:
+                read_sockets, write_sockets, error_sockets = \
+                    select.select(readers, writers, [],
+                                  0 if pending else
+                                  pollTimeout(time.time(), next_sweep))
+            except select.error, e:
+                # Interrupted by a signal, e.g. a request for statistics
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            read_sockets += [c for c in pending if c not in read_sockets]
+
+            now = time.time()
+            # Commit pending writes, which sends the replies waiting for them
+            Committer.run(now)
+            ResumeThrottledConnections(now)
+            if now >= next_sweep:
+                if IDLE_TIMEOUT > 0:
+                    DropIdleConnections(now)
+                RunMaintenance()
+                next_sweep = now + IDLE_SWEEP_INTERVAL
+
+            for conn in write_sockets:
+                if conn not in CONNECTION_LIST and conn is not ClusterLink:
+                    # Dropped in the meantime
+                    continue
+                if conn is ClusterLink:
+                    # Errors on the event channel are fatal for a worker
+                    ClusterLink.flush()
+                    continue
+                # Some client is ready to receive more of its queued replies
+                try:
+                    conn.flush()
+                    # Flushing may have resumed a paused connection, which may
+                    # still have requests buffered
+                    ProcessConnection(conn)
+                except Exception, e:
+                    DropConnection(conn, e)
+
+            for conn in read_sockets:
+
+                # New connection
+                if conn == server_socket:
+                    # Handle the case in which there is a new connection
+                    # recieved through server_socket
+                    AcceptConnection(server_socket)
+
+                # Some background work has completed
+                elif conn is TaskDispatcher:
+                    TaskDispatcher.run()
+
+                # Some event relayed by the supervisor
+                elif conn is ClusterLink:
+                    try:
+                        ProcessClusterEvents()
+                    except Exception, e:
+                        # Without the supervisor, we would silently diverge
+                        # from the other workers
+                        print "Lost supervisor: %s. exiting" % e
+                        running = False
+
+                # Some incoming message from a client
+                elif conn in CONNECTION_LIST:
+                    # Data recieved from client, process it
+                    try:
+                        conn.fill()
+                        ProcessConnection(conn)
+                        # Try to send the replies right away, most of the time
+                        # they will fit into the socket buffer
+                        conn.flush()
+
+                    # client disconnected, so remove from socket list
+                    except Exception, e:
+                        DropConnection(conn, e)
+                        continue
+
+    # Catch KeyboardInterrupts to save state before exiting
+    except KeyboardInterrupt:
+        print "Interrupted. exiting"
+
+    # Try to close all connections, ignoring any errors
+    for conn in CONNECTION_LIST:
+        try:
+            conn.close()
+        except Exception:
+            continue
+
+    # If we reach this statement, the main loop has terminated
+    # Close the socket
+    server_socket.close()
 
-    CONNECTION_LIST = []  # list of socket clients
-    RECV_BUFFER = 4096    # Advisable to keep it as an exponent of 2
 
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+def openDatabase(threaded=False):
+    """Open the database backend and the group committer for its writes.
 
-    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    If threaded, the calls made through Storage run on a storage thread,
+    which reports back to the TaskDispatcher.
+    """
+    global DatabaseBackend, ReadPool, Storage, Committer
+    if BACKEND == "memory":
+        DatabaseBackend = MemoryBackend()
+    elif BACKEND == "sharded":
+        DatabaseBackend = ShardedBackend(shards=DB_SHARDS,
+                                         journal_mode=DB_JOURNAL_MODE,
+                                         synchronous=DB_SYNCHRONOUS,
+                                         cache_size=DB_CACHE_SIZE,
+                                         mmap_size=DB_MMAP_SIZE)
+    else:
+        DatabaseBackend = SqliteBackend(journal_mode=DB_JOURNAL_MODE,
+                                        synchronous=DB_SYNCHRONOUS,
+                                        cache_size=DB_CACHE_SIZE,
+                                        mmap_size=DB_MMAP_SIZE)
+    if BACKEND == "log":
+        # Only the studies are kept in SQLite
+        DatabaseBackend = LogBackend(LOG_DIRECTORY, DatabaseBackend)
+    if threaded and DB_READERS > 0 and BACKEND == "sharded":
+        ReadPool = ConnectionPool(
+            lambda: ShardedBackend(shards=DB_SHARDS, cache_size=DB_CACHE_SIZE,
+                                   mmap_size=DB_MMAP_SIZE, readonly=True),
+            DB_READERS)
+    elif threaded and DB_READERS > 0 and DatabaseBackend.READ_METHODS:
+        ReadPool = ConnectionPool(
+            lambda: SqliteBackend(cache_size=DB_CACHE_SIZE,
+                                  mmap_size=DB_MMAP_SIZE, readonly=True),
+            DB_READERS)
+    Storage = StorageExecutor(DatabaseBackend, TaskDispatcher, threaded,
+                              ReadPool, READ_THREADS)
+    Committer = GroupCommitter(DatabaseBackend, GROUP_COMMIT_SIZE,
+                               GROUP_COMMIT_DELAY, Storage)
+
+
+def closeDatabase():
+    """Commit pending writes and close the database backend"""
+    Committer.flush()
+    # Wait for the storage thread to make all calls, including the commit
+    Storage.close()
+    if ReadPool is not None:
+        ReadPool.close()
+    DatabaseBackend.close()
+
+
+def startBackgroundWork(processes, closefds=()):
+    """Start the task dispatcher and the signature verification pool"""
+    global TaskDispatcher, Verifier, Admission
+    Admission = AdmissionControl(MAX_CONNECTIONS, MAX_CONNECTIONS_PER_SOURCE)
+    TaskDispatcher = Dispatcher()
+    Verifier = SignatureVerifier(TaskDispatcher, processes, closefds)
+
+
+def stopBackgroundWork():
+    """Stop the signature verification pool"""
+    Verifier.close()
+    TaskDispatcher.close()
+
+
+def runWorker(link, verify_processes):
+    """Main function of a worker process in multi-worker mode"""
+    global ClusterLink
+    ClusterLink = link
+    # Start the verification pool first, so that its processes do not inherit
+    # the database connection and listening socket. The event channel has
+    # already been created, so the pool processes have to close it.
+    startBackgroundWork(verify_processes, [link.fileno()])
+    # Every worker needs its own database connection, as SQLite connections
+    # must not be shared across a fork
+    openDatabase(STORAGE_THREAD)
+    server_socket = createReusePortSocket(HOST, PORT)
+    print "Denul worker %i started on port %i" % (os.getpid(), PORT)
+    serve(server_socket)
+    closeDatabase()
+    stopBackgroundWork()
 
-    server_socket.bind((HOST, PORT))
-    server_socket.listen(10)
 
-    # Add server socket to the list of readable connections
-    CONNECTION_LIST.append(server_socket)
+##### Main code
+if __name__ == "__main__":
 
-    # Prepare the database
+    parser = argparse.ArgumentParser(description="Denul server")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="Number of worker processes (default: %(default)s)")
+    parser.add_argument("--verify-processes", type=int,
+                        default=VERIFY_PROCESSES,
+                        help="Number of signature verification processes per "
+                             "worker, 0 to verify inline "
+                             "(default: %(default)s)")
+    parser.add_argument("--idle-timeout", type=int, default=IDLE_TIMEOUT,
+                        help="Seconds after which silent connections are "
+                             "closed, 0 to disable (default: %(default)s)")
+    parser.add_argument("--max-connections", type=int,
+                        default=MAX_CONNECTIONS,
+                        help="Maximum number of connections per worker, 0 "
+                             "for no limit (default: %(default)s)")
+    parser.add_argument("--max-per-source", type=int,
+                        default=MAX_CONNECTIONS_PER_SOURCE,
+                        help="Maximum number of connections per worker from "
+                             "a single address, 0 for no limit "
+                             "(default: %(default)s)")
+    parser.add_argument("--request-rate", type=float, default=REQUEST_RATE,
+                        help="Requests per second allowed per connection, 0 "
+                             "for no limit (default: %(default)s)")
+    parser.add_argument("--join-page-size", type=int,
+                        default=JOIN_PAGE_SIZE,
+                        help="Maximum number of join messages per study "
+                             "query reply (default: %(default)s)")
+    parser.add_argument("--study-page-size", type=int,
+                        default=STUDY_LIST_PAGE_SIZE,
+                        help="Maximum number of studies per paged study "
+                             "list reply (default: %(default)s)")
+    parser.add_argument("--value-cache-mb", type=float,
+                        default=VALUE_CACHE_SIZE / 1024.0 / 1024,
+                        help="Megabytes of stored values to cache, 0 to "
+                             "disable (default: %(default)s)")
+    parser.add_argument("--key-index", action="store_true",
+                        default=KEY_INDEX,
+                        help="Keep an exact index of the stored keys in "
+                             "memory, about 44-88 bytes per key")
+    parser.add_argument("--backend", default=BACKEND,
+                        choices=["sqlite", "log", "memory", "sharded"],
+                        help="Storage of the key-value pairs. \"log\" "
+                             "appends them to segment files in %s, "
+                             "\"memory\" keeps them and the studies in "
+                             "memory only, for benchmarks. \"sharded\" "
+                             "spreads them over --shards SQLite databases. "
+                             "All three require a single worker "
+                             "(default: %%(default)s)" % LOG_DIRECTORY)
+    parser.add_argument("--shards", type=int, default=DB_SHARDS,
+                        help="Number of databases of the sharded backend. "
+                             "Must not change once pairs have been stored "
+                             "(default: %(default)s)")
+    parser.add_argument("--key-ttl-days", type=float, default=KEY_TTL / 86400.0,
+                        help="Days after which stored key-value pairs "
+                             "expire, 0 to keep them until they are deleted. "
+                             "Requires the sqlite or sharded backend "
+                             "(default: %(default)s)")
+    parser.add_argument("--no-storage-thread", dest="storage_thread",
+                        action="store_false", default=STORAGE_THREAD,
+                        help="Make database calls on the main loop instead "
+                             "of a storage thread")
+    parser.add_argument("--db-readers", type=int, default=DB_READERS,
+                        help="Number of read-only database connections per "
+                             "worker, 0 to read on the storage thread "
+                             "(default: %(default)s)")
+    parser.add_argument("--read-threads", type=int, default=READ_THREADS,
+                        help="Number of threads sharing the read-only "
+                             "connections (default: %(default)s)")
+    parser.add_argument("--synchronous", default=DB_SYNCHRONOUS,
+                        choices=["off", "normal", "full"],
+                        help="SQLite synchronous setting "
+                             "(default: %(default)s)")
+    parser.add_argument("--group-commit-ms", type=float,
+                        default=GROUP_COMMIT_DELAY * 1000,
+                        help="Milliseconds writes may wait to be committed "
+                             "together, 0 to commit every write on its own "
+                             "(default: %(default)s)")
+    args = parser.parse_args()
+    if args.backend in ("log", "memory", "sharded") and args.workers > 1:
+        parser.error("the %s backend requires a single worker" % args.backend)
+    if args.backend in ("log", "memory") and args.key_ttl_days > 0:
+        parser.error("expiry requires the sqlite or sharded backend")
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+    BACKEND = args.backend
+    DB_SHARDS = args.shards
+    KEY_TTL = args.key_ttl_days * 86400
+    DB_SYNCHRONOUS = args.synchronous
+    GROUP_COMMIT_DELAY = args.group_commit_ms / 1000.0
+    IDLE_TIMEOUT = args.idle_timeout
+    MAX_CONNECTIONS = args.max_connections
+    MAX_CONNECTIONS_PER_SOURCE = args.max_per_source
+    REQUEST_RATE = args.request_rate
+    JOIN_PAGE_SIZE = args.join_page_size
+    STUDY_LIST_PAGE_SIZE = args.study_page_size
+    VALUE_CACHE_SIZE = int(args.value_cache_mb * 1024 * 1024)
+    KEY_INDEX = args.key_index
+    STORAGE_THREAD = args.storage_thread
+    DB_READERS = args.db_readers
+    READ_THREADS = args.read_threads
+
+    # Print statistics on request (kill -USR1)
+    signal.signal(signal.SIGUSR1, logStatistics)
+
+    if args.workers <= 1:
+        # Start the verification pool and task dispatcher before opening the
+        # database, so that the pool processes do not inherit the connection
+        startBackgroundWork(args.verify_processes)
+
+    # Prepare the database. The keys are read below before any other calls
+    # are made, so this may happen on the main thread, even if the database
+    # is handed to the storage thread. The workers open their own
+    # connections.
     print "Initialize database"
-    DatabaseBackend = SqliteBackend()
+    openDatabase(args.workers <= 1 and STORAGE_THREAD)
+    Values = ValueCache(VALUE_CACHE_SIZE)
 
     print "Read existing keys into VICBF"
-    # Read existing keys from the database
-    keys = DatabaseBackend.all_keys()
+    # Count existing keys in the database
+    keycount = DatabaseBackend.count_keys()
     # Calculate the number of expected entries
     # For now, we will expect the number of entries to double, and add 1000
     # to the estimation to account for very small initial values.
     # This can probably be heavily optimized
-    expected_entries = len(keys) * 2 + 1000
+    expected_entries = keycount * 2 + 1000
     # Taking 10 times the number of expected entries for the slot count will
     # result in a FPR of p = ~0.0007, or 0.07% once the number of expected
     # entries is reached.
@@ -486,80 +1614,46 @@ if __name__ == "__main__":
     THRESH_UP = expected_entries * 2
     # Initialize the VICBF with the given values
     VicbfBackend = VICBF(slots, 3)
-    # Insert all existing keys into the VICBF
-    for key in DatabaseBackend.all_keys():
-        VicbfBackend += str(key[0])
+    # Insert all existing keys into the VICBF and the key index. The keys are
+    # streamed from the database, so they never have to be held in memory all
+    # at once.
+    if KEY_INDEX:
+        Keys = KeyIndex(capacity=expected_entries)
+    for key in DatabaseBackend.iter_keys():
+        VicbfBackend += key
+        if Keys is not None:
+            Keys += key
     # Since nothing time-critical is happening right now, we can take the time
     # to populate the VICBF serialization cache. It is guaranteed to be needed
     # at least once before becoming outdated, as it will be accessed on every
-    # new connection. The following call will request the VICBF serialization,
-    # which will be cached, and ignore the result.
+    # new connection. The following call will request the framed ServerHello
+    # containing the VICBF serialization, which will be cached, and ignore the
+    # result.
     print "Populate cache"
-    getVicbfSerialization()
-
-    print "Denul server started on port " + str(PORT)
-
-    try:
-        while True:
-            # Get the list sockets which are ready to be read through select
-            read_sockets, write_sockets, error_sockets = \
-                select.select(CONNECTION_LIST, [], [])
-
-            for sock in read_sockets:
-
-                # New connection
-                if sock == server_socket:
-                    # Handle the case in which there is a new connection
-                    # recieved through server_socket
-                    sockfd, addr = server_socket.accept()
-
-                    # Wrap the socket in a SSL/TLS socket
-                    socktls = ssl.wrap_socket(sockfd, server_side=True,
-                                              certfile="server.crt",
-                                              keyfile="server.key")
-                    # I'd love to make this a more secure instance of an SSL
-                    # socket, but sadly, this would require python 2.7.9+,
-                    # which is not yet available in the ubuntu repos I am
-                    # using.
-                    # Right now, the socket still allows SSLv3 and RC4
-                    # connections, which is horrible, but the alternative
-                    # would be to only allow TLSv1 (and not v1.1 / v1.2),
-                    # which would be bad form as well.
-                    # Once a newer version of python is widely available, I may
-                    # change the code to use an ssl.Context object with the
-                    # correct settings for a secure socket.
-                    CONNECTION_LIST.append(socktls)
-
-                    print "Client (%s, %s) connected" % addr
-
-                # Some incoming message from a client
-                else:
-                    # Data recieved from client, process it
-                    try:
-                        wrapperMsg = RecvOneMsg(sock)
-                        if wrapperMsg:
-                            reply = HandleMessage(wrapperMsg, sock)
-                            # w_reply = wrapMessage(reply)
-                            sendMessage(reply, sock)
+    getServerHelloSerialization()
+
+    if args.workers > 1:
+        # The workers open their own database connections
+        closeDatabase()
+        DatabaseBackend = None
+        ReadPool = None
+        Storage = None
+        Committer = None
+        # Fork the workers. They inherit the populated VICBF and its cache.
+        print "Starting %i workers" % args.workers
+        Supervisor(args.workers,
+                   lambda link: runWorker(link, args.verify_processes),
+                   applyClusterEvent).run()
+    else:
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
-                    # client disconnected, so remove from socket list
-                    except Exception, e:
-                        print "Client (%s, %s) is offline: %s" % (addr[0], addr[1], e)
-                        sock.close()
-                        CONNECTION_LIST.remove(sock)
-                        continue
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
-    # Catch KeyboardInterrupts to save state before exiting
-    except KeyboardInterrupt:
-        print "Interrupted. exiting"
+        server_socket.bind((HOST, PORT))
+        server_socket.listen(10)
 
-    # Try to close all sockets, ignoring any errors
-    for sock in CONNECTION_LIST:
-        try:
-            sock.close()
-        except Exception:
-            continue
+        print "Denul server started on port " + str(PORT)
 
-    # If we reach this statement, the main loop has terminated
-    # Close the socket
-    server_socket.close()
+        serve(server_socket)
+        closeDatabase()
+        stopBackgroundWork()
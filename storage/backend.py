@@ -0,0 +1,189 @@
+# -*- encoding: utf-8 -*-
+"""The interface every storage backend of the server implements.
+
+The server only talks to its backend through these methods, so backends can
+be exchanged by configuration (see --backend). All methods are called from
+one thread at a time; READ_METHODS may additionally be called on read-only
+backends of a ConnectionPool.
+
+Writes are committed right away, unless group_commit is set by a
+GroupCommitter. Then they are only committed by the next call to commit().
+"""
+
+
+class StorageBackend():
+    """Abstract base class of the storage backends"""
+    # Methods that only read, and may be called on a read-only backend
+    READ_METHODS = frozenset()
+
+    group_commit = False
+
+    def commit(self):
+        """Commit all writes made since the last commit"""
+        raise NotImplementedError()
+
+    def rollback(self):
+        """Discard all writes made since the last commit"""
+        raise NotImplementedError()
+
+    def maintenance(self):
+        """Do a bounded amount of housekeeping, e.g. reclaiming the space of
+        deleted entries. Called periodically on the storage thread. Returns
+        True if more work is waiting."""
+        return False
+
+    def stats(self):
+        """Return a dictionary of backend specific statistics"""
+        return {}
+
+    def close(self):
+        """Release all resources. Writes that have not been committed are
+        lost."""
+        raise NotImplementedError()
+
+    # Key-value pairs
+
+    def insert_kv(self, key, value):
+        """Store value under key. Raises a KeyError if the key is taken."""
+        raise NotImplementedError()
+
+    def query_kv(self, key):
+        """Return the value stored under key, or None"""
+        raise NotImplementedError()
+
+    def delete_kv(self, key):
+        """Delete the pair stored under key. Returns False if there is
+        none."""
+        raise NotImplementedError()
+
+    def insert_kv_many(self, pairs):
+        """Store a list of (key, value) tuples in one transaction. Returns a
+        list with one bool per pair, False if its key is taken."""
+        raise NotImplementedError()
+
+    def query_kv_many(self, keys):
+        """Return a dictionary mapping those of the keys that are stored to
+        their values"""
+        raise NotImplementedError()
+
+    def delete_kv_many(self, keys):
+        """Delete the pairs of a list of keys in one transaction. Returns a
+        list with one bool per key, False if nothing was stored under it."""
+        raise NotImplementedError()
+
+    def expire_kv(self, before, limit):
+        """Delete up to limit pairs inserted before the given time, in
+        seconds since the epoch, oldest first. Returns the list of deleted
+        keys."""
+        raise NotImplementedError()
+
+    def all_keys(self):
+        """Return a list of 1-tuples containing all stored keys"""
+        raise NotImplementedError()
+
+    def iter_keys(self):
+        """Iterate over all stored keys, without holding all of them in
+        memory at once"""
+        raise NotImplementedError()
+
+    def count_keys(self):
+        """Return the number of stored keys"""
+        raise NotImplementedError()
+
+    # Studies and their queues of join messages
+
+    def insert_study(self, ident, pubkey, msg, datarequests=()):
+        """Store a study. Returns False if the identifier is taken."""
+        raise NotImplementedError()
+
+    def list_studies(self, datatype=None, granularity=None, after=0,
+                     limit=None):
+        """Return a list of (id, message) tuples of the studies, ordered by
+        id, see SqliteBackend.list_studies"""
+        raise NotImplementedError()
+
+    def insert_studyjoin(self, ident, data):
+        """Queue a join message for a study. Returns False if there is no
+        such study."""
+        raise NotImplementedError()
+
+    def insert_studyjoin_many(self, joins):
+        """Queue a list of (ident, data) join messages in one transaction.
+        Returns a list with one bool per join, False if there is no such
+        study."""
+        raise NotImplementedError()
+
+    def query_study(self, ident, limit=None):
+        """Remove and return up to limit queued messages of a study, as a
+        list of 1-tuples"""
+        raise NotImplementedError()
+
+    def query_study_more(self, ident, limit=None):
+        """Like query_study, but return a tuple of the messages and whether
+        more than limit messages were queued"""
+        raise NotImplementedError()
+
+    def read_study_queue(self, ident, ack=0, limit=None):
+        """Remove the messages up to position ack from the queue of a study,
+        and return up to limit of the remaining ones as (position, message)
+        tuples. Returns None if there is no such study."""
+        raise NotImplementedError()
+
+    def query_study_pkey(self, ident):
+        """Return the public key of a study, or None"""
+        raise NotImplementedError()
+
+    def delete_study(self, ident):
+        """Delete a study and its queue. Returns False if there is no such
+        study."""
+        raise NotImplementedError()
+
+
+class KeyValueBackend(StorageBackend):
+    """Base class of backends that store the key-value pairs themselves and
+    keep the studies in a SqliteBackend"""
+    # Only the studies may be read from a read-only SqliteBackend
+    READ_METHODS = frozenset(["list_studies", "query_study_pkey"])
+
+    def __init__(self, studies):
+        """Initialize the backend.
+
+        Keyword arguments:
+        studies -- SqliteBackend storing the studies
+        """
+        self.studies = studies
+        self.group_commit = False
+
+    def _studies(self):
+        # The study database follows the commit mode set by a GroupCommitter
+        self.studies.group_commit = self.group_commit
+        return self.studies
+
+    def insert_study(self, ident, pubkey, msg, datarequests=()):
+        return self._studies().insert_study(ident, pubkey, msg, datarequests)
+
+    def list_studies(self, datatype=None, granularity=None, after=0,
+                     limit=None):
+        return self._studies().list_studies(datatype, granularity, after,
+                                            limit)
+
+    def insert_studyjoin(self, ident, data):
+        return self._studies().insert_studyjoin(ident, data)
+
+    def insert_studyjoin_many(self, joins):
+        return self._studies().insert_studyjoin_many(joins)
+
+    def query_study(self, ident, limit=None):
+        return self._studies().query_study(ident, limit)
+
+    def query_study_more(self, ident, limit=None):
+        return self._studies().query_study_more(ident, limit)
+
+    def read_study_queue(self, ident, ack=0, limit=None):
+        return self._studies().read_study_queue(ident, ack, limit)
+
+    def query_study_pkey(self, ident):
+        return self._studies().query_study_pkey(ident)
+
+    def delete_study(self, ident):
+        return self._studies().delete_study(ident)
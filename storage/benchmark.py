@@ -0,0 +1,70 @@
+# -*- encoding: utf-8 -*-
+"""Measure study lookup times of the SQLite backend against the table size.
+
+Run from the repository root:
+
+    python2 -m storage.benchmark [--sizes 1000 10000 100000 300000]
+
+For every size, a fresh database with that many studies is created, and the
+average time of the study lookups performed by the server is printed. With
+indexed exact-match lookups, the times should stay roughly constant as the
+number of studies grows.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from storage.sqlite import SqliteBackend
+
+
+def populate(db, count):
+    # Insert count studies with random 16-byte identifiers in one transaction
+    idents = [os.urandom(16) for i in range(count)]
+    db.conn.executemany(
+        "INSERT INTO study (ident, pubkey, message) VALUES (?, ?, ?)",
+        ((sqlite3.Binary(ident), sqlite3.Binary("pubkey"),
+          sqlite3.Binary("message")) for ident in idents))
+    db.conn.commit()
+    return idents
+
+
+def measure(fn, args):
+    # Return the average time of calling fn for every element of args, in us
+    start = time.time()
+    for arg in args:
+        fn(arg)
+    return (time.time() - start) / len(args) * 1e6
+
+
+def run(size, lookups):
+    tempdir = tempfile.mkdtemp()
+    try:
+        db = SqliteBackend(os.path.join(tempdir, "benchmark.db"))
+        idents = populate(db, size)
+        sample = [idents[i * len(idents) // lookups] for i in range(lookups)]
+        pkey = measure(db.query_study_pkey, sample)
+        join = measure(lambda ident: db.insert_studyjoin(ident, "join"),
+                       sample)
+        query = measure(db.query_study, sample)
+        db.close()
+    finally:
+        shutil.rmtree(tempdir)
+    print "%8i studies: query_study_pkey %7.1f us, insert_studyjoin " \
+        "%7.1f us, query_study %7.1f us" % (size, pkey, join, query)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Study lookup benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 100000, 300000],
+                        help="Numbers of studies to test with "
+                             "(default: %(default)s)")
+    parser.add_argument("--lookups", type=int, default=1000,
+                        help="Number of lookups per size "
+                             "(default: %(default)s)")
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, min(args.lookups, size))
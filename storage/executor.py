@@ -0,0 +1,192 @@
+# -*- encoding: utf-8 -*-
+"""Run the calls to a database backend on a dedicated storage thread.
+
+SQLite calls block until their query has been answered, or their commit has
+been synced to disk. Made on the main loop, a slow query or fsync stalls
+every connected client. The StorageExecutor hands the calls to a storage
+thread instead and returns a Future, which is resolved on the main loop once
+the call has returned. The sqlite3 module releases the GIL while SQLite is
+working, so network I/O keeps flowing in the meantime.
+
+Calls are made in the order they were submitted, on a single thread, and
+their Futures are resolved in that order. A handler therefore sees the
+effects of all calls submitted before its own, just as if they had been
+made synchronously. Any method of the backend can be called through the
+executor:
+
+    value = yield Storage.query_kv(key)
+
+Methods returning generators, like iter_keys, must not be called this way,
+as the generator would be run on the calling thread.
+
+With a ConnectionPool of read-only backends, the methods listed in the
+READ_METHODS of the backend are instead called on reader threads, which run
+concurrently with each other and with the storage thread. Readers only see
+committed writes, and their Futures may be resolved in any order. There may
+be more reader threads than pooled backends; the threads then take turns
+checking them out.
+"""
+import Queue
+import threading
+import time
+
+from network.tasks import Future
+
+
+class StorageExecutor():
+    """Call the methods of a database backend on a storage thread"""
+
+    def __init__(self, backend, dispatcher=None, threaded=True, pool=None,
+                 readers=None):
+        """Initialize the executor.
+
+        Keyword arguments:
+        backend    -- The database backend. Once the executor is running, it
+                      must not be used by other threads while calls are
+                      pending.
+        dispatcher -- Dispatcher used to resolve Futures on the main loop.
+                      Required if threaded.
+        threaded   -- If False, calls are made synchronously and the Futures
+                      are returned resolved (default: True)
+        pool       -- ConnectionPool of read-only backends. If given, reads
+                      are made on reader threads using its backends.
+                      Ignored unless threaded. (default: None)
+        readers    -- Number of reader threads (default: one per pooled
+                      backend)
+        """
+        if threaded and dispatcher is None:
+            raise ValueError("A threaded executor requires a dispatcher")
+        if readers is not None and readers < 1:
+            raise ValueError("readers must be >=1")
+        self.backend = backend
+        self.dispatcher = dispatcher
+        self.queue = Queue.Queue()
+        self.pool = None
+        self.readqueue = Queue.Queue()
+        # Number of calls made, and seconds spent in them and waiting for a
+        # thread to make them
+        self.calls = 0
+        self.busy = 0.0
+        self.waited = 0.0
+        self.lock = threading.Lock()
+        self.thread = None
+        self.readers = []
+        if threaded:
+            self.thread = self._start(self._run, "storage")
+            if pool is not None:
+                self.pool = pool
+                if readers is None:
+                    readers = pool.size
+                self.readers = [self._start(self._read, "storage-reader")
+                                for i in xrange(readers)]
+
+    def _start(self, target, name):
+        # Start a thread that does not keep the process alive
+        thread = threading.Thread(target=target, name=name)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def submit(self, fn, *args, **kwargs):
+        """Call fn(*args, **kwargs) on the storage thread.
+
+        Returns a Future that is resolved with the result of the call, or
+        with the exception it raised.
+        """
+        future = Future()
+        if self.thread is None:
+            ok, value = self._call(fn, args, kwargs, time.time())
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+        else:
+            self.queue.put((future, fn, args, kwargs, time.time()))
+        return future
+
+    def __getattr__(self, name):
+        # Storage.query_kv(key) submits DatabaseBackend.query_kv(key)
+        if name.startswith("_"):
+            raise AttributeError(name)
+        method = getattr(self.backend, name)
+        if not callable(method):
+            raise AttributeError(name)
+
+        if self.readers and name in self.backend.READ_METHODS:
+            def call(*args, **kwargs):
+                future = Future()
+                self.readqueue.put((future, name, args, kwargs, time.time()))
+                return future
+        else:
+            def call(*args, **kwargs):
+                return self.submit(method, *args, **kwargs)
+        return call
+
+    def _call(self, fn, args, kwargs, submitted):
+        # Make a call, returning whether it succeeded and its result or
+        # exception
+        start = time.time()
+        try:
+            rv = True, fn(*args, **kwargs)
+        except Exception, e:
+            rv = False, e
+        with self.lock:
+            self.calls += 1
+            self.waited += start - submitted
+            self.busy += time.time() - start
+        return rv
+
+    def _resolve(self, future, ok, value):
+        # Hand the result of a call to the main loop
+        if ok:
+            self.dispatcher.call_soon_threadsafe(future.set_result, value)
+        else:
+            self.dispatcher.call_soon_threadsafe(future.set_exception, value)
+
+    def _run(self):
+        # Main function of the storage thread
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs, submitted = item
+            self._resolve(future, *self._call(fn, args, kwargs, submitted))
+
+    def _read(self):
+        # Main function of a reader thread. Calls the named method on a
+        # backend of the pool.
+        while True:
+            item = self.readqueue.get()
+            if item is None:
+                return
+            future, name, args, kwargs, submitted = item
+            backend = self.pool.checkout()
+            try:
+                rv = self._call(getattr(backend, name), args, kwargs,
+                                submitted)
+            finally:
+                self.pool.checkin(backend)
+            self._resolve(future, *rv)
+
+    def stats(self):
+        """Return a dictionary with the number of calls made and pending,
+        and the average milliseconds a call waited and ran"""
+        calls = max(self.calls, 1)
+        return {"calls": self.calls,
+                "pending": self.queue.qsize() + self.readqueue.qsize(),
+                "wait": self.waited * 1000 / calls,
+                "busy": self.busy * 1000 / calls}
+
+    def close(self):
+        """Wait for all submitted calls and stop the storage and reader
+        threads. The Futures of calls that complete now are not resolved
+        anymore. The pool is not closed."""
+        for reader in self.readers:
+            self.readqueue.put(None)
+        for reader in self.readers:
+            reader.join()
+        self.readers = []
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
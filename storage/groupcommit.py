@@ -0,0 +1,142 @@
+# -*- encoding: utf-8 -*-
+"""Group commit for writes to the database backend.
+
+Committing every write on its own costs at least one fsync per request, so
+write throughput is capped by the latency of the disk. The GroupCommitter
+lets the writes of many requests accumulate in one transaction instead, and
+commits it once enough writes are pending or a short delay has passed.
+
+Handlers perform their write and then wait for the Future returned by
+commit(). It is resolved once the transaction covering the write has been
+committed, so replies are only sent for writes that are durable:
+
+    DatabaseBackend.insert_kv(key, value)
+    yield Committer.commit()
+
+The main loop has to call run() after at most timeout() seconds. If the
+backend is run by a StorageExecutor, the commits are made through it as well,
+after all writes submitted before.
+"""
+import time
+
+from network.tasks import Future, resolved
+
+
+class GroupCommitter():
+    """Commit the writes of many requests in one transaction"""
+
+    def __init__(self, backend, max_batch=256, max_delay=0.005,
+                 executor=None):
+        """Initialize the group committer.
+
+        Keyword arguments:
+        backend   -- The database backend. Its writes are grouped unless
+                     max_delay is 0.
+        max_batch -- Number of pending writes at which the transaction is
+                     committed right away (default: 256)
+        max_delay -- Maximum number of seconds a write waits for its commit.
+                     If 0, every write is committed on its own.
+                     (default: 5 ms)
+        executor  -- StorageExecutor running the calls to the backend. If
+                     None, commits are made synchronously. (default: None)
+        """
+        if max_batch < 1:
+            raise ValueError("max_batch must be >=1")
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.executor = executor
+        self.backend.group_commit = max_delay > 0
+        # Futures waiting for the current transaction to be committed
+        self.pending = []
+        # Time at which the current transaction has to be committed
+        self.deadline = None
+        # Number of transactions and writes committed
+        self.commits = 0
+        self.writes = 0
+        # Exception of the last failed commit, raised by the next one
+        self.failure = None
+
+    def commit(self):
+        """Return a Future resolved once all previous writes are committed"""
+        if not self.backend.group_commit:
+            # The backend has already committed the write
+            self.commits += 1
+            self.writes += 1
+            return resolved(True)
+        future = Future()
+        self.pending.append(future)
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.deadline is None:
+            self.deadline = time.time() + self.max_delay
+        return future
+
+    def timeout(self, now=None):
+        """Return the number of seconds until run() has to be called, or
+        None if no writes are pending"""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - (time.time() if now is None else now), 0)
+
+    def run(self, now=None):
+        """Commit the transaction if its delay has passed"""
+        if self.deadline is not None and \
+                (time.time() if now is None else now) >= self.deadline:
+            self.flush()
+
+    def flush(self):
+        """Commit the transaction and resolve all waiting Futures.
+
+        If the commit fails, the transaction is rolled back and the Futures
+        are resolved with the exception instead. The rollback also discards
+        the writes of handlers that had not called commit() yet. They wait
+        for the next transaction, so it is rolled back and fails as well.
+        """
+        pending, self.pending = self.pending, []
+        self.deadline = None
+        if not self.backend.group_commit:
+            return
+        if self.executor is not None:
+            self.executor.submit(self._commit).add_done_callback(
+                lambda done: self._resolve(pending, done))
+            return
+        done = Future()
+        try:
+            done.set_result(self._commit())
+        except Exception, e:
+            done.set_exception(e)
+        self._resolve(pending, done)
+
+    def _commit(self):
+        # Commit the transaction, or roll it back if that fails, so that the
+        # next writes start a new one
+        if self.failure is not None:
+            failure, self.failure = self.failure, None
+            self.backend.rollback()
+            raise failure
+        try:
+            self.backend.commit()
+        except Exception, e:
+            self.backend.rollback()
+            self.failure = e
+            raise
+
+    def _resolve(self, pending, done):
+        # Resolve the Futures waiting for a commit with its outcome
+        try:
+            done.result()
+        except Exception, e:
+            for future in pending:
+                future.set_exception(e)
+            return
+        if pending:
+            self.commits += 1
+            self.writes += len(pending)
+        for future in pending:
+            future.set_result(True)
+
+    def stats(self):
+        """Return a dictionary with the number of commits and writes"""
+        return {"commits": self.commits,
+                "writes": self.writes}
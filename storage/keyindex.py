@@ -0,0 +1,136 @@
+# -*- encoding: utf-8 -*-
+"""A compact in-memory set of the stored keys.
+
+The VICBF can only tell that a key is definitely not stored, so requests for
+keys it may contain still need a database query to find out. The KeyIndex
+knows exactly which keys are stored, so Store, Get and Delete can decide
+whether a key exists without SQL.
+
+Keys have a fixed size, so they are kept in an open-addressing hash table
+inside a single bytearray, with one more byte per slot for its state. At a
+load of 0.375 to 0.75, this takes 44 to 88 bytes per 32-byte key, while a
+Python set of str takes more than 100, spread over many small objects.
+Clients choose the keys they store, so the slots are derived from a salted
+hash to keep them from forcing long probe sequences.
+"""
+import os
+import struct
+from hashlib import md5
+
+# States of a slot
+EMPTY = 0
+USED = 1
+DELETED = 2
+
+
+class KeyIndex():
+    """Set of fixed-size keys stored in an open-addressing hash table"""
+    # Maximum fraction of used and deleted slots before the table is rebuilt
+    MAX_LOAD = 0.75
+
+    def __init__(self, keysize=32, capacity=1024):
+        """Initialize the index.
+
+        Keyword arguments:
+        keysize  -- Size of every key in bytes (default: 32)
+        capacity -- Number of keys to allocate space for. The index grows
+                    as needed. (default: 1024)
+        """
+        if keysize < 1:
+            raise ValueError("keysize must be >=1")
+        self.keysize = keysize
+        self.salt = os.urandom(16)
+        slots = 8
+        while slots * self.MAX_LOAD < capacity:
+            slots *= 2
+        self._allocate(slots)
+
+    def _allocate(self, slots):
+        # Create an empty table with the given number of slots, a power of 2
+        self.slots = slots
+        self.table = bytearray(slots * self.keysize)
+        self.state = bytearray(slots)
+        self.used = 0
+        self.deleted = 0
+
+    def _find(self, key):
+        # Return the slot of key (or None if it is not in the index), and the
+        # first slot it could be inserted at
+        if len(key) != self.keysize:
+            raise ValueError("Key must be %i bytes long" % self.keysize)
+        mask = self.slots - 1
+        slot = struct.unpack_from("<Q", md5(self.salt + key).digest())[0] \
+            & mask
+        free = None
+        while True:
+            state = self.state[slot]
+            if state == EMPTY:
+                return None, slot if free is None else free
+            elif state == DELETED:
+                if free is None:
+                    free = slot
+            else:
+                offset = slot * self.keysize
+                if self.table[offset:offset + self.keysize] == key:
+                    return slot, free
+            slot = (slot + 1) & mask
+
+    def _store(self, slot, key):
+        # Put key into a free slot
+        if self.state[slot] == DELETED:
+            self.deleted -= 1
+        offset = slot * self.keysize
+        self.table[offset:offset + self.keysize] = key
+        self.state[slot] = USED
+        self.used += 1
+
+    def _rebuild(self):
+        # Reinsert all keys, dropping deleted slots. The table is doubled if
+        # more than half of the allowed load are keys.
+        table, state, keysize = self.table, self.state, self.keysize
+        slots = self.slots
+        if self.used >= slots * self.MAX_LOAD / 2:
+            slots *= 2
+        self._allocate(slots)
+        for slot in xrange(len(state)):
+            if state[slot] == USED:
+                key = str(table[slot * keysize:(slot + 1) * keysize])
+                self._store(self._find(key)[1], key)
+
+    def add(self, key):
+        """Add a key. Returns False if it was already in the index."""
+        slot, free = self._find(key)
+        if slot is not None:
+            return False
+        self._store(free, key)
+        if self.used + self.deleted > self.slots * self.MAX_LOAD:
+            self._rebuild()
+        return True
+
+    def discard(self, key):
+        """Remove a key. Returns False if it was not in the index."""
+        slot = self._find(key)[0]
+        if slot is None:
+            return False
+        self.state[slot] = DELETED
+        self.used -= 1
+        self.deleted += 1
+        return True
+
+    def stats(self):
+        """Return a dictionary with the number of keys and slots, and the
+        size of the table in bytes"""
+        return {"size": self.used,
+                "slots": self.slots,
+                "bytes": len(self.table) + len(self.state)}
+
+    def __contains__(self, key):
+        return self._find(key)[0] is not None
+
+    def __len__(self):
+        return self.used
+
+    def __iadd__(self, key):
+        """Shorthand for add. Allows "index += key" syntax"""
+        self.add(key)
+        return self
@@ -0,0 +1,408 @@
+# -*- encoding: utf-8 -*-
+"""An append-only, log-structured store for the key-value pairs.
+
+Pairs are written once, read a few times and deleted once. SQLite keeps them
+in B-tree pages, so every insert and delete rewrites a page, first in the
+WAL and later in the database file. The LogBackend appends every write to
+the current segment file instead, and keeps an in-memory hash index from
+each key to the position of its record. A Get costs a dictionary lookup and
+a single read.
+
+Every record consists of a header, the key and the value:
+
+    crc32 (4 bytes) | op (1) | key length (2) | value length (4) | key | value
+
+Deletions append a record with op DELETE, whose value is the number of the
+segment holding the deleted record. Once the current segment has grown to
+segment_size bytes, a new one is started. Segments in which most pairs have
+been deleted are compacted by maintenance(), which the server calls
+periodically on its storage thread: The live pairs are copied to the current
+segment, a bounded number of bytes per call, and the old segment is removed
+once all of them have been copied. A deletion record is copied as long as a
+segment that may still contain the deleted record exists, otherwise the
+pair would reappear on the next startup. Compaction syncs the segment, so it
+is skipped while grouped writes are waiting for their commit.
+
+Like readers of a SQLite database in WAL mode, queries only see committed
+writes. Until its record is committed, a key is read through the index entry
+it had before.
+
+On startup, the segments are replayed in order to rebuild the index. A
+record that is incomplete or fails its checksum has been torn by a crash; it
+can only be the last one, and the segment is truncated in front of it.
+
+Studies are relational data and are kept in a SqliteBackend.
+"""
+import fcntl
+import os
+import struct
+import zlib
+
+from storage.backend import KeyValueBackend
+
+# Header of a record: checksum, op, key length, value length
+HEADER = struct.Struct(">IBHI")
+# Record types
+PUT = 1
+DELETE = 2
+# Value of a deletion record: the segment of the deleted record
+SEGMENT = struct.Struct(">I")
+
+
+class LogBackend(KeyValueBackend):
+    """Key-value pairs in append-only segment files, studies in SQLite"""
+    # Segments with a smaller fraction of live bytes are compacted
+    COMPACT_THRESHOLD = 0.5
+
+    def __init__(self, directory, studies, segment_size=64 * 1024 * 1024,
+                 compact_bytes=4 * 1024 * 1024):
+        """Initialize the backend, recovering the index from the segments.
+
+        Keyword arguments:
+        directory     -- Directory of the segment files. Created if needed,
+                         and locked against use by other processes.
+        studies       -- SqliteBackend storing the studies
+        segment_size  -- Size in bytes at which a new segment is started
+                         (default: 64 MiB)
+        compact_bytes -- Maximum number of bytes maintenance() processes per
+                         call (default: 4 MiB)
+        """
+        KeyValueBackend.__init__(self, studies)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.compact_bytes = compact_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Two processes appending to the same segment would corrupt it
+        self.lockfd = os.open(os.path.join(directory, "LOCK"),
+                              os.O_RDWR | os.O_CREAT, 0644)
+        try:
+            fcntl.flock(self.lockfd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            os.close(self.lockfd)
+            raise IOError("%s is used by another process" % directory)
+        # Maps every stored key to the (segment, offset, length) of its record
+        self.index = {}
+        # Total and live bytes of every segment
+        self.sizes = {}
+        self.live = {}
+        # The (offset, deleted segment, length) of the deletion records of
+        # every segment
+        self.tombstones = {}
+        # File descriptors for reading, by segment
+        self.readers = {}
+        # Changes to the index since the last commit, undone on rollback
+        self.undo = []
+        # The committed index entries of the keys written since then
+        self.before = {}
+        # The segment being compacted, and the offset to continue at
+        self.compacting = None
+        self.compactions = 0
+        self._recover()
+
+    def _path(self, segment):
+        return os.path.join(self.directory, "%08i.seg" % segment)
+
+    def _recover(self):
+        # Rebuild the index from the segments and open the current one
+        segments = sorted(int(name[:-4]) for name in os.listdir(self.directory)
+                          if name.endswith(".seg") and name[:-4].isdigit())
+        for segment in segments:
+            self._replay(segment, segment == segments[-1])
+        if segments and self.sizes[segments[-1]] < self.segment_size:
+            self._open(segments[-1])
+        else:
+            self._open(segments[-1] + 1 if segments else 1)
+
+    def _replay(self, segment, last):
+        # Apply all records of a segment to the index
+        path = self._path(segment)
+        self.sizes[segment] = 0
+        self.live[segment] = 0
+        offset = 0
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            while offset < size:
+                record = self._parse(f, size - offset)
+                if record is None:
+                    if not last:
+                        raise IOError("Corrupt record in %s at offset %i"
+                                      % (path, offset))
+                    # Torn by a crash, before the write was committed
+                    print "Truncating %s to %i bytes" % (path, offset)
+                    with open(path, "r+b") as t:
+                        t.truncate(offset)
+                    break
+                op, key, value = record
+                length = HEADER.size + len(key) + len(value)
+                self._apply(op, key, value, segment, offset, length)
+                offset += length
+        self.sizes[segment] = offset
+
+    def _parse(self, f, available):
+        # Read the next record from f. Returns (op, key, value), or None if
+        # the record is incomplete or corrupt.
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return None
+        crc, op, keylen, vallen = HEADER.unpack(header)
+        if op not in (PUT, DELETE) or \
+                HEADER.size + keylen + vallen > available:
+            return None
+        body = f.read(keylen + vallen)
+        if zlib.crc32(header[4:] + body) & 0xffffffff != crc:
+            return None
+        return op, body[:keylen], body[keylen:]
+
+    def _apply(self, op, key, value, segment, offset, length):
+        # Point the index to a record. Returns the previous index entry.
+        old = self.index.get(key)
+        if old is not None:
+            self.live[old[0]] -= old[2]
+        if op == PUT:
+            self.index[key] = (segment, offset, length)
+            self.live[segment] += length
+        else:
+            self.tombstones.setdefault(segment, []).append(
+                (offset, SEGMENT.unpack(value)[0], length))
+            if old is not None:
+                del self.index[key]
+        return old
+
+    def _open(self, segment):
+        # Open a segment for appending records
+        self.active = segment
+        self.fd = os.open(self._path(segment),
+                          os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0644)
+        self.offset = self.committed = os.fstat(self.fd).st_size
+        self.sizes.setdefault(segment, self.offset)
+        self.live.setdefault(segment, 0)
+        self._sync_directory()
+
+    def _sync_directory(self):
+        # Make the creation or removal of a segment durable
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _append(self, op, key, value=""):
+        # Append a record to the current segment and update the index
+        body = HEADER.pack(0, op, len(key), len(value))[4:] + key + value
+        record = struct.pack(">I", zlib.crc32(body) & 0xffffffff) + body
+        written = 0
+        while written < len(record):
+            written += os.write(self.fd, record[written:])
+        offset = self.offset
+        self.offset += len(record)
+        self.sizes[self.active] = self.offset
+        old = self._apply(op, key, value, self.active, offset, len(record))
+        self.undo.append((key, old))
+        self.before.setdefault(key, old)
+
+    def _entry(self, key):
+        # Return the committed index entry of a key, or None
+        if key in self.before:
+            return self.before[key]
+        return self.index.get(key)
+
+    def _read(self, entry):
+        # Return the value of the record at an index entry
+        segment, offset, length = entry
+        fd = self.readers.get(segment)
+        if fd is None:
+            fd = self.readers[segment] = os.open(self._path(segment),
+                                                 os.O_RDONLY)
+        os.lseek(fd, offset, os.SEEK_SET)
+        record = os.read(fd, length)
+        if len(record) != length:
+            raise IOError("Short read from segment %i" % segment)
+        return record[HEADER.size + HEADER.unpack_from(record)[2]:]
+
+    def _sync(self):
+        # Make all appended records durable, and start a new segment if the
+        # current one is full
+        if self.offset != self.committed:
+            os.fsync(self.fd)
+            self.committed = self.offset
+        self.undo = []
+        self.before = {}
+        if self.offset >= self.segment_size:
+            os.close(self.fd)
+            self._open(self.active + 1)
+
+    def _commit(self):
+        # Commit the records of a write, unless commits are grouped
+        if not self.group_commit:
+            self._sync()
+
+    def commit(self):
+        """Commit all writes made since the last commit"""
+        self._sync()
+        self.studies.commit()
+
+    def rollback(self):
+        """Discard all writes made since the last commit"""
+        self.studies.rollback()
+        for key, old in reversed(self.undo):
+            current = self.index.pop(key, None)
+            if current is not None:
+                self.live[current[0]] -= current[2]
+            if old is not None:
+                self.index[key] = old
+                self.live[old[0]] += old[2]
+        self.undo = []
+        self.before = {}
+        if self.active in self.tombstones:
+            self.tombstones[self.active] = [
+                t for t in self.tombstones[self.active]
+                if t[0] < self.committed]
+        os.ftruncate(self.fd, self.committed)
+        self.offset = self.sizes[self.active] = self.committed
+
+    def maintenance(self):
+        """Compact the oldest segment in which less than COMPACT_THRESHOLD
+        of the bytes are live, processing at most compact_bytes. Skipped
+        while grouped writes are pending, as they would be synced before
+        their commit. Returns True if more segments need to be compacted."""
+        if self.undo or self.offset != self.committed:
+            return False
+        if self.compacting is None:
+            self.compacting = self._pick(), 0
+            if self.compacting[0] is None:
+                self.compacting = None
+                return False
+        segment, offset = self.compacting
+        # A deletion record is dropped once no segment that may contain the
+        # deleted record remains besides this one
+        older = min(s for s in self.sizes if s != segment)
+        budget = self.compact_bytes
+        with open(self._path(segment), "rb") as f:
+            f.seek(offset)
+            while budget > 0 and offset < self.sizes[segment]:
+                crc, op, keylen, vallen = HEADER.unpack(f.read(HEADER.size))
+                key = f.read(keylen)
+                length = HEADER.size + keylen + vallen
+                value = f.read(vallen)
+                if op == PUT and self.index.get(key) == (segment, offset,
+                                                         length):
+                    self._append(PUT, key, value)
+                elif op == DELETE and key not in self.index and \
+                        older <= SEGMENT.unpack(value)[0]:
+                    self._append(DELETE, key, value)
+                offset += length
+                budget -= length
+        # The copies have to be durable before the segment is removed
+        self._sync()
+        if offset < self.sizes[segment]:
+            self.compacting = segment, offset
+            return True
+        self.compacting = None
+        fd = self.readers.pop(segment, None)
+        if fd is not None:
+            os.close(fd)
+        os.unlink(self._path(segment))
+        del self.sizes[segment]
+        del self.live[segment]
+        self.tombstones.pop(segment, None)
+        self._sync_directory()
+        self.compactions += 1
+        return self._pick() is not None
+
+    def _pick(self):
+        # Return the oldest segment worth compacting, or None. Deletion
+        # records that would be copied count as live bytes.
+        oldest = min(self.sizes)
+        for segment in sorted(self.sizes):
+            live = self.live[segment] + sum(
+                length for offset, deleted, length
+                in self.tombstones.get(segment, ())
+                if oldest <= deleted and oldest < segment)
+            if segment != self.active and \
+                    live < self.COMPACT_THRESHOLD * self.sizes[segment]:
+                return segment
+        return None
+
+    def stats(self):
+        """Return a dictionary with the number of keys and segments, the
+        total and live bytes of the segments, and the number of segments
+        removed by compaction"""
+        return {"keys": len(self.index),
+                "segments": len(self.sizes),
+                "bytes": sum(self.sizes.values()),
+                "live": sum(self.live.values()),
+                "compactions": self.compactions}
+
+    def close(self):
+        """Close the segments and the study database"""
+        for fd in self.readers.values():
+            os.close(fd)
+        self.readers = {}
+        os.close(self.fd)
+        self.studies.close()
+        os.close(self.lockfd)
+
+    def insert_kv(self, key, value):
+        """Store value under key. Raises a KeyError if the key is taken."""
+        if key in self.index:
+            raise KeyError("Key already in use")
+        self._append(PUT, key, value)
+        self._commit()
+
+    def query_kv(self, key):
+        """Return the value stored under key, or None"""
+        entry = self._entry(key)
+        if entry is None:
+            return None
+        return self._read(entry)
+
+    def delete_kv(self, key):
+        """Delete the pair stored under key. Returns False if there is
+        none."""
+        if key not in self.index:
+            return False
+        self._append(DELETE, key, SEGMENT.pack(self.index[key][0]))
+        self._commit()
+        return True
+
+    def insert_kv_many(self, pairs):
+        """Store a list of (key, value) tuples in one transaction. Returns a
+        list with one bool per pair, False if its key is taken."""
+        rv = []
+        for key, value in pairs:
+            rv.append(key not in self.index)
+            if rv[-1]:
+                self._append(PUT, key, value)
+        self._commit()
+        return rv
+
+    def query_kv_many(self, keys):
+        """Return a dictionary mapping those of the keys that are stored to
+        their values"""
+        entries = [(key, self._entry(key)) for key in keys]
+        return dict((key, self._read(entry))
+                    for key, entry in entries if entry is not None)
+
+    def delete_kv_many(self, keys):
+        """Delete the pairs of a list of keys in one transaction. Returns a
+        list with one bool per key, False if nothing was stored under it."""
+        rv = []
+        for key in keys:
+            rv.append(key in self.index)
+            if rv[-1]:
+                self._append(DELETE, key, SEGMENT.pack(self.index[key][0]))
+        self._commit()
+        return rv
+
+    def all_keys(self):
+        """Return a list of 1-tuples containing all stored keys"""
+        return [(key, ) for key in self.index]
+
+    def iter_keys(self):
+        """Iterate over all stored keys"""
+        return iter(self.index.keys())
+
+    def count_keys(self):
+        """Return the number of stored keys"""
+        return len(self.index)
@@ -0,0 +1,140 @@
+# -*- encoding: utf-8 -*-
+"""A backend keeping the key-value pairs in a dictionary.
+
+Nothing is written to disk, and everything is lost when the server stops.
+The MemoryBackend is meant for benchmarks of the network and VICBF layers,
+which measure the server without the cost of storage, and for tests.
+
+Studies are kept in an in-memory SQLite database by default.
+"""
+from storage.backend import KeyValueBackend
+from storage.sqlite import SqliteBackend
+
+
+class MemoryBackend(KeyValueBackend):
+    """Key-value pairs in a dictionary, studies in SQLite"""
+    # The in-memory study database cannot be shared with a ConnectionPool
+    READ_METHODS = frozenset()
+
+    def __init__(self, studies=None):
+        """Initialize the backend.
+
+        Keyword arguments:
+        studies -- SqliteBackend storing the studies (default: a new
+                   in-memory database)
+        """
+        if studies is None:
+            studies = SqliteBackend(":memory:")
+        KeyValueBackend.__init__(self, studies)
+        self.pairs = {}
+        # Bytes of the stored keys and values, kept up to date by every
+        # write, so that stats() does not iterate over the pairs while the
+        # storage thread changes them
+        self.bytes = 0
+        # The previous values of the keys written since the last commit,
+        # restored on rollback
+        self.undo = []
+
+    def _set(self, key, value):
+        # Store or (if value is None) delete a pair
+        self.undo.append((key, self.pairs.get(key)))
+        self._replace(key, value)
+
+    def _replace(self, key, value):
+        # Store or (if value is None) delete a pair, counting its bytes
+        old = self.pairs.pop(key, None)
+        if old is not None:
+            self.bytes -= len(key) + len(old)
+        if value is not None:
+            self.pairs[key] = value
+            self.bytes += len(key) + len(value)
+
+    def _commit(self):
+        # There is nothing to sync, but group commits can still be undone
+        if not self.group_commit:
+            self.undo = []
+
+    def commit(self):
+        """Commit all writes made since the last commit"""
+        self.undo = []
+        self.studies.commit()
+
+    def rollback(self):
+        """Discard all writes made since the last commit"""
+        self.studies.rollback()
+        for key, old in reversed(self.undo):
+            self._replace(key, old)
+        self.undo = []
+
+    def stats(self):
+        """Return a dictionary with the number of keys and the bytes of the
+        keys and values"""
+        return {"keys": len(self.pairs),
+                "bytes": self.bytes}
+
+    def close(self):
+        """Drop the pairs and close the study database"""
+        self.pairs = {}
+        self.bytes = 0
+        self.undo = []
+        self.studies.close()
+
+    def insert_kv(self, key, value):
+        """Store value under key. Raises a KeyError if the key is taken."""
+        if key in self.pairs:
+            raise KeyError("Key already in use")
+        self._set(key, value)
+        self._commit()
+
+    def query_kv(self, key):
+        """Return the value stored under key, or None"""
+        return self.pairs.get(key)
+
+    def delete_kv(self, key):
+        """Delete the pair stored under key. Returns False if there is
+        none."""
+        if key not in self.pairs:
+            return False
+        self._set(key, None)
+        self._commit()
+        return True
+
+    def insert_kv_many(self, pairs):
+        """Store a list of (key, value) tuples in one transaction. Returns a
+        list with one bool per pair, False if its key is taken."""
+        rv = []
+        for key, value in pairs:
+            rv.append(key not in self.pairs)
+            if rv[-1]:
+                self._set(key, value)
+        self._commit()
+        return rv
+
+    def query_kv_many(self, keys):
+        """Return a dictionary mapping those of the keys that are stored to
+        their values"""
+        return dict((key, self.pairs[key])
+                    for key in keys if key in self.pairs)
+
+    def delete_kv_many(self, keys):
+        """Delete the pairs of a list of keys in one transaction. Returns a
+        list with one bool per key, False if nothing was stored under it."""
+        rv = []
+        for key in keys:
+            rv.append(key in self.pairs)
+            if rv[-1]:
+                self._set(key, None)
+        self._commit()
+        return rv
+
+    def all_keys(self):
+        """Return a list of 1-tuples containing all stored keys"""
+        return [(key, ) for key in self.pairs]
+
+    def iter_keys(self):
+        """Iterate over all stored keys"""
+        return iter(self.pairs.keys())
+
+    def count_keys(self):
+        """Return the number of stored keys"""
+        return len(self.pairs)
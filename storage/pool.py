@@ -0,0 +1,83 @@
+# -*- encoding: utf-8 -*-
+"""A pool of read-only database backends shared by threads.
+
+In WAL mode, SQLite readers do not block each other or the writer, but a
+single connection can only run one statement at a time. The ConnectionPool
+keeps a fixed number of read-only backends, which threads check out for a
+query and return afterwards:
+
+    backend = pool.checkout()
+    try:
+        value = backend.query_kv(key)
+    finally:
+        pool.checkin(backend)
+
+A thread gets the backend it used last if that one is free, so its page
+cache stays warm. If all backends are in use, checkout() waits; the time
+spent waiting is recorded, so an undersized pool shows up in the stats.
+"""
+import threading
+import time
+
+
+class ConnectionPool():
+    """Fixed set of read-only backends, checked out by one thread at a time"""
+
+    def __init__(self, factory, size=2):
+        """Initialize the pool.
+
+        Keyword arguments:
+        factory -- Function returning a new read-only backend
+        size    -- Number of backends to open (default: 2)
+        """
+        if size < 1:
+            raise ValueError("size must be >=1")
+        self.size = size
+        self.free = [factory() for i in xrange(size)]
+        self.backends = list(self.free)
+        self.cond = threading.Condition()
+        # The backend each thread has used last
+        self.local = threading.local()
+        self.checkouts = 0
+        self.waits = 0
+        self.waited = 0.0
+
+    def checkout(self):
+        """Return a free backend, waiting until one is returned if needed"""
+        with self.cond:
+            if not self.free:
+                self.waits += 1
+                start = time.time()
+                while not self.free:
+                    self.cond.wait()
+                self.waited += time.time() - start
+            self.checkouts += 1
+            last = getattr(self.local, "backend", None)
+            if last in self.free:
+                self.free.remove(last)
+                return last
+            backend = self.free.pop()
+            self.local.backend = backend
+            return backend
+
+    def checkin(self, backend):
+        """Return a backend obtained from checkout()"""
+        with self.cond:
+            self.free.append(backend)
+            self.cond.notify()
+
+    def stats(self):
+        """Return a dictionary with the number of backends, checkouts and
+        checkouts that had to wait, and the average milliseconds waited"""
+        with self.cond:
+            return {"size": self.size,
+                    "checkouts": self.checkouts,
+                    "waits": self.waits,
+                    "wait": self.waited * 1000 / max(self.checkouts, 1)}
+
+    def close(self):
+        """Close all backends. None of them may be checked out."""
+        for backend in self.backends:
+            backend.close()
+        self.free = []
+        self.backends = []
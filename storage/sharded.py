@@ -0,0 +1,268 @@
+# -*- encoding: utf-8 -*-
+"""Key-value pairs spread over several SQLite databases.
+
+A single database has a single writer lock, so all writes of all workers
+queue for it, and a VACUUM or backup has to process the whole file. The
+ShardedBackend routes every pair to one of several shard databases by the
+leading two bytes of its key. Keys are SHA-256 digests, so the pairs are
+distributed uniformly. Writes to different shards do not contend for the
+same lock, and maintenance() processes one shard per call.
+
+For a database "denul.db" and 4 shards, the pairs are kept in
+"denul-0-of-4.db" to "denul-3-of-4.db", the studies in "denul.db". As the
+shard of a key depends on the number of shards, it cannot be changed
+without moving the pairs; opening shards created for another number fails.
+
+Writes to several shards, e.g. by insert_kv_many, are committed shard by
+shard. A crash in between may keep the writes of some shards only.
+
+With group commit, every shard written to holds its write lock until the
+next commit. Processes locking the shards in different orders would wait
+for each other, so the backend may only be used by a single process.
+"""
+import glob
+import os
+import Queue
+import threading
+
+from storage.backend import KeyValueBackend
+from storage.sqlite import SqliteBackend
+
+
+class ShardedBackend(KeyValueBackend):
+    """Key-value pairs in shard databases, studies in the main database"""
+    # Read-only instances can serve all reads, see readonly
+    READ_METHODS = SqliteBackend.READ_METHODS
+
+    def __init__(self, dbname="denul.db", shards=4, readonly=False,
+                 **options):
+        """Open the main database and the shards, creating them if needed.
+
+        Keyword arguments:
+        dbname   -- Name of the main database file, the names of the shards
+                    are derived from it (default: denul.db)
+        shards   -- Number of shard databases (default: 4)
+        readonly -- Open additional connections that may only be used for
+                    READ_METHODS, e.g. by a ConnectionPool (default: False)
+        options  -- Further keyword arguments for every SqliteBackend, e.g.
+                    journal_mode or cache_size
+        """
+        if shards < 1:
+            raise ValueError("shards must be >=1")
+        base = os.path.splitext(dbname)[0]
+        names = ["%s-%i-of-%i.db" % (base, i, shards)
+                 for i in xrange(shards)]
+        # Shards of another configuration hold pairs this one cannot find
+        for name in glob.glob("%s-*-of-*.db" % base):
+            if name not in names:
+                raise ValueError("%s belongs to a different number of "
+                                 "shards than %i" % (name, shards))
+        KeyValueBackend.__init__(self, SqliteBackend(dbname,
+                                                     readonly=readonly,
+                                                     **options))
+        # The shards also contain the (empty) study tables, so they can be
+        # opened like any other database
+        self.shards = [SqliteBackend(name, readonly=readonly, **options)
+                       for name in names]
+        self.names = names
+        # Number of pairs inserted and deleted through this backend, by shard
+        self.inserts = [0] * shards
+        self.deletes = [0] * shards
+        # The shards to start the next expiry and maintenance at
+        self.expiring = 0
+        self.maintaining = 0
+
+    def _index(self, key):
+        # Return the index of the shard storing key
+        return (ord(key[0]) << 8 | ord(key[1])) % len(self.shards)
+
+    def _use(self, backend):
+        # The shards follow the commit mode set by a GroupCommitter
+        backend.group_commit = self.group_commit
+        return backend
+
+    def _split(self, keys):
+        # Map the index of every shard to the positions of its keys
+        groups = {}
+        for position, key in enumerate(keys):
+            groups.setdefault(self._index(key), []).append(position)
+        return groups
+
+    def commit(self):
+        """Commit all writes made since the last commit, shard by shard"""
+        for shard in self.shards:
+            shard.commit()
+        self.studies.commit()
+
+    def rollback(self):
+        """Discard all writes made since the last commit"""
+        for shard in self.shards:
+            shard.rollback()
+        self.studies.rollback()
+
+    def maintenance(self):
+        """Run the maintenance of the next shard, or of the main database
+        after the last shard. Returns True if it has more work waiting."""
+        backends = self.shards + [self.studies]
+        backend = self._use(backends[self.maintaining])
+        self.maintaining = (self.maintaining + 1) % len(backends)
+        return backend.maintenance()
+
+    def stats(self):
+        """Return a dictionary with the number of shards, and lists of the
+        pairs inserted and deleted through this backend and the bytes of
+        the database and WAL files of every shard"""
+        sizes = []
+        for name in self.names:
+            size = 0
+            for path in (name, name + "-wal"):
+                if os.path.exists(path):
+                    size += os.path.getsize(path)
+            sizes.append(size)
+        return {"shards": len(self.shards),
+                "inserts": list(self.inserts),
+                "deletes": list(self.deletes),
+                "bytes": sizes}
+
+    def close(self):
+        """Close the shards and the main database"""
+        for shard in self.shards:
+            shard.close()
+        self.studies.close()
+
+    def insert_kv(self, key, value):
+        """Store value under key. Raises a KeyError if the key is taken."""
+        index = self._index(key)
+        self._use(self.shards[index]).insert_kv(key, value)
+        self.inserts[index] += 1
+
+    def query_kv(self, key):
+        """Return the value stored under key, or None"""
+        return self.shards[self._index(key)].query_kv(key)
+
+    def delete_kv(self, key):
+        """Delete the pair stored under key. Returns False if there is
+        none."""
+        index = self._index(key)
+        if not self._use(self.shards[index]).delete_kv(key):
+            return False
+        self.deletes[index] += 1
+        return True
+
+    def insert_kv_many(self, pairs):
+        """Store a list of (key, value) tuples, in one transaction per
+        shard. Returns a list with one bool per pair, False if its key is
+        taken."""
+        rv = [False] * len(pairs)
+        for index, positions in self._split(
+                [key for key, value in pairs]).iteritems():
+            results = self._use(self.shards[index]).insert_kv_many(
+                [pairs[position] for position in positions])
+            for position, ok in zip(positions, results):
+                rv[position] = ok
+            self.inserts[index] += results.count(True)
+        return rv
+
+    def query_kv_many(self, keys):
+        """Return a dictionary mapping those of the keys that are stored to
+        their values"""
+        rv = {}
+        for index, positions in self._split(keys).iteritems():
+            rv.update(self.shards[index].query_kv_many(
+                [keys[position] for position in positions]))
+        return rv
+
+    def delete_kv_many(self, keys):
+        """Delete the pairs of a list of keys, in one transaction per shard.
+        Returns a list with one bool per key, False if nothing was stored
+        under it."""
+        rv = [False] * len(keys)
+        for index, positions in self._split(keys).iteritems():
+            results = self._use(self.shards[index]).delete_kv_many(
+                [keys[position] for position in positions])
+            for position, ok in zip(positions, results):
+                rv[position] = ok
+            self.deletes[index] += results.count(True)
+        return rv
+
+    def expire_kv(self, before, limit):
+        """Delete up to limit pairs inserted before the given time, oldest
+        first within each shard. Returns the list of deleted keys."""
+        keys = []
+        count = len(self.shards)
+        for i in xrange(count):
+            index = (self.expiring + i) % count
+            expired = self._use(self.shards[index]).expire_kv(
+                before, limit - len(keys))
+            self.deletes[index] += len(expired)
+            keys += expired
+            if len(keys) >= limit:
+                break
+        # Start at the next shard next time, so that all of them get a turn
+        self.expiring = (self.expiring + 1) % count
+        return keys
+
+    def all_keys(self):
+        """Return a list of 1-tuples containing all stored keys"""
+        return [(key, ) for key in self.iter_keys()]
+
+    def iter_keys(self, chunksize=10000):
+        """Iterate over all stored keys. The shards are read in parallel,
+        one thread per shard, while the keys read so far are consumed.
+
+        Keyword arguments:
+        chunksize -- Number of keys every thread reads at once (default:
+                     10000)
+        """
+        chunks = Queue.Queue(maxsize=2 * len(self.shards))
+        stop = threading.Event()
+
+        def put(item):
+            # Hand an item to the consumer, unless it has stopped iterating
+            while not stop.is_set():
+                try:
+                    chunks.put(item, timeout=0.1)
+                    return True
+                except Queue.Full:
+                    pass
+            return False
+
+        def read(shard):
+            try:
+                chunk = []
+                for key in shard.iter_keys(chunksize):
+                    chunk.append(key)
+                    if len(chunk) >= chunksize:
+                        if not put(chunk):
+                            return
+                        chunk = []
+                put(chunk)
+                put(None)
+            except Exception, e:
+                put(e)
+
+        threads = [threading.Thread(target=read, args=(shard, ),
+                                    name="shard-reader")
+                   for shard in self.shards]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            running = len(threads)
+            while running:
+                chunk = chunks.get()
+                if chunk is None:
+                    running -= 1
+                elif isinstance(chunk, Exception):
+                    raise chunk
+                else:
+                    for key in chunk:
+                        yield key
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def count_keys(self):
+        """Return the number of stored keys"""
+        return sum(shard.count_keys() for shard in self.shards)
@@ -1,31 +1,94 @@
 # -*- encoding: utf-8 -*-
 
 import sqlite3
-
-
-class SqliteBackend():
-    SCHEMA_VERSION = 2
+import time
+
+from storage.backend import StorageBackend
+
+
+class SqliteBackend(StorageBackend):
+    SCHEMA_VERSION = 6
+    # Maximum number of parameters of a statement. Older SQLite versions do
+    # not allow more than 999.
+    MAX_PARAMETERS = 999
+    # Methods that only read, and may be called on a read-only backend
+    READ_METHODS = frozenset(["query_kv", "query_kv_many", "all_keys",
+                              "count_keys", "list_studies",
+                              "query_study_pkey"])
+    # Number of free pages maintenance() returns to the file system at once
+    VACUUM_PAGES = 256
     """The SQLite storage backend of the server application.
 
     Data is saved into and read from a local SQLite database.
     """
 
-    def __init__(self, dbname="denul.db"):
+    def __init__(self, dbname="denul.db", journal_mode=None, synchronous=None,
+                 cache_size=None, mmap_size=None, readonly=False):
         """Initialize the DB backend.
 
         Open the SQLite database and perform sanity checks.
 
         Keywork arguments:
-        dbname -- Name of the DB file. (default: denul.db)
+        dbname       -- Name of the DB file. (default: denul.db)
+        journal_mode -- SQLite journal mode, e.g. "wal" (default: SQLite
+                        default)
+        synchronous  -- SQLite synchronous setting: "off", "normal" or "full"
+                        (default: SQLite default)
+        cache_size   -- Page cache size, in pages if positive, in KiB if
+                        negative (default: SQLite default)
+        mmap_size    -- Number of bytes of the database file to access via
+                        memory mapping (default: SQLite default)
+        readonly     -- Open an additional connection to an existing database
+                        that may only be used for READ_METHODS, e.g. by a
+                        ConnectionPool. The journal mode is not changed, and
+                        the layout is not validated. (default: False)
         """
-        self.conn = sqlite3.connect(dbname)
+        # Take the write lock when a write transaction begins. Otherwise, a
+        # transaction that has read an older snapshot fails right away in WAL
+        # mode if another process commits first, instead of waiting for the
+        # lock.
+        # The connection may be handed to a storage thread (see
+        # storage/executor.py), which makes all calls while it is running.
+        self.conn = sqlite3.connect(dbname, isolation_level="IMMEDIATE",
+                                    check_same_thread=False)
+        # If set, write methods leave their transaction open, so many writes
+        # can be committed together by calling commit()
+        self.group_commit = False
+        # Indicates that the open transaction contains successful writes
+        self.dirty = False
 
         # Enable foreign key support
         c = self.conn.cursor()
         c.execute("PRAGMA FOREIGN_KEYS = ON;")
 
+        if readonly:
+            c.execute("PRAGMA query_only = ON;")
+            journal_mode = None
+        else:
+            # Let maintenance() shrink the file after deletions. Only takes
+            # effect in new databases, as it has to be set before the first
+            # table is created (or the journal mode is changed to WAL).
+            c.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+
+        # Apply tuning options. The values are checked, as PRAGMA statements
+        # do not accept parameters.
+        if journal_mode is not None:
+            if journal_mode.lower() not in ("delete", "truncate", "persist",
+                                            "memory", "wal", "off"):
+                raise ValueError("Unknown journal mode: " + journal_mode)
+            c.execute("PRAGMA journal_mode = %s;" % journal_mode)
+        if synchronous is not None:
+            if synchronous.lower() not in ("off", "normal", "full", "extra"):
+                raise ValueError("Unknown synchronous setting: " + synchronous)
+            c.execute("PRAGMA synchronous = %s;" % synchronous)
+        if cache_size is not None:
+            c.execute("PRAGMA cache_size = %i;" % cache_size)
+        if mmap_size is not None:
+            c.execute("PRAGMA mmap_size = %i;" % mmap_size)
+
         # Validate layout
-        self._validate_layout()
+        if not readonly:
+            self._validate_layout()
 
     def _validate_layout(self):
         """Validate if the format of the database is sane"""
@@ -47,27 +110,156 @@ class SqliteBackend():
         # Get a cursor
         c = self.conn.cursor()
 
-        # Create table for key-value-pairs
-        c.execute("CREATE TABLE kv (key blob, value blob);")
+        # Create table for key-value-pairs. The key is the primary key, so
+        # lookups use the index instead of scanning the table. created is
+        # the time of the insertion, in seconds since the epoch.
+        c.execute("CREATE TABLE kv (key BLOB PRIMARY KEY NOT NULL, value BLOB, created INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID;")
+        c.execute("CREATE INDEX kv_created ON kv (created);")
         c.execute("CREATE TABLE study (id INTEGER PRIMARY KEY, ident BLOB, pubkey BLOB, message BLOB);")
-        c.execute("CREATE TABLE studyEntry (id INTEGER PRIMARY KEY, study INTEGER, data BLOB, FOREIGN KEY (study) REFERENCES study(id) ON DELETE CASCADE);")
+        c.execute("CREATE UNIQUE INDEX study_ident ON study (ident);")
+        # The IDs of queued messages double as their queue positions, so
+        # they must never be reused
+        c.execute("CREATE TABLE studyEntry (id INTEGER PRIMARY KEY AUTOINCREMENT, study INTEGER, data BLOB, FOREIGN KEY (study) REFERENCES study(id) ON DELETE CASCADE);")
+        c.execute("CREATE INDEX studyEntry_study ON studyEntry (study);")
+        self._create_study_request_layout(c)
         # Set the user_version pragma to indicate the version of the DB layout
-        c.execute("PRAGMA user_version = 2")
+        c.execute("PRAGMA user_version = 6")
 
         # Commit transaction
         self.conn.commit()
 
+    def _create_study_request_layout(self, c):
+        """Create the table of the data types requested by studies"""
+        # Every study may request several combinations of data type and
+        # granularity. The primary key allows listing studies by data type,
+        # the indexes by granularity alone, and deleting studies.
+        c.execute("CREATE TABLE studyRequest (datatype INTEGER NOT NULL, granularity INTEGER NOT NULL, study INTEGER NOT NULL, PRIMARY KEY (datatype, granularity, study), FOREIGN KEY (study) REFERENCES study(id) ON DELETE CASCADE) WITHOUT ROWID;")
+        c.execute("CREATE INDEX studyRequest_granularity ON studyRequest (granularity, study);")
+        c.execute("CREATE INDEX studyRequest_study ON studyRequest (study);")
+
     def _upgrade(self, old, new):
-        """Upgrade the database scheme"""
+        """Upgrade the database scheme, one version at a time"""
         c = self.conn.cursor()
 
-        if old == 1 and new == 2:
-            # Add new tables
-            c.execute("CREATE TABLE study (id INTEGER PRIMARY KEY, ident BLOB, pubkey BLOB, message BLOB);")
-            c.execute("CREATE TABLE studyEntry (id INTEGER PRIMARY KEY, study INTEGER, data BLOB, FOREIGN KEY (study) REFERENCES study(id) ON DELETE CASCADE);")
-            c.execute("PRAGMA user_version = 2;")
+        while old < new:
+            if old == 1:
+                # Add new tables
+                c.execute("CREATE TABLE study (id INTEGER PRIMARY KEY, ident BLOB, pubkey BLOB, message BLOB);")
+                c.execute("CREATE TABLE studyEntry (id INTEGER PRIMARY KEY, study INTEGER, data BLOB, FOREIGN KEY (study) REFERENCES study(id) ON DELETE CASCADE);")
+                c.execute("PRAGMA user_version = 2;")
+            elif old == 2:
+                # Add indexes. The unique constraints may not have been
+                # enforced before, so duplicates are removed first, keeping
+                # the oldest entry. Runs as a single transaction, so an
+                # interrupted upgrade leaves the database at version 2.
+                c.executescript("""
+                    BEGIN;
+                    CREATE TABLE kv_new (key BLOB PRIMARY KEY NOT NULL, value BLOB) WITHOUT ROWID;
+                    INSERT OR IGNORE INTO kv_new (key, value)
+                        SELECT key, value FROM kv WHERE key IS NOT NULL ORDER BY rowid;
+                    DROP TABLE kv;
+                    ALTER TABLE kv_new RENAME TO kv;
+                    DELETE FROM study WHERE id NOT IN
+                        (SELECT MIN(id) FROM study GROUP BY ident);
+                    DELETE FROM studyEntry WHERE study NOT IN
+                        (SELECT id FROM study);
+                    CREATE UNIQUE INDEX study_ident ON study (ident);
+                    CREATE INDEX studyEntry_study ON studyEntry (study);
+                    PRAGMA user_version = 3;
+                    COMMIT;
+                    """)
+            elif old == 3:
+                # Never reuse the IDs of queued messages, as they are used as
+                # queue positions. Copying the entries sets the sequence to
+                # the highest existing ID.
+                c.executescript("""
+                    BEGIN;
+                    CREATE TABLE studyEntry_new (id INTEGER PRIMARY KEY AUTOINCREMENT, study INTEGER, data BLOB, FOREIGN KEY (study) REFERENCES study(id) ON DELETE CASCADE);
+                    INSERT INTO studyEntry_new (id, study, data)
+                        SELECT id, study, data FROM studyEntry;
+                    DROP TABLE studyEntry;
+                    ALTER TABLE studyEntry_new RENAME TO studyEntry;
+                    CREATE INDEX studyEntry_study ON studyEntry (study);
+                    PRAGMA user_version = 4;
+                    COMMIT;
+                    """)
+            elif old == 4:
+                # Extract the data types requested by existing studies from
+                # their stored messages. Transactions are controlled
+                # explicitly, as the sqlite3 module would otherwise commit
+                # before every CREATE statement.
+                from messages.studyMessage_pb2 import StudyCreate, \
+                    StudyWrapper
+                self.conn.isolation_level = None
+                c.execute("BEGIN;")
+                self._create_study_request_layout(c)
+                requests = []
+                for dbid, message in c.execute("SELECT id, message FROM study;").fetchall():
+                    wrapper = StudyWrapper()
+                    screate = StudyCreate()
+                    try:
+                        wrapper.ParseFromString(str(message))
+                        screate.ParseFromString(wrapper.message)
+                    except Exception:
+                        continue
+                    requests += [(dr.datatype, dr.granularity, dbid)
+                                 for dr in screate.dataRequest]
+                c.executemany("INSERT OR IGNORE INTO studyRequest (datatype, granularity, study) VALUES (?, ?, ?);",
+                              requests)
+                c.execute("PRAGMA user_version = 5;")
+                c.execute("COMMIT;")
+                self.conn.isolation_level = "IMMEDIATE"
+            elif old == 5:
+                # Record when pairs are inserted, so they can expire. The
+                # time of existing pairs is unknown, they count as inserted
+                # now. Incremental vacuuming would require rebuilding the
+                # database with VACUUM, which is left to the administrator.
+                c.executescript("""
+                    BEGIN;
+                    ALTER TABLE kv ADD COLUMN created INTEGER NOT NULL DEFAULT 0;
+                    UPDATE kv SET created = %i;
+                    CREATE INDEX kv_created ON kv (created);
+                    PRAGMA user_version = 6;
+                    COMMIT;
+                    """ % time.time())
+            else:
+                print "Unknown database upgrade path:", old, "to", new
+                return
+            old += 1
+
+    def _commit(self):
+        """Commit the current transaction, unless commits are grouped"""
+        if self.group_commit:
+            self.dirty = True
         else:
-            print "Unknown database upgrade path:", old, "to", new
+            self.conn.commit()
+
+    def _begin(self):
+        """Start a write transaction, so that subsequent reads are isolated
+        from other processes. Joins the open transaction if commits are
+        grouped and writes are pending."""
+        if not self.dirty:
+            self.conn.execute("BEGIN IMMEDIATE;")
+
+    def _rollback(self):
+        """End a transaction without changes after a statement failed.
+
+        If commits are grouped, the transaction may contain writes of other
+        requests. It is left open in that case: A failed statement only
+        undoes its own changes.
+        """
+        if not self.dirty:
+            self.conn.rollback()
+
+    def commit(self):
+        """Commit all writes made since the last commit"""
+        self.conn.commit()
+        self.dirty = False
+
+    def rollback(self):
+        """Discard all writes made since the last commit"""
+        self.conn.rollback()
+        self.dirty = False
 
     def insert_kv(self, key, value):
         """Insert a key-value-pair into the database
@@ -75,19 +267,21 @@ class SqliteBackend():
         Keyword arguments:
         key   -- Key under which the value should be stored
         value -- Value that should be stored
+
+        Raises a KeyError if something is already stored under the key.
         """
         # Get a cursor
         c = self.conn.cursor()
 
-        # Check if something already exists under that key
-        c.execute("SELECT * FROM kv WHERE key = ?", (sqlite3.Binary(key), ))
-        if c.fetchone() is not None:
+        # Perform the insertion. The primary key rejects keys that are
+        # already in use, so no separate check is needed.
+        try:
+            c.execute("INSERT INTO kv (key, value, created) VALUES (?, ?, ?)", (sqlite3.Binary(key), sqlite3.Binary(value), int(time.time())))
+        except sqlite3.IntegrityError:
+            self._rollback()
             raise KeyError("Key already in use")
-
-        # Perform the insertion
-        c.execute("INSERT INTO kv VALUES (?, ?)", (sqlite3.Binary(key), sqlite3.Binary(value)))
         # Commit transaction
-        self.conn.commit()
+        self._commit()
 
     def query_kv(self, key):
         """Query the database for the value associated with a key
@@ -118,21 +312,141 @@ class SqliteBackend():
         Returns True if the pair has been deleted, False if no such pair
         existed.
         """
-        # Check if the key exists
-        if self.query_kv(key) is None:
-            return False
-
         # Get a cursor
         c = self.conn.cursor()
 
         # Perform deletion
         c.execute("DELETE FROM kv WHERE key = ?", (sqlite3.Binary(key), ))
+        if c.rowcount != 1:
+            # No such key
+            self._rollback()
+            return False
         # Commit transaction
-        self.conn.commit()
+        self._commit()
 
         # Return success
         return True
 
+    def insert_kv_many(self, pairs):
+        """Insert key-value-pairs into the database in one transaction
+
+        Keyword arguments:
+        pairs -- List of (key, value) tuples
+
+        Returns a list with one entry per pair: True if it was inserted, False
+        if something is already stored under its key (including an earlier
+        pair of the same list).
+        """
+        # Get a cursor
+        c = self.conn.cursor()
+        self._begin()
+        rv = []
+        for key, value in pairs:
+            # A failed insert only undoes its own statement
+            try:
+                c.execute("INSERT INTO kv (key, value, created) VALUES (?, ?, ?)", (sqlite3.Binary(key), sqlite3.Binary(value), int(time.time())))
+            except sqlite3.IntegrityError:
+                rv.append(False)
+            else:
+                rv.append(True)
+        # Commit transaction, unless nothing has been inserted
+        if any(rv):
+            self._commit()
+        else:
+            self._rollback()
+        return rv
+
+    def query_kv_many(self, keys):
+        """Query the database for the values associated with keys
+
+        Keyword arguments:
+        keys -- List of keys that should be queried
+
+        Returns a dictionary mapping the keys that have a value to it.
+        """
+        # Get a cursor
+        c = self.conn.cursor()
+        rv = {}
+        # Query in chunks, as the number of parameters of a statement is
+        # limited
+        for start in range(0, len(keys), self.MAX_PARAMETERS):
+            chunk = keys[start:start + self.MAX_PARAMETERS]
+            c.execute("SELECT key, value FROM kv WHERE key IN (%s)"
+                      % ", ".join("?" * len(chunk)),
+                      [sqlite3.Binary(key) for key in chunk])
+            for key, value in c.fetchall():
+                rv[str(key)] = value
+        return rv
+
+    def delete_kv_many(self, keys):
+        """Delete key-value-pairs from the database in one transaction
+
+        Keyword arguments:
+        keys -- List of keys of the pairs that should be deleted
+
+        Returns a list with one entry per key: True if the pair was deleted,
+        False if there was no such pair.
+        """
+        # Get a cursor
+        c = self.conn.cursor()
+        self._begin()
+        rv = []
+        for key in keys:
+            c.execute("DELETE FROM kv WHERE key = ?", (sqlite3.Binary(key), ))
+            rv.append(c.rowcount == 1)
+        # Commit transaction, unless nothing has been deleted
+        if any(rv):
+            self._commit()
+        else:
+            self._rollback()
+        return rv
+
+    def expire_kv(self, before, limit):
+        """Delete pairs inserted before a point in time, oldest first
+
+        Keyword arguments:
+        before -- Time in seconds since the epoch. Pairs inserted earlier
+                  are deleted.
+        limit  -- Maximum number of pairs to delete
+
+        Returns the list of deleted keys.
+        """
+        # Get a cursor
+        c = self.conn.cursor()
+        self._begin()
+        c.execute("SELECT key FROM kv WHERE created < ? ORDER BY created LIMIT ?",
+                  (int(before), limit))
+        keys = [str(row[0]) for row in c.fetchall()]
+        c.executemany("DELETE FROM kv WHERE key = ?",
+                      [(sqlite3.Binary(key), ) for key in keys])
+        # Commit transaction, unless nothing has been deleted
+        if keys:
+            self._commit()
+        else:
+            self._rollback()
+        return keys
+
+    def maintenance(self):
+        """Return up to VACUUM_PAGES free pages to the file system and
+        checkpoint the WAL. Skipped while grouped writes are pending, as
+        the sqlite3 module would commit them first. Returns True if free
+        pages remain."""
+        if self.dirty:
+            return False
+        # Get a cursor
+        c = self.conn.cursor()
+        # Does nothing unless auto_vacuum is INCREMENTAL. Every step frees
+        # one page, so all rows have to be fetched.
+        c.execute("PRAGMA incremental_vacuum(%i);" % self.VACUUM_PAGES)
+        c.fetchall()
+        # Does nothing unless the database is in WAL mode
+        c.execute("PRAGMA wal_checkpoint(PASSIVE);")
+        c.execute("PRAGMA auto_vacuum;")
+        if c.fetchone()[0] != 2:
+            return False
+        c.execute("PRAGMA freelist_count;")
+        return c.fetchone()[0] > 0
+
     def all_keys(self):
         """Read all keys from the database and return them as a list."""
         # Get a cursor
@@ -144,73 +458,255 @@ class SqliteBackend():
         # return result
         return c.fetchall()
 
-    def insert_study(self, ident, pubkey, msg):
-        """Insert a new study into the database"""
+    def iter_keys(self, chunksize=10000):
+        """Iterate over all keys in the database.
+
+        Keys are read in chunks, so only chunksize keys are held in memory at
+        a time, no matter how many keys the database contains.
+
+        Keyword arguments:
+        chunksize -- Number of keys to read at once (default: 10000)
+        """
         # Get a cursor
         c = self.conn.cursor()
 
-        c.execute("SELECT * FROM study WHERE ident LIKE ?;",
-                  (sqlite3.Binary(ident), ))
-        if c.fetchone() is not None:
+        # Retrieve all keys
+        c.execute("SELECT key FROM kv")
+
+        # Yield keys one chunk at a time
+        rows = c.fetchmany(chunksize)
+        while rows:
+            for row in rows:
+                yield str(row[0])
+            rows = c.fetchmany(chunksize)
+
+    def count_keys(self):
+        """Return the number of keys in the database"""
+        # Get a cursor
+        c = self.conn.cursor()
+
+        # Count keys
+        c.execute("SELECT COUNT(*) FROM kv")
+
+        # Return result
+        return c.fetchone()[0]
+
+    def insert_study(self, ident, pubkey, msg, datarequests=()):
+        """Insert a new study into the database
+
+        Keyword arguments:
+        ident        -- Queue identifier of the study
+        pubkey       -- Public key of the study
+        msg          -- StudyWrapper message containing the study
+        datarequests -- (datatype, granularity) tuples of the data requested
+                        by the study, which list_studies can filter by
+                        (default: none)
+
+        Returns False if the identifier is already taken.
+        """
+        # Get a cursor
+        c = self.conn.cursor()
+
+        # Run insert. The unique index on ident rejects duplicates.
+        try:
+            c.execute("INSERT INTO study (ident, pubkey, message) VALUES (?, ?, ?)",
+                      (sqlite3.Binary(ident), sqlite3.Binary(pubkey),
+                       sqlite3.Binary(msg.SerializeToString())))
+        except sqlite3.IntegrityError:
+            self._rollback()
             return False
-        # Run insert
-        c.execute("INSERT INTO study (ident, pubkey, message) VALUES (?, ?, ?)",
-                  (sqlite3.Binary(ident), sqlite3.Binary(pubkey),
-                   sqlite3.Binary(msg.SerializeToString())))
+        dbid = c.lastrowid
+        c.executemany("INSERT OR IGNORE INTO studyRequest (datatype, granularity, study) VALUES (?, ?, ?);",
+                      [(datatype, granularity, dbid)
+                       for datatype, granularity in datarequests])
         # Commit
-        self.conn.commit()
+        self._commit()
         return True
 
-    def list_studies(self):
-        """Get a List of Studies in the database"""
+    def list_studies(self, datatype=None, granularity=None, after=0,
+                     limit=None):
+        """Get a List of Studies in the database
+
+        Keyword arguments:
+        datatype    -- Only list studies requesting this data type
+                       (default: any)
+        granularity -- Only list studies requesting data at this granularity
+                       (default: any). If datatype is given as well, both
+                       have to match the same data request.
+        after       -- Only list studies with a database ID above this one,
+                       to continue a previous listing (default: 0)
+        limit       -- Maximum number of studies to list (default: no limit)
+
+        Returns a list of (id, message) tuples, ordered by ID. The messages
+        need to be parsed by the caller.
+        """
         # Get a cursor
         c = self.conn.cursor()
+        if limit is None:
+            limit = -1
         # Run query
-        c.execute("SELECT message FROM study;")
-        # Return raw result (needs to be parsed into messages by caller)
+        if datatype is None and granularity is None:
+            c.execute("SELECT id, message FROM study WHERE id > ? "
+                      "ORDER BY id LIMIT ?;", (after, limit))
+        else:
+            # Find the matching studies on the studyRequest indexes first
+            conditions = []
+            args = []
+            if datatype is not None:
+                conditions.append("datatype = ?")
+                args.append(datatype)
+            if granularity is not None:
+                conditions.append("granularity = ?")
+                args.append(granularity)
+            c.execute("SELECT id, message FROM study WHERE id IN "
+                      "(SELECT DISTINCT study FROM studyRequest WHERE %s AND "
+                      "study > ? ORDER BY study LIMIT ?) ORDER BY id;"
+                      % " AND ".join(conditions), args + [after, limit])
+        # Return raw result
         return c.fetchall()
 
     def insert_studyjoin(self, ident, data):
-        """Insert a studyJoin message into the database"""
+        """Insert a studyJoin message into the database
+
+        Returns False if there is no study with the given identifier.
+        """
         # Get a cursor
         c = self.conn.cursor()
 
-        # Determine Database ID of study
-        c.execute("SELECT id FROM study WHERE ident LIKE ?;",
-                  (sqlite3.Binary(ident), ))
-        # Fetch result
-        try:
-            pkey = c.fetchone()[0]
-        except (TypeError, IndexError):
-            # Something went wrong while retrieving the primary key
-            # No such study?
+        # Look up the database ID of the study and insert in one statement.
+        # Nothing is inserted if there is no such study.
+        c.execute("INSERT INTO studyEntry (study, data) "
+                  "SELECT id, ? FROM study WHERE ident = ?;",
+                  (sqlite3.Binary(data), sqlite3.Binary(ident)))
+        if c.rowcount != 1:
+            self._rollback()
             return False
-
-        # Run insert
-        c.execute("INSERT INTO studyEntry (study, data) VALUES (?, ?);",
-                  (pkey, sqlite3.Binary(data)))
         # Commit
-        self.conn.commit()
+        self._commit()
         # Indicate success
         return True
 
-    def query_study(self, ident):
+    def insert_studyjoin_many(self, joins):
+        """Insert studyJoin messages into the database in one transaction
+
+        Keyword arguments:
+        joins -- List of (ident, data) tuples
+
+        Returns a list with one entry per join: True if it was inserted,
+        False if there is no study with its identifier.
+        """
+        # Get a cursor
+        c = self.conn.cursor()
+        self._begin()
+        rv = []
+        for ident, data in joins:
+            c.execute("INSERT INTO studyEntry (study, data) "
+                      "SELECT id, ? FROM study WHERE ident = ?;",
+                      (sqlite3.Binary(data), sqlite3.Binary(ident)))
+            rv.append(c.rowcount == 1)
+        # Commit transaction, unless nothing has been inserted
+        if any(rv):
+            self._commit()
+        else:
+            self._rollback()
+        return rv
+
+    def query_study(self, ident, limit=None):
+        """Remove and return the queued messages of a study.
+
+        The messages are read and deleted in one transaction, so messages
+        queued concurrently are neither lost nor returned twice. Returns a
+        list of 1-tuples containing the messages, in the order they were
+        queued.
+
+        Keyword arguments:
+        ident -- Queue identifier of the study
+        limit -- Maximum number of messages to remove and return. Further
+                 messages stay queued. (default: no limit)
+        """
+        return self.query_study_more(ident, limit)[0]
+
+    def query_study_more(self, ident, limit=None):
+        """Remove and return the queued messages of a study, like
+        query_study, and tell whether further messages remain queued.
+
+        Returns a tuple of the list of 1-tuples containing the messages, and
+        True if more than limit messages were queued.
+        """
         # Get a cursor
         c = self.conn.cursor()
+        # Read and delete in one transaction
+        self._begin()
         # Determine database ID
-        c.execute("SELECT id FROM study WHERE ident LIKE ?;",
+        c.execute("SELECT id FROM study WHERE ident = ?;",
                   (sqlite3.Binary(ident), ))
         try:
             dbid = c.fetchone()[0]
         except (IndexError, TypeError):
-            return []
-        # Read all data blocks related to that study from the DB
-        c.execute("SELECT data FROM studyEntry WHERE study LIKE ?;",
-                  (dbid, ))
+            self._rollback()
+            return [], False
+        # Read the oldest data blocks related to that study from the DB, and
+        # one more to find out if there are further ones
+        c.execute("SELECT id, data FROM studyEntry WHERE study = ? "
+                  "ORDER BY id LIMIT ?;",
+                  (dbid, -1 if limit is None else limit + 1))
+        rows = c.fetchall()
+        more = limit is not None and len(rows) > limit
+        rows = rows[:limit]
+        if not rows:
+            self._rollback()
+            return [], more
+        # Delete the database entries that have been read, but no entries
+        # queued after them
+        c.execute("DELETE FROM studyEntry WHERE study = ? AND id <= ?;",
+                  (dbid, rows[-1][0]))
+        # Commit, so the database is not kept locked
+        self._commit()
+        # Return
+        return [(data, ) for _, data in rows], more
+
+    def read_study_queue(self, ident, ack=0, limit=None):
+        """Return queued messages of a study without removing them.
+
+        Messages are only removed once they are acknowledged, so messages
+        that never reach the client (e.g. because the connection breaks) are
+        returned again by the next call. Each message comes with its queue
+        position; passing the position of the last received message as ack
+        removes it and all earlier ones.
+
+        Keyword arguments:
+        ident -- Queue identifier of the study
+        ack   -- Position of the last message the client has received. All
+                 messages up to and including it are removed. (default: 0)
+        limit -- Maximum number of messages to return (default: no limit)
+
+        Returns a list of (position, message) tuples in queue order, or None
+        if there is no such study.
+        """
+        # Get a cursor
+        c = self.conn.cursor()
+        # Acknowledge and read in one transaction
+        self._begin()
+        # Determine database ID
+        c.execute("SELECT id FROM study WHERE ident = ?;",
+                  (sqlite3.Binary(ident), ))
+        try:
+            dbid = c.fetchone()[0]
+        except (IndexError, TypeError):
+            self._rollback()
+            return None
+        # Remove acknowledged messages
+        if ack > 0:
+            c.execute("DELETE FROM studyEntry WHERE study = ? AND id <= ?;",
+                      (dbid, ack))
+        # Read the following messages
+        if limit is None:
+            limit = -1
+        c.execute("SELECT id, data FROM studyEntry WHERE study = ? AND id > ? "
+                  "ORDER BY id LIMIT ?;", (dbid, ack, limit))
         rv = c.fetchall()
-        # Delete all database entries related to that study
-        c.execute("DELETE FROM studyEntry WHERE study LIKE ?;",
-                  (dbid, ))
+        # Commit
+        self._commit()
         # Return
         return rv
 
@@ -218,7 +714,7 @@ class SqliteBackend():
         # Get a cursor
         c = self.conn.cursor()
         # Run query
-        c.execute("SELECT pubkey FROM study WHERE ident LIKE ?;",
+        c.execute("SELECT pubkey FROM study WHERE ident = ?;",
                   (sqlite3.Binary(ident), ))
         # Return result
         try:
@@ -230,8 +726,10 @@ class SqliteBackend():
         # Get a cursor
         c = self.conn.cursor()
         # Run query
-        c.execute("DELETE FROM study WHERE ident LIKE ?;",
+        c.execute("DELETE FROM study WHERE ident = ?;",
                   (sqlite3.Binary(ident), ))
+        # Commit
+        self._commit()
         return c.rowcount == 1
 
     def close(self):
@@ -0,0 +1,1403 @@
+"""Test cases for the SQLite storage backend.
+
+These test cases are run with "nosetests".
+"""
+import os
+import select
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from executor import StorageExecutor
+from groupcommit import GroupCommitter
+from keyindex import KeyIndex
+from logkv import LogBackend
+from memory import MemoryBackend
+from pool import ConnectionPool
+from sharded import ShardedBackend
+from sqlite import SqliteBackend
+from valuecache import ValueCache
+from network.tasks import Dispatcher
+
+"""Helper functions"""
+
+
+class FakeMessage():
+    def __init__(self, data):
+        self.data = data
+
+    def SerializeToString(self):
+        return self.data
+
+
+def runUntilDone(dispatcher, future):
+    # Run the callbacks handed to the dispatcher until the future is done
+    while not future.done():
+        assert select.select([dispatcher], [], [], 5)[0], "Timed out"
+        dispatcher.run()
+
+
+def getDatabasePath():
+    return os.path.join(tempfile.mkdtemp(), "denul.db")
+
+
+def openLogBackend(path, **kwargs):
+    # Segments are kept next to the database of the studies
+    return LogBackend(os.path.join(os.path.dirname(path), "kv"),
+                      SqliteBackend(path), **kwargs)
+
+
+def getSegments(path):
+    return sorted(os.listdir(os.path.join(os.path.dirname(path), "kv")))
+
+
+def removeDatabase(path):
+    shutil.rmtree(os.path.dirname(path))
+
+
+def getIndexes(conn, table):
+    c = conn.cursor()
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND "
+              "tbl_name = ?", (table, ))
+    return [row[0] for row in c.fetchall()]
+
+
+def getQueryPlan(conn, query, args):
+    c = conn.cursor()
+    c.execute("EXPLAIN QUERY PLAN " + query, args)
+    return " ".join(str(row[-1]) for row in c.fetchall())
+
+
+def createVersion2(path):
+    # The layout created by schema version 2, without any indexes
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute("CREATE TABLE kv (key blob, value blob);")
+    c.execute("CREATE TABLE study (id INTEGER PRIMARY KEY, ident BLOB, pubkey BLOB, message BLOB);")
+    c.execute("CREATE TABLE studyEntry (id INTEGER PRIMARY KEY, study INTEGER, data BLOB, FOREIGN KEY (study) REFERENCES study(id) ON DELETE CASCADE);")
+    c.execute("PRAGMA user_version = 2")
+    conn.commit()
+    return conn
+
+"""Layout tests"""
+
+
+def test_create_layout_version():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    c = db.conn.cursor()
+    c.execute("PRAGMA user_version")
+    assert c.fetchone()[0] == SqliteBackend.SCHEMA_VERSION
+    db.close()
+    removeDatabase(path)
+
+
+def test_create_layout_uses_indexes():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    key = sqlite3.Binary("k" * 32)
+    assert "SCAN" not in getQueryPlan(
+        db.conn, "SELECT value FROM kv WHERE key = ?", (key, ))
+    assert "study_ident" in getQueryPlan(
+        db.conn, "SELECT id FROM study WHERE ident = ?", (key, ))
+    assert "studyEntry_study" in getQueryPlan(
+        db.conn, "SELECT data FROM studyEntry WHERE study = ?", (1, ))
+    db.close()
+    removeDatabase(path)
+
+
+def test_kv_key_unique():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    c = db.conn.cursor()
+    c.execute("INSERT INTO kv (key, value) VALUES (?, ?)",
+              (sqlite3.Binary("k" * 32), sqlite3.Binary("v")))
+    try:
+        c.execute("INSERT INTO kv (key, value) VALUES (?, ?)",
+                  (sqlite3.Binary("k" * 32), sqlite3.Binary("w")))
+    except sqlite3.IntegrityError:
+        assert True
+        return
+    finally:
+        db.close()
+        removeDatabase(path)
+    assert False
+
+"""Key-value tests"""
+
+
+def test_insert_kv_taken():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    db.insert_kv("k" * 32, "first")
+    try:
+        db.insert_kv("k" * 32, "second")
+    except KeyError:
+        assert str(db.query_kv("k" * 32)) == "first"
+        return
+    finally:
+        db.close()
+        removeDatabase(path)
+    assert False
+
+
+def test_delete_kv():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    db.insert_kv("k" * 32, "value")
+    assert not db.delete_kv("u" * 32)
+    assert db.delete_kv("k" * 32)
+    assert db.query_kv("k" * 32) is None
+    assert not db.delete_kv("k" * 32)
+    db.close()
+    removeDatabase(path)
+
+
+def test_expire_kv():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    c = db.conn.cursor()
+    for i, key in enumerate(["a" * 32, "b" * 32, "c" * 32]):
+        c.execute("INSERT INTO kv (key, value, created) VALUES (?, ?, ?)",
+                  (sqlite3.Binary(key), sqlite3.Binary("v"), 100 + i))
+    db.conn.commit()
+    db.insert_kv("d" * 32, "v")
+    # Oldest first, at most limit pairs
+    assert db.expire_kv(102, 1) == ["a" * 32]
+    assert db.expire_kv(102, 10) == ["b" * 32]
+    assert db.expire_kv(102, 10) == []
+    assert sorted(db.iter_keys()) == ["c" * 32, "d" * 32]
+    assert db.expire_kv(time.time() + 1, 10) == ["c" * 32, "d" * 32]
+    db.close()
+    removeDatabase(path)
+
+
+def test_maintenance_vacuums_incrementally():
+    path = getDatabasePath()
+    db = SqliteBackend(path, journal_mode="wal")
+    db.insert_kv_many([("%032i" % i, "v" * 1000) for i in range(1000)])
+    db.delete_kv_many(["%032i" % i for i in range(1000)])
+    size = os.path.getsize(path)
+    db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    pages = db.conn.execute("PRAGMA freelist_count;").fetchone()[0]
+    assert pages > SqliteBackend.VACUUM_PAGES
+    # A bounded number of pages is freed per call
+    assert db.maintenance()
+    assert db.conn.execute("PRAGMA freelist_count;").fetchone()[0] == \
+        pages - SqliteBackend.VACUUM_PAGES
+    while db.maintenance():
+        pass
+    db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    assert os.path.getsize(path) < size
+    db.close()
+    removeDatabase(path)
+
+
+def test_insert_kv_many():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    db.insert_kv("a" * 32, "old")
+    assert db.insert_kv_many([("a" * 32, "new"), ("b" * 32, "1"),
+                              ("c" * 32, "2"), ("b" * 32, "3")]) == \
+        [False, True, True, False]
+    assert str(db.query_kv("a" * 32)) == "old"
+    assert str(db.query_kv("b" * 32)) == "1"
+    assert str(db.query_kv("c" * 32)) == "2"
+    # Nothing left to insert, no transaction is left open
+    assert db.insert_kv_many([("a" * 32, "new")]) == [False]
+    other = sqlite3.connect(path, timeout=0)
+    assert other.execute("SELECT COUNT(*) FROM kv").fetchone()[0] == 3
+    other.execute("INSERT INTO kv (key, value) VALUES (?, ?)",
+                  (sqlite3.Binary("d" * 32), sqlite3.Binary("v")))
+    other.commit()
+    other.close()
+    db.close()
+    removeDatabase(path)
+
+
+def test_query_kv_many():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    keys = ["%032i" % i for i in range(2500)]
+    db.insert_kv_many([(key, key) for key in keys[::2]])
+    # More keys than parameters per statement
+    values = db.query_kv_many(keys)
+    assert sorted(values) == sorted(keys[::2])
+    assert all(str(values[key]) == key for key in values)
+    assert db.query_kv_many([]) == {}
+    db.close()
+    removeDatabase(path)
+
+
+def test_delete_kv_many():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    db.insert_kv_many([("a" * 32, "1"), ("b" * 32, "2")])
+    assert db.delete_kv_many(["a" * 32, "u" * 32, "a" * 32, "b" * 32]) == \
+        [True, False, False, True]
+    assert db.count_keys() == 0
+    assert db.delete_kv_many(["a" * 32]) == [False]
+    db.close()
+    removeDatabase(path)
+
+
+def test_group_commit_taken_key_keeps_batch():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    committer = GroupCommitter(db, max_batch=10, max_delay=10)
+    db.insert_kv("a" * 32, "v")
+    future = committer.commit()
+    try:
+        db.insert_kv("a" * 32, "w")
+    except KeyError:
+        pass
+    assert not db.delete_kv("u" * 32)
+    committer.flush()
+    assert future.result()
+    assert str(db.query_kv("a" * 32)) == "v"
+    db.close()
+    removeDatabase(path)
+
+
+def test_iter_keys():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    keys = set("%032i" % i for i in range(25))
+    for key in keys:
+        db.insert_kv(key, "value")
+    assert db.count_keys() == 25
+    # Chunks that do not evenly divide the number of keys
+    assert set(db.iter_keys(chunksize=7)) == keys
+    assert set(db.iter_keys()) == keys
+    db.close()
+    removeDatabase(path)
+
+
+def test_iter_keys_empty():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    assert db.count_keys() == 0
+    assert list(db.iter_keys()) == []
+    db.close()
+    removeDatabase(path)
+
+"""Upgrade tests"""
+
+
+def test_upgrade_from_version_1():
+    path = getDatabasePath()
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE kv (key blob, value blob);")
+    conn.execute("INSERT INTO kv VALUES (?, ?)",
+                 (sqlite3.Binary("k" * 32), sqlite3.Binary("v")))
+    conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+    conn.close()
+    db = SqliteBackend(path)
+    c = db.conn.cursor()
+    c.execute("PRAGMA user_version")
+    assert c.fetchone()[0] == SqliteBackend.SCHEMA_VERSION
+    assert str(db.query_kv("k" * 32)) == "v"
+    assert "study_ident" in getIndexes(db.conn, "study")
+    assert db.insert_study("i" * 16, "pubkey", FakeMessage("msg"))
+    db.close()
+    removeDatabase(path)
+
+
+def test_upgrade_from_version_2_removes_duplicates():
+    path = getDatabasePath()
+    conn = createVersion2(path)
+    for value in ("first", "second"):
+        conn.execute("INSERT INTO kv VALUES (?, ?)",
+                     (sqlite3.Binary("k" * 32), sqlite3.Binary(value)))
+    for pubkey in ("first", "second"):
+        conn.execute("INSERT INTO study (ident, pubkey, message) VALUES "
+                     "(?, ?, ?)", (sqlite3.Binary("i" * 16),
+                                   sqlite3.Binary(pubkey),
+                                   sqlite3.Binary("msg")))
+    conn.execute("INSERT INTO studyEntry (study, data) VALUES (1, 'a')")
+    conn.execute("INSERT INTO studyEntry (study, data) VALUES (2, 'b')")
+    conn.commit()
+    conn.close()
+    db = SqliteBackend(path)
+    c = db.conn.cursor()
+    c.execute("PRAGMA user_version")
+    assert c.fetchone()[0] == SqliteBackend.SCHEMA_VERSION
+    # The oldest entries are kept
+    assert str(db.query_kv("k" * 32)) == "first"
+    c.execute("SELECT id, pubkey FROM study")
+    assert [(row[0], str(row[1])) for row in c.fetchall()] == [(1, "first")]
+    c.execute("SELECT study, data FROM studyEntry")
+    assert c.fetchall() == [(1, "a")]
+    assert "study_ident" in getIndexes(db.conn, "study")
+    assert "studyEntry_study" in getIndexes(db.conn, "studyEntry")
+    db.close()
+    removeDatabase(path)
+
+
+def test_upgrade_is_idempotent():
+    path = getDatabasePath()
+    createVersion2(path).close()
+    SqliteBackend(path).close()
+    db = SqliteBackend(path)
+    c = db.conn.cursor()
+    c.execute("PRAGMA user_version")
+    assert c.fetchone()[0] == SqliteBackend.SCHEMA_VERSION
+    db.close()
+    removeDatabase(path)
+
+"""Study tests"""
+
+
+def test_study_lifecycle():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    assert db.insert_study("i" * 16, "pubkey", FakeMessage("msg"))
+    assert not db.insert_study("i" * 16, "other", FakeMessage("msg"))
+    assert str(db.query_study_pkey("i" * 16)) == "pubkey"
+    assert db.insert_studyjoin("i" * 16, "join1")
+    assert db.insert_studyjoin("i" * 16, "join2")
+    assert [str(row[0]) for row in db.query_study("i" * 16)] == \
+        ["join1", "join2"]
+    # Queued messages are only returned once
+    assert db.query_study("i" * 16) == []
+    assert db.delete_study("i" * 16)
+    assert db.query_study_pkey("i" * 16) is None
+    assert not db.delete_study("i" * 16)
+    db.close()
+    removeDatabase(path)
+
+
+def test_insert_studyjoin_many():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    assert db.insert_study("i" * 16, "pubkey", FakeMessage("msg"))
+    assert db.insert_studyjoin_many([("i" * 16, "join1"), ("u" * 16, "join"),
+                                     ("i" * 16, "join2")]) == \
+        [True, False, True]
+    assert [str(row[0]) for row in db.query_study("i" * 16)] == \
+        ["join1", "join2"]
+    assert db.insert_studyjoin_many([("u" * 16, "join")]) == [False]
+    db.close()
+    removeDatabase(path)
+
+
+def test_study_unknown_ident():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    assert not db.insert_studyjoin("u" * 16, "join")
+    assert db.query_study("u" * 16) == []
+    assert db.query_study_pkey("u" * 16) is None
+    db.close()
+    removeDatabase(path)
+
+
+def test_study_binary_idents_match_exactly():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    # Bytes that are wildcards for LIKE, or terminate C strings
+    wildcard = "%" * 16
+    underscore = "_" * 15 + "a"
+    nul = "\x00" * 15 + "a"
+    for ident in (wildcard, underscore, nul):
+        assert db.insert_study(ident, "key " + ident, FakeMessage(ident))
+    assert db.query_study_pkey("b" * 16) is None
+    assert db.query_study_pkey("_" * 15 + "b") is None
+    assert db.query_study_pkey("\x00" * 15 + "b") is None
+    for ident in (wildcard, underscore, nul):
+        assert str(db.query_study_pkey(ident)) == "key " + ident
+    assert db.insert_studyjoin(nul, "join")
+    assert db.query_study(wildcard) == []
+    assert db.query_study(underscore) == []
+    assert [str(row[0]) for row in db.query_study(nul)] == ["join"]
+    assert db.delete_study(wildcard)
+    assert str(db.query_study_pkey(underscore)) == "key " + underscore
+    db.close()
+    removeDatabase(path)
+
+
+def test_list_studies_pages():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    for i in range(5):
+        db.insert_study("%016i" % i, "pubkey", FakeMessage("study%i" % i))
+    page = db.list_studies(limit=2)
+    assert [str(message) for dbid, message in page] == ["study0", "study1"]
+    page = db.list_studies(after=page[-1][0], limit=2)
+    assert [str(message) for dbid, message in page] == ["study2", "study3"]
+    page = db.list_studies(after=page[-1][0])
+    assert [str(message) for dbid, message in page] == ["study4"]
+    assert db.list_studies(after=page[-1][0]) == []
+    assert len(db.list_studies()) == 5
+    db.close()
+    removeDatabase(path)
+
+
+def test_list_studies_filter():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    db.insert_study("a" * 16, "pubkey", FakeMessage("a"), [(1, 0), (2, 1)])
+    db.insert_study("b" * 16, "pubkey", FakeMessage("b"), [(2, 0), (2, 0)])
+    db.insert_study("c" * 16, "pubkey", FakeMessage("c"))
+    db.insert_study("d" * 16, "pubkey", FakeMessage("d"), [(2, 1)])
+
+    def listing(*args, **kwargs):
+        return [str(message) for dbid, message in
+                db.list_studies(*args, **kwargs)]
+    assert listing(datatype=2) == ["a", "b", "d"]
+    assert listing(datatype=1) == ["a"]
+    assert listing(granularity=1) == ["a", "d"]
+    assert listing(datatype=2, granularity=0) == ["b"]
+    assert listing(datatype=1, granularity=1) == []
+    assert listing(datatype=2, limit=2) == ["a", "b"]
+    assert listing(datatype=2, after=2) == ["d"]
+    # Deleting a study removes its data requests
+    assert db.delete_study("a" * 16)
+    assert listing(datatype=2) == ["b", "d"]
+    assert db.conn.execute("SELECT COUNT(*) FROM studyRequest").fetchone()[0] == 2
+    db.close()
+    removeDatabase(path)
+
+
+def test_list_studies_filter_uses_indexes():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    query = "SELECT DISTINCT study FROM studyRequest WHERE %s AND study > ?"
+    assert "SCAN" not in getQueryPlan(
+        db.conn, query % "datatype = ?", (1, 0))
+    assert "SCAN" not in getQueryPlan(
+        db.conn, query % "datatype = ? AND granularity = ?", (1, 0, 0))
+    assert "studyRequest_granularity" in getQueryPlan(
+        db.conn, query % "granularity = ?", (1, 0))
+    assert "studyRequest_study" in getQueryPlan(
+        db.conn, "SELECT * FROM studyRequest WHERE study = ?", (1, ))
+    db.close()
+    removeDatabase(path)
+
+
+def test_upgrade_from_version_4_extracts_data_requests():
+    from messages.studyMessage_pb2 import StudyCreate, StudyWrapper
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    db.conn.executescript("""
+        DROP TABLE studyRequest;
+        DROP TABLE kv;
+        CREATE TABLE kv (key BLOB PRIMARY KEY NOT NULL, value BLOB) WITHOUT ROWID;
+        PRAGMA user_version = 4;
+        """)
+    sc = StudyCreate()
+    dr = sc.dataRequest.add()
+    dr.datatype = StudyCreate.DATA_GPS_TRACK
+    dr.granularity = StudyCreate.GRAN_COARSE
+    dr.frequency = 24
+    wrapper = StudyWrapper()
+    wrapper.type = StudyWrapper.MSG_STUDYCREATE
+    # Partial messages are fine, the upgrade does not check required fields
+    wrapper.message = sc.SerializePartialToString()
+    wrapper.signature = "sig"
+    db.conn.execute("INSERT INTO study (ident, pubkey, message) VALUES "
+                    "(?, ?, ?)", (sqlite3.Binary("i" * 16),
+                                  sqlite3.Binary("pubkey"),
+                                  sqlite3.Binary(wrapper.SerializeToString())))
+    # Messages that cannot be parsed are skipped
+    db.conn.execute("INSERT INTO study (ident, pubkey, message) VALUES "
+                    "(?, ?, ?)", (sqlite3.Binary("u" * 16),
+                                  sqlite3.Binary("pubkey"),
+                                  sqlite3.Binary("\xff")))
+    db.conn.commit()
+    db.close()
+    db = SqliteBackend(path)
+    c = db.conn.cursor()
+    c.execute("PRAGMA user_version")
+    assert c.fetchone()[0] == SqliteBackend.SCHEMA_VERSION
+    studies = db.list_studies(datatype=StudyCreate.DATA_GPS_TRACK,
+                              granularity=StudyCreate.GRAN_COARSE)
+    assert [dbid for dbid, message in studies] == [1]
+    assert db.list_studies(datatype=StudyCreate.DATA_STEP_COUNT) == []
+    # Writes work as before
+    assert db.insert_study("n" * 16, "pubkey", FakeMessage("msg"))
+    db.close()
+    removeDatabase(path)
+
+
+def test_upgrade_from_version_5_records_insertion_time():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    db.conn.executescript("""
+        DROP TABLE kv;
+        CREATE TABLE kv (key BLOB PRIMARY KEY NOT NULL, value BLOB) WITHOUT ROWID;
+        PRAGMA user_version = 5;
+        """)
+    db.conn.execute("INSERT INTO kv VALUES (?, ?)",
+                    (sqlite3.Binary("a" * 32), sqlite3.Binary("v")))
+    db.conn.commit()
+    db.close()
+    before = int(time.time())
+    db = SqliteBackend(path)
+    c = db.conn.cursor()
+    c.execute("PRAGMA user_version")
+    assert c.fetchone()[0] == SqliteBackend.SCHEMA_VERSION
+    # Existing pairs count as inserted during the upgrade
+    assert db.expire_kv(before, 10) == []
+    assert str(db.query_kv("a" * 32)) == "v"
+    assert "kv_created" in getQueryPlan(
+        db.conn, "SELECT key FROM kv WHERE created < ? ORDER BY created",
+        (before, ))
+    db.close()
+    removeDatabase(path)
+
+
+def test_upgrade_from_version_3_keeps_queue_positions():
+    path = getDatabasePath()
+    conn = createVersion2(path)
+    conn.execute("INSERT INTO study (ident, pubkey, message) VALUES "
+                 "(?, 'pubkey', 'msg')", (sqlite3.Binary("i" * 16), ))
+    for i in range(3):
+        conn.execute("INSERT INTO studyEntry (study, data) VALUES (1, ?)",
+                     (str(i), ))
+    conn.execute("CREATE UNIQUE INDEX study_ident ON study (ident);")
+    conn.execute("CREATE INDEX studyEntry_study ON studyEntry (study);")
+    conn.execute("PRAGMA user_version = 3")
+    conn.commit()
+    conn.close()
+    db = SqliteBackend(path)
+    assert [(pos, str(data)) for pos, data in
+            db.read_study_queue("i" * 16)] == [(1, "0"), (2, "1"), (3, "2")]
+    # Consuming the newest entry must not make its position available again
+    db.read_study_queue("i" * 16, ack=3)
+    db.insert_studyjoin("i" * 16, "new")
+    assert db.read_study_queue("i" * 16)[0][0] == 4
+    assert "studyEntry_study" in getIndexes(db.conn, "studyEntry")
+    db.close()
+    removeDatabase(path)
+
+"""Study queue tests"""
+
+
+def test_query_study_keeps_entries_added_later():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    db.insert_study("i" * 16, "pubkey", FakeMessage("msg"))
+    db.insert_studyjoin("i" * 16, "join1")
+    rows = db.query_study("i" * 16)
+    db.insert_studyjoin("i" * 16, "join2")
+    assert [str(row[0]) for row in rows] == ["join1"]
+    assert [str(row[0]) for row in db.query_study("i" * 16)] == ["join2"]
+    db.close()
+    removeDatabase(path)
+
+
+def test_query_study_is_isolated():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    db.insert_study("i" * 16, "pubkey", FakeMessage("msg"))
+    db.insert_studyjoin("i" * 16, "join1")
+    db.insert_studyjoin("i" * 16, "join2")
+    # Another process (e.g. a worker) consumes the queue concurrently
+    other = SqliteBackend(path)
+    assert len(db.query_study("i" * 16)) == 2
+    assert other.query_study("i" * 16) == []
+    other.close()
+    db.close()
+    removeDatabase(path)
+
+
+def test_query_study_limit():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    db.insert_study("i" * 16, "pubkey", FakeMessage("msg"))
+    for i in range(5):
+        db.insert_studyjoin("i" * 16, "join%i" % i)
+    # Only the oldest messages are removed, the others stay queued
+    assert [str(row[0]) for row in db.query_study("i" * 16, limit=2)] == \
+        ["join0", "join1"]
+    assert [str(row[0]) for row in db.query_study("i" * 16, limit=2)] == \
+        ["join2", "join3"]
+    assert [str(row[0]) for row in db.query_study("i" * 16, limit=2)] == \
+        ["join4"]
+    assert db.query_study("i" * 16, limit=2) == []
+    db.close()
+    removeDatabase(path)
+
+
+def test_query_study_more():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    db.insert_study("i" * 16, "pubkey", FakeMessage("msg"))
+    for i in range(4):
+        db.insert_studyjoin("i" * 16, "join%i" % i)
+    rows, more = db.query_study_more("i" * 16, limit=2)
+    assert [str(row[0]) for row in rows] == ["join0", "join1"] and more
+    # Exactly one full page is left, the message read ahead is kept
+    rows, more = db.query_study_more("i" * 16, limit=2)
+    assert [str(row[0]) for row in rows] == ["join2", "join3"] and not more
+    assert db.query_study_more("i" * 16, limit=2) == ([], False)
+    assert db.query_study_more("u" * 16, limit=2) == ([], False)
+    db.close()
+    removeDatabase(path)
+
+
+def test_read_study_queue_ack():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    db.insert_study("i" * 16, "pubkey", FakeMessage("msg"))
+    for i in range(5):
+        db.insert_studyjoin("i" * 16, "join%i" % i)
+    page = db.read_study_queue("i" * 16, limit=2)
+    assert [str(data) for pos, data in page] == ["join0", "join1"]
+    # Without an acknowledgement, the messages are returned again
+    assert db.read_study_queue("i" * 16, limit=2) == page
+    page = db.read_study_queue("i" * 16, ack=page[-1][0], limit=2)
+    assert [str(data) for pos, data in page] == ["join2", "join3"]
+    page = db.read_study_queue("i" * 16, ack=page[-1][0])
+    assert [str(data) for pos, data in page] == ["join4"]
+    assert db.read_study_queue("i" * 16, ack=page[-1][0]) == []
+    # All acknowledged messages have been removed
+    assert db.query_study("i" * 16) == []
+    db.close()
+    removeDatabase(path)
+
+
+def test_read_study_queue_unknown_ident():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    assert db.read_study_queue("u" * 16) is None
+    # No transaction is left open
+    other = sqlite3.connect(path, timeout=0)
+    other.execute("INSERT INTO kv (key, value) VALUES (?, ?)",
+                  (sqlite3.Binary("b" * 32), sqlite3.Binary("v")))
+    other.commit()
+    other.close()
+    db.close()
+    removeDatabase(path)
+
+"""Group commit tests"""
+
+
+def test_wal_mode():
+    path = getDatabasePath()
+    db = SqliteBackend(path, journal_mode="wal", synchronous="normal")
+    c = db.conn.cursor()
+    c.execute("PRAGMA journal_mode")
+    assert c.fetchone()[0] == "wal"
+    db.close()
+    removeDatabase(path)
+
+
+def test_group_commit_deadline():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    committer = GroupCommitter(db, max_batch=10, max_delay=0.005)
+    db.insert_kv("a" * 32, "v")
+    first = committer.commit()
+    db.insert_kv("b" * 32, "v")
+    second = committer.commit()
+    assert not first.done()
+    # Other connections do not see the writes yet
+    other = sqlite3.connect(path)
+    assert other.execute("SELECT COUNT(*) FROM kv").fetchone()[0] == 0
+    assert committer.timeout() <= 0.005
+    committer.run(committer.deadline)
+    assert first.result() and second.result()
+    assert other.execute("SELECT COUNT(*) FROM kv").fetchone()[0] == 2
+    assert committer.stats() == {"commits": 1, "writes": 2}
+    assert committer.timeout() is None
+    other.close()
+    db.close()
+    removeDatabase(path)
+
+
+def test_group_commit_batch_size():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    committer = GroupCommitter(db, max_batch=2, max_delay=10)
+    db.insert_kv("a" * 32, "v")
+    first = committer.commit()
+    db.insert_kv("b" * 32, "v")
+    second = committer.commit()
+    # The second write filled the batch, so both are committed right away
+    assert first.done() and second.done()
+    db.close()
+    removeDatabase(path)
+
+
+def test_group_commit_failed_statement_keeps_batch():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    committer = GroupCommitter(db, max_batch=10, max_delay=10)
+    assert db.insert_study("i" * 16, "pubkey", FakeMessage("msg"))
+    future = committer.commit()
+    # A duplicate must not roll back the pending study
+    assert not db.insert_study("i" * 16, "other", FakeMessage("msg"))
+    committer.flush()
+    assert future.result()
+    assert str(db.query_study_pkey("i" * 16)) == "pubkey"
+    db.close()
+    removeDatabase(path)
+
+
+def test_group_commit_failure_fails_next_commit():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    committer = GroupCommitter(db, max_batch=10, max_delay=10)
+    commit = db.commit
+
+    def fail():
+        raise sqlite3.OperationalError("disk I/O error")
+    db.insert_kv("a" * 32, "v")
+    first = committer.commit()
+    # This write is rolled back before its handler waits for the commit
+    db.insert_kv("b" * 32, "v")
+    db.commit = fail
+    committer.flush()
+    db.commit = commit
+    second = committer.commit()
+    committer.flush()
+    for future in (first, second):
+        try:
+            future.result()
+            assert False, "Rolled back write was reported as committed"
+        except sqlite3.OperationalError:
+            pass
+    assert db.query_kv("b" * 32) is None
+    # The transaction after that is committed again
+    db.insert_kv("c" * 32, "v")
+    third = committer.commit()
+    committer.flush()
+    assert third.result()
+    assert str(db.query_kv("c" * 32)) == "v"
+    assert committer.stats() == {"commits": 1, "writes": 1}
+    db.close()
+    removeDatabase(path)
+
+
+def test_group_commit_disabled():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    committer = GroupCommitter(db, max_delay=0)
+    db.insert_kv("a" * 32, "v")
+    assert committer.commit().result()
+    other = sqlite3.connect(path)
+    assert other.execute("SELECT COUNT(*) FROM kv").fetchone()[0] == 1
+    other.close()
+    db.close()
+    removeDatabase(path)
+
+
+def test_group_commit_failed_statement_releases_lock():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    GroupCommitter(db, max_batch=10, max_delay=10)
+    db.insert_kv("a" * 32, "v")
+    db.commit()
+    # Failed writes without any pending writes must not keep the write lock
+    try:
+        db.insert_kv("a" * 32, "w")
+    except KeyError:
+        pass
+    assert not db.delete_kv("u" * 32)
+    assert not db.insert_studyjoin("u" * 16, "join")
+    other = sqlite3.connect(path, timeout=0)
+    other.execute("INSERT INTO kv (key, value) VALUES (?, ?)",
+                  (sqlite3.Binary("b" * 32), sqlite3.Binary("v")))
+    other.commit()
+    other.close()
+    db.close()
+    removeDatabase(path)
+
+"""Storage executor tests"""
+
+
+def test_executor_synchronous():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    storage = StorageExecutor(db, threaded=False)
+    assert storage.insert_kv("a" * 32, "v").done()
+    assert str(storage.query_kv("a" * 32).result()) == "v"
+    # Exceptions of the backend are set on the Future
+    future = storage.insert_kv("a" * 32, "w")
+    try:
+        future.result()
+        assert False, "Taken key was not reported"
+    except KeyError:
+        pass
+    assert storage.stats()["calls"] == 3
+    db.close()
+    removeDatabase(path)
+
+
+def test_executor_thread():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    dispatcher = Dispatcher()
+    storage = StorageExecutor(db, dispatcher)
+    results = []
+    inserted = storage.insert_kv("a" * 32, "v")
+    inserted.add_done_callback(lambda f: results.append("insert"))
+    queried = storage.list_studies(after=0, limit=10)
+    queried.add_done_callback(lambda f: results.append("query"))
+    # Futures are only resolved on the thread running the dispatcher, in
+    # the order the calls were submitted
+    runUntilDone(dispatcher, queried)
+    assert results == ["insert", "query"]
+    assert queried.result() == []
+    # A taken key is reported through the Future
+    taken = storage.insert_kv("a" * 32, "w")
+    runUntilDone(dispatcher, taken)
+    try:
+        taken.result()
+        assert False, "Taken key was not reported"
+    except KeyError:
+        pass
+    storage.close()
+    dispatcher.close()
+    db.close()
+    removeDatabase(path)
+
+
+def test_executor_group_commit():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    dispatcher = Dispatcher()
+    storage = StorageExecutor(db, dispatcher)
+    committer = GroupCommitter(db, max_batch=10, max_delay=10,
+                               executor=storage)
+    runUntilDone(dispatcher, storage.insert_kv("a" * 32, "v"))
+    future = committer.commit()
+    committer.flush()
+    # The commit is made on the storage thread
+    runUntilDone(dispatcher, future)
+    assert future.result()
+    assert committer.stats() == {"commits": 1, "writes": 1}
+    other = sqlite3.connect(path)
+    assert other.execute("SELECT COUNT(*) FROM kv").fetchone()[0] == 1
+    other.close()
+    storage.close()
+    dispatcher.close()
+    db.close()
+    removeDatabase(path)
+
+
+def test_executor_readers_see_committed_writes():
+    path = getDatabasePath()
+    db = SqliteBackend(path, journal_mode="wal")
+    dispatcher = Dispatcher()
+    pool = ConnectionPool(lambda: SqliteBackend(path, readonly=True), 2)
+    storage = StorageExecutor(db, dispatcher, pool=pool)
+    committer = GroupCommitter(db, max_batch=10, max_delay=10,
+                               executor=storage)
+    runUntilDone(dispatcher, storage.insert_kv("a" * 32, "v"))
+    # The write is not committed yet, so the readers do not see it
+    future = storage.query_kv("a" * 32)
+    runUntilDone(dispatcher, future)
+    assert future.result() is None
+    committed = committer.commit()
+    committer.flush()
+    runUntilDone(dispatcher, committed)
+    future = storage.query_kv("a" * 32)
+    runUntilDone(dispatcher, future)
+    assert str(future.result()) == "v"
+    assert pool.stats()["checkouts"] == 2
+    storage.close()
+    pool.close()
+    dispatcher.close()
+    db.close()
+    removeDatabase(path)
+
+
+def test_executor_more_readers_than_backends():
+    path = getDatabasePath()
+    db = SqliteBackend(path)
+    dispatcher = Dispatcher()
+    release = threading.Event()
+
+    class BlockingReader():
+        def query_kv(self, key):
+            release.wait(5)
+            return key
+
+        def close(self):
+            pass
+
+    pool = ConnectionPool(BlockingReader, 1)
+    storage = StorageExecutor(db, dispatcher, pool=pool, readers=2)
+    first = storage.query_kv("a")
+    second = storage.query_kv("b")
+    # The second reader thread waits for the only backend
+    deadline = time.time() + 5
+    while pool.stats()["waits"] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert pool.stats()["waits"] == 1
+    release.set()
+    runUntilDone(dispatcher, first)
+    runUntilDone(dispatcher, second)
+    assert (first.result(), second.result()) == ("a", "b")
+    storage.close()
+    pool.close()
+    dispatcher.close()
+    db.close()
+    removeDatabase(path)
+
+
+"""Connection pool tests"""
+
+
+def test_readonly_backend():
+    path = getDatabasePath()
+    db = SqliteBackend(path, journal_mode="wal")
+    db.insert_kv("a" * 32, "v")
+    reader = SqliteBackend(path, readonly=True)
+    assert str(reader.query_kv("a" * 32)) == "v"
+    try:
+        reader.conn.execute("DELETE FROM kv")
+        assert False, "Read-only backend accepted a write"
+    except sqlite3.OperationalError:
+        pass
+    reader.close()
+    db.close()
+    removeDatabase(path)
+
+
+def test_pool_thread_affinity():
+    pool = ConnectionPool(object, 3)
+    first = pool.checkout()
+    second = pool.checkout()
+    assert first is not second
+    pool.checkin(first)
+    pool.checkin(second)
+    # The thread gets back the backend it used last
+    assert pool.checkout() is second
+    assert pool.stats() == {"size": 3, "checkouts": 3, "waits": 0,
+                            "wait": 0.0}
+
+
+def test_pool_waits_for_free_backend():
+    pool = ConnectionPool(object, 1)
+    backend = pool.checkout()
+    result = []
+    thread = threading.Thread(target=lambda: result.append(pool.checkout()))
+    thread.start()
+    thread.join(0.05)
+    # The other thread waits until the backend is returned
+    assert not result
+    pool.checkin(backend)
+    thread.join(5)
+    assert result == [backend]
+    assert pool.stats()["waits"] == 1
+
+"""Log backend tests"""
+
+
+def test_log_kv():
+    path = getDatabasePath()
+    db = openLogBackend(path)
+    db.insert_kv("a" * 32, "v")
+    try:
+        db.insert_kv("a" * 32, "w")
+        assert False, "Taken key was not reported"
+    except KeyError:
+        pass
+    assert db.query_kv("a" * 32) == "v"
+    assert db.query_kv("b" * 32) is None
+    assert db.insert_kv_many([("b" * 32, "w"), ("a" * 32, "x")]) == \
+        [True, False]
+    assert db.query_kv_many(["a" * 32, "b" * 32, "c" * 32]) == \
+        {"a" * 32: "v", "b" * 32: "w"}
+    assert db.delete_kv("a" * 32)
+    assert not db.delete_kv("a" * 32)
+    assert db.delete_kv_many(["b" * 32, "c" * 32]) == [True, False]
+    assert db.count_keys() == 0
+    db.close()
+    removeDatabase(path)
+
+
+def test_log_studies():
+    path = getDatabasePath()
+    db = openLogBackend(path)
+    assert db.insert_study("i" * 16, "pubkey", FakeMessage("msg"))
+    assert db.insert_studyjoin("i" * 16, "join")
+    assert [str(row[0]) for row in db.query_study("i" * 16)] == ["join"]
+    assert db.delete_study("i" * 16)
+    db.close()
+    removeDatabase(path)
+
+
+def test_log_recovery():
+    path = getDatabasePath()
+    db = openLogBackend(path)
+    db.insert_kv("a" * 32, "v")
+    db.insert_kv("b" * 32, "w")
+    db.delete_kv("a" * 32)
+    db.close()
+    db = openLogBackend(path)
+    assert db.query_kv("a" * 32) is None
+    assert db.query_kv("b" * 32) == "w"
+    assert list(db.iter_keys()) == ["b" * 32]
+    db.close()
+    removeDatabase(path)
+
+
+def test_log_recovery_truncates_torn_record():
+    path = getDatabasePath()
+    db = openLogBackend(path)
+    db.insert_kv("a" * 32, "v")
+    size = db.offset
+    db.close()
+    # Simulate a crash in the middle of writing a record
+    segment = os.path.join(os.path.dirname(path), "kv", "00000001.seg")
+    with open(segment, "ab") as f:
+        f.write("\x00\x01\x02\x03\x01\x00\x20")
+    db = openLogBackend(path)
+    assert db.query_kv("a" * 32) == "v"
+    assert os.path.getsize(segment) == size
+    db.insert_kv("b" * 32, "w")
+    db.close()
+    db = openLogBackend(path)
+    assert db.count_keys() == 2
+    db.close()
+    removeDatabase(path)
+
+
+def test_log_group_commit_rollback():
+    path = getDatabasePath()
+    db = openLogBackend(path)
+    db.insert_kv("a" * 32, "v")
+    db.group_commit = True
+    db.insert_kv("b" * 32, "w")
+    db.delete_kv("a" * 32)
+    db.rollback()
+    assert db.query_kv("a" * 32) == "v"
+    assert db.query_kv("b" * 32) is None
+    db.insert_kv("c" * 32, "x")
+    db.commit()
+    db.close()
+    db = openLogBackend(path)
+    assert sorted(db.iter_keys()) == ["a" * 32, "c" * 32]
+    db.close()
+    removeDatabase(path)
+
+
+def test_log_reads_see_committed_writes():
+    path = getDatabasePath()
+    db = openLogBackend(path)
+    db.insert_kv("a" * 32, "v")
+    db.group_commit = True
+    db.insert_kv("b" * 32, "w")
+    db.delete_kv("a" * 32)
+    # Pending writes are not visible to queries
+    assert db.query_kv("a" * 32) == "v"
+    assert db.query_kv("b" * 32) is None
+    assert db.query_kv_many(["a" * 32, "b" * 32]) == {"a" * 32: "v"}
+    db.commit()
+    assert db.query_kv("a" * 32) is None
+    assert db.query_kv("b" * 32) == "w"
+    db.close()
+    removeDatabase(path)
+
+
+def test_log_maintenance_waits_for_commit():
+    path = getDatabasePath()
+    db = openLogBackend(path, segment_size=200, compact_bytes=100)
+    keys = [chr(ord("a") + i) * 32 for i in range(8)]
+    for key in keys:
+        db.insert_kv(key, "value")
+    for key in keys[:6]:
+        db.delete_kv(key)
+    db.group_commit = True
+    db.insert_kv("z" * 32, "pending")
+    # Compaction would sync the pending write before its commit
+    assert not db.maintenance()
+    assert db.stats()["compactions"] == 0
+    db.rollback()
+    assert db.query_kv("z" * 32) is None
+    while db.maintenance():
+        pass
+    assert db.stats()["compactions"] > 0
+    db.close()
+    db = openLogBackend(path, segment_size=200)
+    assert sorted(db.iter_keys()) == keys[6:]
+    db.close()
+    removeDatabase(path)
+
+
+def test_log_compaction():
+    path = getDatabasePath()
+    db = openLogBackend(path, segment_size=200, compact_bytes=100)
+    keys = [chr(ord("a") + i) * 32 for i in range(8)]
+    for key in keys:
+        db.insert_kv(key, "value")
+    # Delete and store a key again, its deletion must not win on replay
+    db.delete_kv(keys[0])
+    db.insert_kv(keys[0], "new value")
+    for key in keys[1:6]:
+        db.delete_kv(key)
+    before = len(getSegments(path))
+    while db.maintenance():
+        pass
+    assert len(getSegments(path)) < before
+    assert db.stats()["compactions"] > 0
+    db.close()
+    db = openLogBackend(path, segment_size=200)
+    assert sorted(db.iter_keys()) == sorted([keys[0]] + keys[6:])
+    assert db.query_kv(keys[0]) == "new value"
+    assert db.query_kv(keys[7]) == "value"
+    db.close()
+    removeDatabase(path)
+
+
+def test_log_directory_is_locked():
+    path = getDatabasePath()
+    db = openLogBackend(path)
+    try:
+        openLogBackend(path)
+        assert False, "Segments were opened twice"
+    except IOError:
+        pass
+    db.close()
+    removeDatabase(path)
+
+"""Memory backend tests"""
+
+
+def test_memory_kv():
+    db = MemoryBackend()
+    db.insert_kv("a" * 32, "v")
+    try:
+        db.insert_kv("a" * 32, "w")
+        assert False, "Taken key was not reported"
+    except KeyError:
+        pass
+    assert db.query_kv("a" * 32) == "v"
+    assert db.insert_kv_many([("b" * 32, "w"), ("a" * 32, "x")]) == \
+        [True, False]
+    assert db.query_kv_many(["a" * 32, "c" * 32]) == {"a" * 32: "v"}
+    assert sorted(db.iter_keys()) == ["a" * 32, "b" * 32]
+    assert db.delete_kv_many(["a" * 32, "c" * 32]) == [True, False]
+    assert not db.delete_kv("a" * 32)
+    assert db.stats() == {"keys": 1, "bytes": 33}
+    db.close()
+
+
+def test_memory_group_commit_rollback():
+    db = MemoryBackend()
+    db.insert_kv("a" * 32, "v")
+    db.group_commit = True
+    db.insert_kv("b" * 32, "w")
+    db.delete_kv("a" * 32)
+    assert db.insert_study("i" * 16, "pubkey", FakeMessage("msg"))
+    db.rollback()
+    assert db.all_keys() == [("a" * 32, )]
+    assert db.stats() == {"keys": 1, "bytes": 33}
+    assert db.query_study_pkey("i" * 16) is None
+    assert db.insert_study("i" * 16, "pubkey", FakeMessage("msg"))
+    db.commit()
+    assert str(db.query_study_pkey("i" * 16)) == "pubkey"
+    db.close()
+
+"""Sharded backend tests"""
+
+
+def getShardedKeys(count):
+    # Keys with different leading bytes, as they are spread over the shards
+    return [chr(i) + chr(i * 7 % 256) + "k" * 30 for i in range(count)]
+
+
+def test_sharded_kv():
+    path = getDatabasePath()
+    db = ShardedBackend(path, shards=3)
+    keys = getShardedKeys(9)
+    db.insert_kv(keys[0], "v")
+    try:
+        db.insert_kv(keys[0], "w")
+        assert False, "Taken key was not reported"
+    except KeyError:
+        pass
+    assert str(db.query_kv(keys[0])) == "v"
+    assert db.insert_kv_many([(key, key) for key in keys]) == \
+        [False] + [True] * 8
+    assert sorted(str(key) for key in
+                  db.query_kv_many(keys[:5] + ["u" * 32])) == keys[:5]
+    assert db.count_keys() == 9
+    assert db.delete_kv_many(keys[4:] + ["u" * 32]) == [True] * 5 + [False]
+    assert db.delete_kv(keys[0])
+    assert not db.delete_kv(keys[0])
+    assert sorted(db.iter_keys()) == keys[1:4]
+    # Every shard holds some of the keys
+    assert [shard.count_keys() for shard in db.shards] == [1, 1, 1]
+    stats = db.stats()
+    assert stats["inserts"] == [3, 3, 3]
+    assert stats["deletes"] == [2, 2, 2]
+    db.close()
+    removeDatabase(path)
+
+
+def test_sharded_iter_keys():
+    path = getDatabasePath()
+    db = ShardedBackend(path, shards=4)
+    keys = getShardedKeys(200)
+    db.insert_kv_many([(key, "v") for key in keys])
+    assert sorted(db.iter_keys(chunksize=7)) == keys
+    assert sorted(key for key, in db.all_keys()) == keys
+    # Stopping early does not leave the readers blocked
+    for key in db.iter_keys(chunksize=1):
+        break
+    db.close()
+    removeDatabase(path)
+
+
+def test_sharded_group_commit_rollback():
+    path = getDatabasePath()
+    db = ShardedBackend(path, shards=2)
+    keys = getShardedKeys(4)
+    db.insert_kv(keys[0], "v")
+    db.group_commit = True
+    db.insert_kv_many([(key, "v") for key in keys[1:]])
+    db.delete_kv(keys[0])
+    db.rollback()
+    assert sorted(db.iter_keys()) == keys[:1]
+    db.insert_kv(keys[1], "v")
+    db.commit()
+    reader = ShardedBackend(path, shards=2, readonly=True)
+    assert str(reader.query_kv(keys[1])) == "v"
+    reader.close()
+    db.close()
+    removeDatabase(path)
+
+
+def test_sharded_expire_kv():
+    path = getDatabasePath()
+    db = ShardedBackend(path, shards=2)
+    keys = getShardedKeys(4)
+    db.insert_kv_many([(key, "v") for key in keys])
+    assert db.expire_kv(0, 10) == []
+    expired = db.expire_kv(time.time() + 1, 3)
+    assert len(expired) == 3
+    assert db.expire_kv(time.time() + 1, 3) == \
+        sorted(set(keys) - set(expired))
+    assert db.count_keys() == 0
+    db.close()
+    removeDatabase(path)
+
+
+def test_sharded_number_of_shards_is_checked():
+    path = getDatabasePath()
+    ShardedBackend(path, shards=2).close()
+    try:
+        ShardedBackend(path, shards=3)
+        assert False, "Shards of another configuration were opened"
+    except ValueError:
+        pass
+    db = ShardedBackend(path, shards=2)
+    db.close()
+    removeDatabase(path)
+
+"""Value cache tests"""
+
+
+def test_valuecache_hit_and_miss():
+    cache = ValueCache(100)
+    assert cache.get("a") is None
+    cache.put("a", "value")
+    assert cache.get("a") == "value"
+    assert cache.stats() == {"size": 1, "bytes": 6, "hits": 1, "misses": 1,
+                             "evictions": 0, "ratio": 0.5}
+
+
+def test_valuecache_evicts_by_size():
+    cache = ValueCache(25)
+    cache.put("a", "x" * 9)
+    cache.put("b", "x" * 9)
+    cache.get("a")
+    # Needs the space of one entry, the least recently used is evicted
+    cache.put("c", "x" * 9)
+    assert cache.get("b") is None
+    assert cache.get("a") == "x" * 9
+    # Needs the space of both remaining entries
+    cache.put("d", "x" * 15)
+    assert len(cache) == 1 and cache.bytes == 16
+    assert cache.stats()["evictions"] == 3
+
+
+def test_valuecache_skips_large_values():
+    cache = ValueCache(10)
+    cache.put("a", "x" * 5)
+    cache.put("b", "x" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") == "x" * 5
+    assert ValueCache(0).get("a") is None
+
+
+def test_valuecache_invalidate():
+    cache = ValueCache(100)
+    cache.put("a", "value")
+    cache.put("a", "other")
+    assert cache.bytes == 6
+    cache.invalidate("a")
+    cache.invalidate("unknown")
+    assert cache.get("a") is None
+    assert cache.bytes == 0
+
+
+def test_valuecache_version():
+    cache = ValueCache(100)
+    version = cache.version
+    cache.invalidate("a")
+    # The value may have been read before the key was deleted
+    cache.put("a", "old", version)
+    assert cache.get("a") is None
+    cache.put("a", "new", cache.version)
+    assert cache.get("a") == "new"
+
+"""Key index tests"""
+
+
+def test_keyindex_add_and_discard():
+    index = KeyIndex()
+    assert index.add("a" * 32)
+    assert not index.add("a" * 32)
+    assert "a" * 32 in index
+    assert "b" * 32 not in index
+    assert len(index) == 1
+    assert index.discard("a" * 32)
+    assert not index.discard("a" * 32)
+    assert "a" * 32 not in index
+    assert len(index) == 0
+
+
+def test_keyindex_grows():
+    index = KeyIndex(capacity=1)
+    keys = ["%032i" % i for i in range(1000)]
+    for key in keys:
+        index += key
+    assert len(index) == 1000
+    assert all(key in index for key in keys)
+    assert "%032i" % 1000 not in index
+    stats = index.stats()
+    assert stats["slots"] * KeyIndex.MAX_LOAD >= 1000
+    assert stats["bytes"] == stats["slots"] * 33
+
+
+def test_keyindex_reuses_deleted_slots():
+    index = KeyIndex(capacity=16)
+    slots = index.stats()["slots"]
+    # Keep replacing keys, so the table fills up with deleted slots
+    for i in range(1000):
+        index.add("%032i" % i)
+        if i >= 8:
+            index.discard("%032i" % (i - 8))
+    assert len(index) == 8
+    assert index.stats()["slots"] == slots
+    assert all("%032i" % i in index for i in range(992, 1000))
+    assert "%032i" % 991 not in index
+
+
+def test_keyindex_key_size():
+    index = KeyIndex(keysize=4)
+    assert index.add("abcd")
+    try:
+        index.add("abc")
+    except ValueError:
+        return
+    assert False
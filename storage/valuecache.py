@@ -0,0 +1,98 @@
+# -*- encoding: utf-8 -*-
+"""A bounded LRU cache of stored values.
+
+Popular keys are fetched over and over again, and every Get of a key pays a
+database query. Values never change while their key exists (a key has to be
+deleted before it can be stored again), so they can be cached until the key
+is deleted. The cache is bounded by the total size of the cached keys and
+values rather than by their number, as values vary widely in size.
+
+Values may be read from the database concurrently with deletions. To keep a
+value read before a deletion from being cached after it, readers take the
+version of the cache before reading and pass it to put(). The version changes
+on every invalidation, and values read at an older version are not cached.
+"""
+from collections import OrderedDict
+
+
+class ValueCache():
+    """LRU cache mapping keys to values, bounded by their size in bytes"""
+
+    def __init__(self, maxbytes=64 * 1024 * 1024):
+        """Initialize the cache.
+
+        Keyword arguments:
+        maxbytes -- Maximum total size of the cached keys and values, in
+                    bytes. 0 disables the cache. (default: 64 MiB)
+        """
+        if maxbytes < 0:
+            raise ValueError("maxbytes must be >=0")
+        self.maxbytes = maxbytes
+        self.entries = OrderedDict()
+        # Total size of the cached keys and values
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Incremented by every invalidation
+        self.version = 0
+
+    def get(self, key):
+        """Return the value cached for key, or None on a cache miss"""
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        # Re-insert to mark the entry as most recently used
+        self.entries[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value, version=None):
+        """Cache the value for key, evicting the least recently used values
+        until the cache fits into its size. Values larger than the whole
+        cache are not cached.
+
+        Keyword arguments:
+        version -- The version of the cache at which the value was read. If
+                   the cache has been invalidated since, the value is not
+                   cached. (default: always cache the value)
+        """
+        if version is not None and version != self.version:
+            return
+        self._remove(key)
+        size = len(key) + len(value)
+        if size > self.maxbytes:
+            return
+        self.entries[key] = value
+        self.bytes += size
+        while self.bytes > self.maxbytes:
+            oldkey, oldvalue = self.entries.popitem(last=False)
+            self.bytes -= len(oldkey) + len(oldvalue)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        """Remove the value for key, e.g. because the key was deleted"""
+        self.version += 1
+        self._remove(key)
+
+    def _remove(self, key):
+        # Remove the value for key, if it is cached
+        value = self.entries.pop(key, None)
+        if value is not None:
+            self.bytes -= len(key) + len(value)
+
+    def stats(self):
+        """Return a dictionary with the size, hit/miss and eviction counts and
+        the hit ratio"""
+        lookups = self.hits + self.misses
+        return {"size": len(self.entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "ratio": float(self.hits) / lookups if lookups else 0.0}
+
+    def __len__(self):
+        return len(self.entries)
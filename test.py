@@ -10,9 +10,15 @@ from hashlib import sha256
 from os import urandom
 
 from messages.c2s_pb2 import ClientHello, ServerHello, Store, StoreReply, \
-    Delete, DeleteReply, Get, GetReply
+    Delete, DeleteReply, Get, GetReply, MultiStore, MultiGet, MultiDelete
 from messages.metaMessage_pb2 import Wrapper
+from messages.studyMessage_pb2 import StudyWrapper, StudyCreate, \
+    StudyCreateReply, StudyJoinQuery, StudyJoinQueryReply, StudyDelete, \
+    StudyDeleteReply, StudyListQuery
 from vicbf.vicbf import deserialize
+from Crypto.PublicKey import RSA
+from Crypto.Hash import SHA256
+from Crypto.Signature import PKCS1_v1_5
 
 # This file contains test cases for the server application.
 # It assumes the server is already running on the standard port of 5566, with
@@ -106,6 +112,37 @@ def getDeleteMessage(key, auth):
     return wrapper
 
 
+def getMultiStoreMessage(pairs):
+    ms = MultiStore()
+    for key, value in pairs:
+        st = ms.store.add()
+        st.key = key
+        st.value = value
+    wrapper = Wrapper()
+    wrapper.MultiStore.MergeFrom(ms)
+    return wrapper
+
+
+def getMultiGetMessage(keys):
+    mg = MultiGet()
+    for key in keys:
+        mg.get.add().key = key
+    wrapper = Wrapper()
+    wrapper.MultiGet.MergeFrom(mg)
+    return wrapper
+
+
+def getMultiDeleteMessage(pairs):
+    md = MultiDelete()
+    for key, auth in pairs:
+        dl = md.delete.add()
+        dl.key = key
+        dl.auth = auth
+    wrapper = Wrapper()
+    wrapper.MultiDelete.MergeFrom(md)
+    return wrapper
+
+
 def getKVPair():
     nonce = urandom(8)
     value = urandom(16).encode('hex')
@@ -114,6 +151,81 @@ def getKVPair():
     return key, auth, value
 
 
+def getStudyKey():
+    # Generating RSA keys is slow, so all study tests share one key
+    global STUDY_KEY
+    if STUDY_KEY is None:
+        STUDY_KEY = RSA.generate(1024)
+    return STUDY_KEY
+
+STUDY_KEY = None
+
+
+def getStudyIdent():
+    return urandom(8).encode('hex')
+
+
+def getStudyWrapper(mtype, message, key):
+    sw = StudyWrapper()
+    sw.type = mtype
+    sw.message = message.SerializeToString()
+    sw.signature = PKCS1_v1_5.new(key).sign(SHA256.new(sw.message))
+    wrapper = Wrapper()
+    wrapper.StudyWrapper.MergeFrom(sw)
+    return wrapper
+
+
+def getStudyCreateMessage(ident, key, datatype=StudyCreate.DATA_STEP_COUNT):
+    sc = StudyCreate()
+    for field in ("study_name", "institution", "webpage", "description",
+                  "purpose", "procedures", "risks", "benefits", "payment",
+                  "conflicts", "confidentiality",
+                  "participationAndWithdrawal", "rights"):
+        setattr(sc, field, "Test " + field)
+    dr = sc.dataRequest.add()
+    dr.datatype = datatype
+    dr.granularity = StudyCreate.GRAN_COARSE
+    dr.frequency = 24
+    sc.publicKey = key.publickey().exportKey("DER")
+    sc.publicKeyAlgo = StudyCreate.PK_RSA
+    sc.verificationStrategy = StudyCreate.VF_META
+    sc.kexData = urandom(32)
+    sc.kexAlgorithm = StudyCreate.KEX_ECDH_CURVE25519
+    sc.queueIdentifier = ident
+    return getStudyWrapper(StudyWrapper.MSG_STUDYCREATE, sc, key)
+
+
+def getStudyJoinQueryMessage(ident, key, pageSize=None, cursor=None):
+    sq = StudyJoinQuery()
+    sq.queueIdentifier = ident
+    if pageSize is not None:
+        sq.pageSize = pageSize
+    if cursor is not None:
+        sq.cursor = cursor
+    return getStudyWrapper(StudyWrapper.MSG_STUDYJOINQUERY, sq, key)
+
+
+def getStudyDeleteMessage(ident, key):
+    sd = StudyDelete()
+    sd.queueIdentifier = ident
+    return getStudyWrapper(StudyWrapper.MSG_STUDYDELETE, sd, key)
+
+
+def getStudyListQueryMessage(**kwargs):
+    wrapper = Wrapper()
+    wrapper.StudyListQuery.MergeFrom(StudyListQuery(**kwargs))
+    return wrapper
+
+
+def getStudyListIdents(reply):
+    idents = []
+    for wrapper in reply.StudyListReply.studylist:
+        sc = StudyCreate()
+        sc.ParseFromString(wrapper.message)
+        idents.append(sc.queueIdentifier)
+    return idents
+
+
 def parseVICBF(serialized):
     decomp = zlib.decompress(serialized)
     bs = ConstBitStream(bytes=decomp)
@@ -160,6 +272,19 @@ def store(key, value, sock):
     assertStoreState(reply, key)
 
 
+def createStudy(ident, key, sock, datatype=StudyCreate.DATA_STEP_COUNT):
+    reply = transceive(getStudyCreateMessage(ident, key, datatype), sock)
+    assert reply.WhichOneof('message') == 'StudyCreateReply'
+    assert reply.StudyCreateReply.status == StudyCreateReply.CREATE_OK
+    assert reply.StudyCreateReply.queueIdentifier == ident
+
+
+def deleteStudy(ident, key, sock):
+    reply = transceive(getStudyDeleteMessage(ident, key), sock)
+    assert reply.WhichOneof('message') == 'StudyDeleteReply'
+    assert reply.StudyDeleteReply.status == StudyDeleteReply.DELETE_OK
+
+
 def getVICBF(sock):
     msg = getClientHelloMessage()
     reply = transceive(msg, sock)
@@ -320,6 +445,24 @@ def test_Get():
     sock.close()
 
 
+def test_Get_repeated():
+    # Test if repeated Gets return the current value, also after the key has
+    # been deleted and stored again
+    sock = getSocket()
+    key, auth, value = getKVPair()
+    store(key, value, sock)
+    for i in range(3):
+        assertGetState(transceive(getGetMessage(key), sock), key, value=value)
+    delete(key, auth, sock)
+    assertGetState(transceive(getGetMessage(key), sock), key,
+                   opcode=GetReply.GET_FAIL_UNKNOWN_KEY)
+    store(key, "other value", sock)
+    assertGetState(transceive(getGetMessage(key), sock), key,
+                   value="other value")
+    delete(key, auth, sock)
+    sock.close()
+
+
 def test_Get_bad_key():
     # Test if the server refuses to Get an invalid key
     sock = getSocket()
@@ -337,3 +480,337 @@ def test_Get_nonexistant_key():
     reply = transceive(msg, sock)
     assertGetState(reply, key, opcode=GetReply.GET_FAIL_UNKNOWN_KEY)
     sock.close()
+
+
+def test_Get_deleted_key():
+    # Test if a deleted key can no longer be retrieved
+    sock = getSocket()
+    key, auth, value = getKVPair()
+    store(key, value, sock)
+    delete(key, auth, sock)
+    reply = transceive(getGetMessage(key), sock)
+    assertGetState(reply, key, opcode=GetReply.GET_FAIL_UNKNOWN_KEY)
+    sock.close()
+
+
+def test_Multi_Store_Get_and_Delete():
+    # Test if batches are answered with one reply per item, in order
+    sock = getSocket()
+    pairs = [getKVPair() for i in range(3)]
+    msg = getMultiStoreMessage([(key, value) for key, auth, value in pairs])
+    reply = transceive(msg, sock)
+    assert reply.WhichOneof('message') == 'MultiStoreReply', \
+        "Message is no MultiStoreReply"
+    assert [rv.key for rv in reply.MultiStoreReply.reply] == \
+        [key for key, auth, value in pairs], "Keys do not match"
+    assert [rv.opcode for rv in reply.MultiStoreReply.reply] == \
+        [StoreReply.STORE_OK] * 3, "Incorrect opcodes"
+    unknown = getKVPair()
+    msg = getMultiGetMessage([key for key, auth, value in pairs] +
+                             [unknown[0], "x" * 64])
+    reply = transceive(msg, sock)
+    assert reply.WhichOneof('message') == 'MultiGetReply', \
+        "Message is no MultiGetReply"
+    assert [(rv.opcode, rv.value) for rv in reply.MultiGetReply.reply] == \
+        [(GetReply.GET_OK, value) for key, auth, value in pairs] + \
+        [(GetReply.GET_FAIL_UNKNOWN_KEY, ""),
+         (GetReply.GET_FAIL_KEY_FMT, "")], "Incorrect replies"
+    msg = getMultiDeleteMessage([(pairs[0][0], "bad auth")] +
+                                [(key, auth) for key, auth, value in pairs] +
+                                [(unknown[0], unknown[1])])
+    reply = transceive(msg, sock)
+    assert reply.WhichOneof('message') == 'MultiDeleteReply', \
+        "Message is no MultiDeleteReply"
+    assert [rv.opcode for rv in reply.MultiDeleteReply.reply] == \
+        [DeleteReply.DELETE_FAIL_AUTH] + [DeleteReply.DELETE_OK] * 3 + \
+        [DeleteReply.DELETE_FAIL_NOT_FOUND], "Incorrect opcodes"
+    for key, auth, value in pairs:
+        assertGetState(transceive(getGetMessage(key), sock), key,
+                       opcode=GetReply.GET_FAIL_UNKNOWN_KEY)
+    sock.close()
+
+
+def test_MultiStore_partial_failure():
+    # Test if taken and invalid keys in a batch do not affect the other items
+    sock = getSocket()
+    taken, auth, value = getKVPair()
+    store(taken, value, sock)
+    key, auth2, value2 = getKVPair()
+    msg = getMultiStoreMessage([(taken, "other value"), ("x" * 64, value),
+                                (key, value2)])
+    reply = transceive(msg, sock)
+    assert [rv.opcode for rv in reply.MultiStoreReply.reply] == \
+        [StoreReply.STORE_FAIL_KEY_TAKEN, StoreReply.STORE_FAIL_KEY_FMT,
+         StoreReply.STORE_OK], "Incorrect opcodes"
+    assertGetState(transceive(getGetMessage(taken), sock), taken, value=value)
+    assertGetState(transceive(getGetMessage(key), sock), key, value=value2)
+    delete(taken, auth, sock)
+    delete(key, auth2, sock)
+    sock.close()
+
+
+def test_MultiStore_study_joins():
+    # Test if StudyJoins in a batch are queued along with the pairs
+    sock = getSocket()
+    ident = getStudyIdent()
+    createStudy(ident, getStudyKey(), sock)
+    key, auth, value = getKVPair()
+    joins = [urandom(64) for i in range(3)]
+    msg = getMultiStoreMessage([(ident, joins[0]), (key, value),
+                                (getStudyIdent(), joins[1]),
+                                (ident, joins[2])])
+    reply = transceive(msg, sock)
+    assert [rv.opcode for rv in reply.MultiStoreReply.reply] == \
+        [StoreReply.STORE_OK, StoreReply.STORE_OK,
+         StoreReply.STORE_FAIL_KEY_FMT, StoreReply.STORE_OK], \
+        "Incorrect opcodes"
+    reply = transceive(getStudyJoinQueryMessage(ident, getStudyKey()), sock)
+    assert list(reply.StudyJoinQueryReply.message) == [joins[0], joins[2]]
+    delete(key, auth, sock)
+    deleteStudy(ident, getStudyKey(), sock)
+    sock.close()
+
+
+def test_StudyCreate_and_Delete():
+    # Test if a study can be created and deleted again
+    sock = getSocket()
+    ident = getStudyIdent()
+    createStudy(ident, getStudyKey(), sock)
+    deleteStudy(ident, getStudyKey(), sock)
+    sock.close()
+
+
+def test_StudyCreate_bad_signature():
+    # Test if the server rejects a StudyCreate with a bad signature
+    sock = getSocket()
+    msg = getStudyCreateMessage(getStudyIdent(), getStudyKey())
+    msg.StudyWrapper.signature = urandom(128)
+    reply = transceive(msg, sock)
+    assert reply.StudyCreateReply.status == \
+        StudyCreateReply.CREATE_FAIL_SIGNATURE
+    sock.close()
+
+
+def test_StudyCreate_duplicate_identifier():
+    # Test if the server refuses to reuse a queue identifier
+    sock = getSocket()
+    ident = getStudyIdent()
+    createStudy(ident, getStudyKey(), sock)
+    reply = transceive(getStudyCreateMessage(ident, getStudyKey()), sock)
+    assert reply.StudyCreateReply.status == \
+        StudyCreateReply.CREATE_FAIL_IDENTIFIER_TAKEN
+    deleteStudy(ident, getStudyKey(), sock)
+    sock.close()
+
+
+def test_StudyList():
+    # Test if a created study shows up in the study list, and disappears
+    # once it is deleted
+    sock = getSocket()
+    ident = getStudyIdent()
+    reply = transceive(getStudyListQueryMessage(), sock)
+    assert ident not in getStudyListIdents(reply)
+    createStudy(ident, getStudyKey(), sock)
+    reply = transceive(getStudyListQueryMessage(), sock)
+    assert reply.WhichOneof('message') == 'StudyListReply'
+    assert ident in getStudyListIdents(reply)
+    deleteStudy(ident, getStudyKey(), sock)
+    reply = transceive(getStudyListQueryMessage(), sock)
+    assert ident not in getStudyListIdents(reply)
+    sock.close()
+
+
+def test_StudyList_pages():
+    # Test if the study list can be fetched in pages
+    sock = getSocket()
+    created = [getStudyIdent() for i in range(3)]
+    for ident in created:
+        createStudy(ident, getStudyKey(), sock)
+    idents = []
+    reply = transceive(getStudyListQueryMessage(pageSize=1), sock)
+    while True:
+        assert len(reply.StudyListReply.studylist) <= 1
+        idents += getStudyListIdents(reply)
+        if not reply.StudyListReply.more:
+            break
+        reply = transceive(getStudyListQueryMessage(
+            pageSize=1, cursor=reply.StudyListReply.cursor), sock)
+    assert [ident for ident in idents if ident in created] == created
+    for ident in created:
+        deleteStudy(ident, getStudyKey(), sock)
+    sock.close()
+
+
+def test_StudyList_page_size_zero():
+    # Test if a page size of 0 still makes progress through the list
+    sock = getSocket()
+    ident = getStudyIdent()
+    createStudy(ident, getStudyKey(), sock)
+    reply = transceive(getStudyListQueryMessage(pageSize=0), sock)
+    assert len(reply.StudyListReply.studylist) == 1
+    deleteStudy(ident, getStudyKey(), sock)
+    sock.close()
+
+
+def test_StudyList_huge_cursor():
+    # Test if a cursor beyond the range of SQLite integers returns an empty
+    # last page instead of failing
+    sock = getSocket()
+    reply = transceive(getStudyListQueryMessage(pageSize=1,
+                                                cursor=2 ** 64 - 1), sock)
+    assert len(reply.StudyListReply.studylist) == 0
+    assert not reply.StudyListReply.more
+    sock.close()
+
+
+def test_StudyList_filter():
+    # Test if the study list can be filtered by the requested data
+    sock = getSocket()
+    steps = getStudyIdent()
+    gps = getStudyIdent()
+    createStudy(steps, getStudyKey(), sock)
+    createStudy(gps, getStudyKey(), sock, StudyCreate.DATA_GPS_TRACK)
+    reply = transceive(getStudyListQueryMessage(
+        datatype=StudyCreate.DATA_GPS_TRACK), sock)
+    idents = getStudyListIdents(reply)
+    assert gps in idents and steps not in idents
+    reply = transceive(getStudyListQueryMessage(
+        datatype=StudyCreate.DATA_GPS_TRACK,
+        granularity=StudyCreate.GRAN_FINE), sock)
+    assert gps not in getStudyListIdents(reply)
+    reply = transceive(getStudyListQueryMessage(
+        granularity=StudyCreate.GRAN_COARSE), sock)
+    idents = getStudyListIdents(reply)
+    assert gps in idents and steps in idents
+    deleteStudy(steps, getStudyKey(), sock)
+    deleteStudy(gps, getStudyKey(), sock)
+    sock.close()
+
+
+def test_StudyJoinQuery():
+    # Test if join messages stored in a study queue are returned exactly once
+    sock = getSocket()
+    ident = getStudyIdent()
+    createStudy(ident, getStudyKey(), sock)
+    joins = [urandom(64) for i in range(3)]
+    for join in joins:
+        store(ident, join, sock)
+    reply = transceive(getStudyJoinQueryMessage(ident, getStudyKey()), sock)
+    assert reply.StudyJoinQueryReply.status == StudyJoinQueryReply.STATUS_OK
+    assert list(reply.StudyJoinQueryReply.message) == joins
+    reply = transceive(getStudyJoinQueryMessage(ident, getStudyKey()), sock)
+    assert reply.StudyJoinQueryReply.status == StudyJoinQueryReply.STATUS_OK
+    assert len(reply.StudyJoinQueryReply.message) == 0
+    deleteStudy(ident, getStudyKey(), sock)
+    sock.close()
+
+
+def test_StudyJoinQuery_pages():
+    # Test if join messages can be fetched in pages, and are only removed
+    # once the client has acknowledged them with the cursor
+    sock = getSocket()
+    ident = getStudyIdent()
+    createStudy(ident, getStudyKey(), sock)
+    joins = [urandom(64) for i in range(5)]
+    for join in joins:
+        store(ident, join, sock)
+    reply = transceive(getStudyJoinQueryMessage(ident, getStudyKey(), 2),
+                       sock).StudyJoinQueryReply
+    assert reply.status == StudyJoinQueryReply.STATUS_OK
+    assert list(reply.message) == joins[:2]
+    assert reply.more
+    # Without the cursor, the same page is returned again
+    again = transceive(getStudyJoinQueryMessage(ident, getStudyKey(), 2),
+                       sock).StudyJoinQueryReply
+    assert list(again.message) == joins[:2]
+    assert again.cursor == reply.cursor
+    received = list(reply.message)
+    while reply.more:
+        reply = transceive(getStudyJoinQueryMessage(
+            ident, getStudyKey(), 2, reply.cursor), sock).StudyJoinQueryReply
+        assert reply.status == StudyJoinQueryReply.STATUS_OK
+        assert 0 < len(reply.message) <= 2
+        received += list(reply.message)
+    assert received == joins
+    # A page size of 0 only acknowledges the received messages
+    reply = transceive(getStudyJoinQueryMessage(
+        ident, getStudyKey(), 0, reply.cursor), sock).StudyJoinQueryReply
+    assert len(reply.message) == 0 and not reply.more
+    reply = transceive(getStudyJoinQueryMessage(ident, getStudyKey()),
+                       sock).StudyJoinQueryReply
+    assert len(reply.message) == 0
+    deleteStudy(ident, getStudyKey(), sock)
+    sock.close()
+
+
+def test_StudyJoinQuery_huge_cursor():
+    # Test if a cursor beyond the range of SQLite integers acknowledges all
+    # messages instead of failing
+    sock = getSocket()
+    ident = getStudyIdent()
+    createStudy(ident, getStudyKey(), sock)
+    store(ident, urandom(64), sock)
+    reply = transceive(getStudyJoinQueryMessage(
+        ident, getStudyKey(), 2, 2 ** 64 - 1), sock).StudyJoinQueryReply
+    assert reply.status == StudyJoinQueryReply.STATUS_OK
+    assert len(reply.message) == 0 and not reply.more
+    deleteStudy(ident, getStudyKey(), sock)
+    sock.close()
+
+
+def test_StudyJoinQuery_page_size_is_capped():
+    # Test if the server does not return more messages than its page size,
+    # even to clients that do not ask for pages
+    sock = getSocket()
+    ident = getStudyIdent()
+    createStudy(ident, getStudyKey(), sock)
+    for i in range(105):
+        store(ident, urandom(16), sock)
+    reply = transceive(getStudyJoinQueryMessage(ident, getStudyKey(), 1000),
+                       sock).StudyJoinQueryReply
+    assert len(reply.message) == 100
+    assert reply.more
+    reply = transceive(getStudyJoinQueryMessage(ident, getStudyKey()),
+                       sock).StudyJoinQueryReply
+    assert len(reply.message) == 100
+    assert reply.more
+    reply = transceive(getStudyJoinQueryMessage(ident, getStudyKey()),
+                       sock).StudyJoinQueryReply
+    assert len(reply.message) == 5
+    assert not reply.more
+    deleteStudy(ident, getStudyKey(), sock)
+    sock.close()
+
+
+def test_StudyJoinQuery_bad_signature():
+    # Test if only the owner of a study can query its join queue
+    sock = getSocket()
+    ident = getStudyIdent()
+    createStudy(ident, getStudyKey(), sock)
+    reply = transceive(getStudyJoinQueryMessage(ident, RSA.generate(1024)),
+                       sock)
+    assert reply.StudyJoinQueryReply.status == \
+        StudyJoinQueryReply.STATUS_FAIL_SIGNATURE
+    deleteStudy(ident, getStudyKey(), sock)
+    sock.close()
+
+
+def test_StudyJoinQuery_unknown_study():
+    # Test how the server reacts to a query for a nonexistant study
+    sock = getSocket()
+    reply = transceive(getStudyJoinQueryMessage(getStudyIdent(), getStudyKey()),
+                       sock)
+    assert reply.StudyJoinQueryReply.status == \
+        StudyJoinQueryReply.STATUS_FAIL_NOT_FOUND
+    sock.close()
+
+
+def test_StudyDelete_bad_signature():
+    # Test if only the owner of a study can delete it
+    sock = getSocket()
+    ident = getStudyIdent()
+    createStudy(ident, getStudyKey(), sock)
+    reply = transceive(getStudyDeleteMessage(ident, RSA.generate(1024)), sock)
+    assert reply.StudyDeleteReply.status == StudyDeleteReply.DELETE_FAIL_BAD_SIG
+    deleteStudy(ident, getStudyKey(), sock)
+    sock.close()
@@ -0,0 +1,75 @@
+# -*- encoding: utf-8 -*-
+"""A bounded LRU cache of parsed study public keys.
+
+Researchers poll the join queues of their studies frequently, and every poll
+is signed with the key of the study. Caching the parsed key (as a ready-made
+verifier object) by queue identifier saves both the database lookup and the
+ASN.1 parsing of the key on every poll.
+
+Keys may be read from the database while their study is deleted or created
+again. To keep a key read before such a change from being cached after it,
+readers take the version of the cache before reading and pass it to put().
+The version changes on every invalidation, and keys read at an older version
+are not cached.
+"""
+from collections import OrderedDict
+
+
+class KeyCache():
+    """LRU cache mapping queue identifiers to signature verifiers"""
+
+    def __init__(self, maxsize=1024):
+        """Initialize the cache.
+
+        Keyword arguments:
+        maxsize -- Maximum number of keys to keep (default: 1024)
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be >=1")
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Incremented by every invalidation
+        self.version = 0
+
+    def get(self, ident):
+        """Return the verifier cached for ident, or None on a cache miss"""
+        try:
+            verifier = self.entries.pop(ident)
+        except KeyError:
+            self.misses += 1
+            return None
+        # Re-insert to mark the entry as most recently used
+        self.entries[ident] = verifier
+        self.hits += 1
+        return verifier
+
+    def put(self, ident, verifier, version=None):
+        """Cache the verifier for ident, evicting the least recently used
+
+        Keyword arguments:
+        version -- The version of the cache at which the key was read. If the
+                   cache has been invalidated since, the verifier is not
+                   cached. (default: always cache the verifier)
+        """
+        if version is not None and version != self.version:
+            return
+        self.entries.pop(ident, None)
+        self.entries[ident] = verifier
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, ident):
+        """Remove the verifier for ident, e.g. because the study was deleted"""
+        self.version += 1
+        self.entries.pop(ident, None)
+
+    def stats(self):
+        """Return a dictionary with the size and hit/miss counts"""
+        return {"size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses}
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,140 @@
+# -*- encoding: utf-8 -*-
+"""RSA PKCS#1 v1.5 signature verification, optionally in a process pool.
+
+RSA operations in pycrypto are CPU-bound and hold the GIL, so verifying
+signatures on the main loop stalls every connected client. The
+SignatureVerifier hands them to a pool of processes instead and returns a
+Future, which is resolved on the main loop once the result is available.
+"""
+import os
+import signal
+from multiprocessing import Pool
+
+from Crypto.PublicKey import RSA
+from Crypto.Hash import SHA256
+from Crypto.Signature import PKCS1_v1_5
+
+from network.tasks import Future
+
+
+def pubkeyFromBytes(pkcs):
+    return RSA.importKey(pkcs)
+
+
+def loadVerifier(pkcs):
+    """Parse a serialized public key into a signature verifier object"""
+    return PKCS1_v1_5.new(pubkeyFromBytes(pkcs))
+
+
+def verifySignature(key, data, sig):
+    """Verify a PKCS#1 v1.5 signature with SHA-256 over data.
+
+    The key may either be given in its serialized form, or as a verifier
+    object returned by loadVerifier.
+    """
+    if isinstance(key, basestring):
+        key = loadVerifier(key)
+    try:
+        return key.verify(SHA256.new(data), sig)
+    except ValueError:
+        # Raised for signatures that are out of range for the key
+        return False
+
+
+def _poolVerify(key, data, sig):
+    # Runs inside the pool. Exceptions are returned instead of raised, as
+    # apply_async has no way to report them to a callback on Python 2.
+    try:
+        return True, verifySignature(key, data, sig)
+    except Exception, e:
+        return False, e
+
+
+def _poolLoad(pkcs):
+    # Runs inside the pool, see _poolVerify
+    try:
+        return True, loadVerifier(pkcs)
+    except Exception, e:
+        return False, e
+
+
+def _poolInit(closefds):
+    # Runs once in every pool process. Let the parent handle interrupts, and
+    # close descriptors we must not keep open on behalf of the parent.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for fd in closefds:
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+
+class SignatureVerifier():
+    """Verify signatures asynchronously in a pool of processes"""
+
+    def __init__(self, dispatcher, processes=2, closefds=()):
+        """Initialize the verifier.
+
+        Keyword arguments:
+        dispatcher -- Dispatcher used to resolve Futures on the main loop
+        processes  -- Number of verification processes. If 0, signatures are
+                      verified synchronously. (default: 2)
+        closefds   -- File descriptors the pool processes should close after
+                      starting (default: none)
+        """
+        self.dispatcher = dispatcher
+        self.pool = None
+        if processes > 0:
+            self.pool = Pool(processes, _poolInit, (list(closefds), ))
+
+    def verify(self, key, data, sig):
+        """Verify the signature sig over data with the public key key.
+
+        The key may be serialized or a verifier object, see verifySignature.
+        Passing a verifier saves parsing the key again.
+
+        Returns a Future that is resolved with True or False, or with an
+        exception if the key could not be parsed.
+        """
+        if isinstance(key, buffer):
+            # Keys read from SQLite are buffer objects, which cannot be pickled
+            key = str(key)
+        return self._submit(_poolVerify, key, data, sig)
+
+    def load(self, pkcs):
+        """Parse a serialized public key into a verifier object, see
+        loadVerifier.
+
+        Returns a Future that is resolved with the verifier, or with an
+        exception if the key could not be parsed.
+        """
+        return self._submit(_poolLoad, str(pkcs))
+
+    def _submit(self, fn, *args):
+        # Call one of the _pool* functions in the pool, or synchronously
+        future = Future()
+
+        def done(rv):
+            # Called on a thread of the pool, hand result to the main loop
+            ok, value = rv
+            if ok:
+                self.dispatcher.call_soon_threadsafe(future.set_result, value)
+            else:
+                self.dispatcher.call_soon_threadsafe(future.set_exception,
+                                                     value)
+        if self.pool is None:
+            ok, value = fn(*args)
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+        else:
+            self.pool.apply_async(fn, args, callback=done)
+        return future
+
+    def close(self):
+        """Stop the verification processes"""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
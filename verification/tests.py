@@ -0,0 +1,94 @@
+"""Test cases for the signature verification helpers.
+
+These test cases are run with "nosetests".
+"""
+import pickle
+
+from Crypto.PublicKey import RSA
+from Crypto.Hash import SHA256
+from Crypto.Signature import PKCS1_v1_5
+
+from keycache import KeyCache
+from pkcs1 import SignatureVerifier, loadVerifier, verifySignature
+
+KEY = RSA.generate(1024)
+PUBKEY = KEY.publickey().exportKey("DER")
+
+
+def sign(data):
+    return PKCS1_v1_5.new(KEY).sign(SHA256.new(data))
+
+"""Verification tests"""
+
+
+def test_verify_serialized_key():
+    assert verifySignature(PUBKEY, "data", sign("data"))
+    assert not verifySignature(PUBKEY, "other data", sign("data"))
+
+
+def test_verify_parsed_key():
+    verifier = loadVerifier(PUBKEY)
+    assert verifySignature(verifier, "data", sign("data"))
+    assert not verifySignature(verifier, "other data", sign("data"))
+
+
+def test_verify_pickled_verifier():
+    # Verifiers are sent to the verification pool in pickled form
+    verifier = pickle.loads(pickle.dumps(loadVerifier(PUBKEY), 2))
+    assert verifySignature(verifier, "data", sign("data"))
+
+
+def test_verifier_load():
+    verifier = SignatureVerifier(None, processes=0)
+    loaded = verifier.load(buffer(PUBKEY)).result()
+    assert verifySignature(loaded, "data", sign("data"))
+    try:
+        verifier.load("garbage").result()
+        assert False, "Invalid key was parsed"
+    except (ValueError, IndexError, TypeError):
+        pass
+
+
+def test_verify_out_of_range_signature():
+    assert not verifySignature(PUBKEY, "data", "\xff" * 128)
+
+"""Key cache tests"""
+
+
+def test_keycache_hit_and_miss():
+    cache = KeyCache(4)
+    assert cache.get("a") is None
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+
+def test_keycache_evicts_least_recently_used():
+    cache = KeyCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_keycache_invalidate():
+    cache = KeyCache(2)
+    cache.put("a", 1)
+    cache.invalidate("a")
+    cache.invalidate("unknown")
+    assert cache.get("a") is None
+
+
+def test_keycache_version():
+    cache = KeyCache(2)
+    version = cache.version
+    cache.invalidate("a")
+    # The key may have been read before the study was deleted
+    cache.put("a", "old", version)
+    assert cache.get("a") is None
+    cache.put("a", "new", cache.version)
+    assert cache.get("a") == "new"